@@ -1,14 +1,24 @@
 # admin_commands.py
+import asyncio
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import ADMIN_IDS
-from database_manager import DatabaseManager
+from config import ADMIN_IDS, BACKUP_DIR
+from database_manager import get_db_manager
+from async_database_manager import async_db
 from instagram_parser import InstagramParser
+from parse_queue import parse_queue, ParseQueueFull
+from place_cache import result_cache, get_org_id
+from yandex_parser import parse_yandex, inflight_parses, fast_path_breaker, get_hedge_stats
+from webdriver_pool import driver_pool
+from page_archive import page_archive, reextract_archive
+from metrics import metrics
+from excel_sync import excel_sync
+from read_cache import read_cache
+from opening_hours import opening_index
+from place_export import EXPORT_FORMATS, export_places, write_export_files
 from logger import log_admin_action, setup_logger
-import pandas as pd
 
 logger = setup_logger()
-db_manager = DatabaseManager()
 instagram_parser = InstagramParser()
 
 def is_admin(user_id: int) -> bool:
@@ -25,38 +35,33 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_admin_action(user_id, "запросил статистику")
     
     try:
-        places_count = db_manager.get_places_count()
-        all_places = db_manager.get_all_places()
+        places_count = await async_db.get_places_count()
+        place_stats = await async_db.get_place_stats(top=5)
         
-        # Статистика по категориям
+        # Статистика по категориям (категории места считаются по отдельности)
         categories_stats = ""
-        categories = [place.get('Категории') for place in all_places if place.get('Категории')]
-        if categories:
-            from collections import Counter
-            category_counts = Counter(categories).most_common(5)
+        if place_stats.get('categories'):
             categories_stats = "\n📊 Топ категорий:\n"
-            for category, count in category_counts:
+            for category, count in place_stats['categories']:
                 categories_stats += f"  • {category}: {count}\n"
         
         # Статистика по рейтингам
         rating_stats = ""
-        ratings = [place.get('Рейтинг') for place in all_places if place.get('Рейтинг')]
-        if ratings:
-            try:
-                # Пытаемся извлечь числовые рейтинги
-                numeric_ratings = []
-                for rating in ratings:
-                    if isinstance(rating, str) and rating.replace('.', '').isdigit():
-                        numeric_ratings.append(float(rating))
-                
-                if numeric_ratings:
-                    avg_rating = sum(numeric_ratings) / len(numeric_ratings)
-                    rating_stats = f"\n⭐ Средний рейтинг: {avg_rating:.1f}"
-            except:
-                pass
+        if place_stats.get('avg_rating') is not None:
+            rating_stats = f"\n⭐ Средний рейтинг: {place_stats['avg_rating']:.1f} (мест с рейтингом: {place_stats['rated']})"
+            rating_stats += "\n📶 Распределение: " + ", ".join(
+                f"{bucket}: {count}" for bucket, count in place_stats['ratings'].items()
+            )
+        
+        # Открытые сейчас места (индекс интервалов часов работы в памяти)
+        if opening_index.loaded:
+            rating_stats += (
+                f"\n🕒 Открыто сейчас: {opening_index.count_open()} "
+                f"из {opening_index.get_stats()['places']} (с известными часами)"
+            )
         
         # Статистика по Instagram
-        instagram_stats = db_manager.get_instagram_stats()
+        instagram_stats = await async_db.get_instagram_stats()
         instagram_info = ""
         if instagram_stats:
             instagram_info = (
@@ -68,7 +73,7 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         
         # Статистика по последним местам
-        recent_places = db_manager.get_recent_places(5)
+        recent_places = await async_db.get_recent_places(5)
         recent_stats = ""
         if recent_places:
             recent_stats = "\n📅 Последние добавления:\n"
@@ -78,8 +83,13 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 recent_stats += f"  • {name}\n    {url}\n"
         
         # Информация о синхронизации
-        local_excel_exists = db_manager.local_excel_path.exists()
+        local_excel_exists = get_db_manager().local_excel_path.exists()
         sync_status = "✅ Синхронизирован" if local_excel_exists else "❌ Не синхронизирован"
+        sync_stats = excel_sync.get_stats()
+        if sync_stats['pending'] or sync_stats['full_pending']:
+            sync_status += f" (ожидают записи: {sync_stats['pending']} изменений)"
+        if sync_stats['last_error']:
+            sync_status += f"\n⚠️ Последняя ошибка синхронизации: {sync_stats['last_error']}"
         
         # Статистика чёрного списка Instagram
         blacklist_stats = instagram_parser.get_blacklist_stats()
@@ -90,17 +100,94 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"  • Пользовательских: {blacklist_stats.get('custom_count', 0)}"
         )
         
+        # Статистика очереди парсинга
+        queue_stats = parse_queue.get_stats()
+        queue_info = (
+            f"\n⏳ **Очередь парсинга:**\n"
+            f"  • Исполнителей: {queue_stats['workers']} ({queue_stats['mode']})\n"
+            f"  • В ожидании: {queue_stats['waiting']} / {queue_stats['max_size']}\n"
+            f"  • В работе: {queue_stats['running']}\n"
+            f"  • Обработано: {queue_stats['processed']}, ошибок: {queue_stats['failed']}, отклонено: {queue_stats['rejected']}\n"
+            f"  • Ожидание: среднее {queue_stats['avg_wait']} с, макс. {queue_stats['max_wait']} с\n"
+            f"  • Выполнение: среднее {queue_stats['avg_run']} с\n"
+        )
+        
+        # Статистика кэша результатов
+        cache_stats = result_cache.get_stats()
+        cache_info = (
+            f"\n⚡ **Кэш результатов:**\n"
+            f"  • Записей: {cache_stats['size']} / {cache_stats['max_size']}, TTL {cache_stats['ttl'] // 60} мин\n"
+            f"  • Попаданий: {cache_stats['hits'] + cache_stats['disk_hits']} ({cache_stats['hit_rate']}%), промахов: {cache_stats['misses']}\n"
+        )
+        inflight_stats = inflight_parses.get_stats()
+        cache_info += (
+            f"  • Объединено параллельных запросов: {inflight_stats['coalesced']} "
+            f"(сейчас в работе: {inflight_stats['in_flight']})\n"
+        )
+        read_stats = read_cache.get_stats()
+        cache_info += (
+            f"  • Кэш чтений (TTL {read_cache.ttl} с): попаданий {read_stats['hits']} ({read_stats['hit_rate']}%), "
+            f"промахов {read_stats['misses']}, сбросов {read_stats['invalidations']}\n"
+        )
+        
+        # Статистика пула браузеров
+        pool_stats = driver_pool.get_stats()
+        pool_info = (
+            f"\n🌐 **Пул браузеров:**\n"
+            f"  • Открыто: {pool_stats['total']} / {pool_stats['size']} (свободно {pool_stats['idle']})\n"
+            f"  • Запущено: {pool_stats['created']}, перезапусков: {pool_stats['recycled']}\n"
+            f"  • Выдач: {pool_stats['checkouts']}, среднее ожидание {pool_stats['avg_wait']} с\n"
+        )
+        
+        # Предохранитель быстрого метода
+        breaker_stats = fast_path_breaker.get_stats()
+        breaker_states = {'closed': '✅ включен', 'open': '🚧 отключен', 'half_open': '🔎 пробная попытка'}
+        breaker_info = (
+            f"\n🚦 **Быстрый метод:** {breaker_states[breaker_stats['state']]}"
+            + (f" (еще {breaker_stats['retry_in']} с)" if breaker_stats['state'] == 'open' else "")
+            + "\n"
+            f"  • Попыток: {breaker_stats['attempts']}, успешных {breaker_stats['ok_rate']}%, "
+            f"капч {breaker_stats['captcha_rate']}%, ошибок {breaker_stats['error_rate']}%\n"
+            f"  • Неудач в окне: {breaker_stats['window_failure_rate']}%, отключений: {breaker_stats['trips']}, "
+            f"ссылок сразу в Selenium: {breaker_stats['skipped']}\n"
+            f"  • p95 быстрого метода: {breaker_stats['p95'] if breaker_stats['p95'] is not None else '—'} с\n"
+        )
+        hedge_stats = get_hedge_stats()
+        if hedge_stats['started']:
+            breaker_info += (
+                f"  • Хеджирование: {hedge_stats['started']} запусков, "
+                f"requests первым {hedge_stats['fast_won']}, Selenium {hedge_stats['selenium_won']}, "
+                f"браузер отменен {hedge_stats['selenium_cancelled']}\n"
+            )
+        
+        # Статистика фонового обновления
+        refresh_info = ""
+        refresher = context.bot_data.get("refresher")
+        if refresher:
+            refresh_stats = refresher.get_stats()
+            refresh_info = (
+                f"\n🔁 **Фоновое обновление:** {'работает' if refresh_stats['running'] else 'остановлено'}\n"
+                f"  • Сегодня: {refresh_stats['used_today']} / {refresh_stats['daily_budget']}\n"
+                f"  • Обновлено: {refresh_stats['updated']}, без данных: {refresh_stats['empty']}, ошибок: {refresh_stats['failed']}\n"
+                f"  • Отслеживается записей: {refresh_stats['tracked']}\n"
+            )
+        
         stats_message = (
             f"📈 **Статистика бота**\n\n"
             f"📍 Всего мест: {places_count}\n"
             f"🗄 База данных: PostgreSQL\n"
             f"🌐 Сервер: 109.69.56.200:5432/places\n"
             f"📊 Локальный Excel: {sync_status}\n"
-            f"📁 Путь: `{db_manager.local_excel_path}`\n"
+            f"📁 Путь: `{get_db_manager().local_excel_path}`\n"
             f"{rating_stats}"
             f"{categories_stats}"
             f"{instagram_info}"
             f"{blacklist_info}"
+            f"{queue_info}"
+            f"{pool_info}"
+            f"{breaker_info}"
+            f"{cache_info}"
+            f"{refresh_info}"
             f"{recent_stats}"
         )
         
@@ -120,7 +207,7 @@ async def admin_instagram_search(update: Update, context: ContextTypes.DEFAULT_T
     
     try:
         # Получаем места без Instagram
-        places_without_instagram = db_manager.get_places_without_instagram(limit=10)
+        places_without_instagram = await async_db.get_places_without_instagram(limit=10)
         
         if not places_without_instagram:
             await update.message.reply_text("✅ Все места уже имеют Instagram!")
@@ -138,7 +225,7 @@ async def admin_instagram_search(update: Update, context: ContextTypes.DEFAULT_T
             # Обновляем базу данных
             updated_count = 0
             for place_name, instagram_url in results.items():
-                if db_manager.update_instagram_for_place(place_name, instagram_url):
+                if await async_db.update_instagram_for_place(place_name, instagram_url):
                     updated_count += 1
             
             await update.message.reply_text(
@@ -169,7 +256,7 @@ async def admin_instagram_stats(update: Update, context: ContextTypes.DEFAULT_TY
     log_admin_action(user_id, "запросил статистику Instagram")
     
     try:
-        instagram_stats = db_manager.get_instagram_stats()
+        instagram_stats = await async_db.get_instagram_stats()
         blacklist_stats = instagram_parser.get_blacklist_stats()
         
         if not instagram_stats:
@@ -206,14 +293,14 @@ async def admin_sync(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await update.message.reply_text("🔄 Начинаю синхронизацию с локальным Excel файлом...")
         
-        success = db_manager.force_sync_excel()
+        success = await asyncio.get_running_loop().run_in_executor(None, get_db_manager().force_sync_excel)
         
         if success:
-            places_count = db_manager.get_places_count()
+            places_count = await async_db.get_places_count()
             await update.message.reply_text(
                 f"✅ Синхронизация завершена!\n"
                 f"📊 Записей синхронизировано: {places_count}\n"
-                f"📁 Файл: `{db_manager.local_excel_path}`",
+                f"📁 Файл: `{get_db_manager().local_excel_path}`",
                 parse_mode='Markdown'
             )
         else:
@@ -223,43 +310,46 @@ async def admin_sync(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Ошибка при синхронизации: {e}")
 
 async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Экспортирует данные в CSV"""
+    """Экспортирует данные: /export [csv|jsonl|parquet] (parquet - при установленном pyarrow)"""
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("❌ У вас нет прав администратора")
         return
     
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in EXPORT_FORMATS:
+        note = " (для parquet на сервере нужен пакет pyarrow)" if fmt == "parquet" else ""
+        await update.message.reply_text(f"📝 Использование: /export [{'|'.join(EXPORT_FORMATS)}]{note}")
+        return
+    
     user_id = update.effective_user.id
-    log_admin_action(user_id, "запросил экспорт данных")
+    log_admin_action(user_id, f"запросил экспорт данных ({fmt})")
     
+    parts = []
     try:
-        all_places = db_manager.get_all_places()
-        if not all_places:
+        # Серверный курсор и сжатие - в потоке, event loop не блокируется
+        parts = await asyncio.get_running_loop().run_in_executor(None, export_places, get_db_manager().engine, fmt)
+        if not parts:
             await update.message.reply_text("📭 База данных пуста")
             return
         
-        # Создаем DataFrame
-        df = pd.DataFrame(all_places)
-        
-        # Создаем временный CSV файл
-        csv_path = db_manager.excel_path.parent / "places_export.csv"
-        df.to_csv(csv_path, index=False, encoding='utf-8')
-        
-        # Отправляем файл
-        with open(csv_path, 'rb') as file:
+        for number, part in enumerate(parts, 1):
+            caption = "📊 Экспорт данных из PostgreSQL"
+            if len(parts) > 1:
+                caption += f" (часть {number}/{len(parts)})"
             await update.message.reply_document(
-                document=file,
-                filename="places_export.csv",
-                caption="📊 Экспорт данных из PostgreSQL"
+                document=part.buffer,
+                filename=part.filename,
+                caption=f"{caption}\n📍 Записей: {part.rows}"
             )
         
-        # Удаляем временный файл
-        csv_path.unlink()
-        
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка при экспорте: {e}")
+    finally:
+        for part in parts:
+            part.close()
 
 async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Создает резервную копию базы данных"""
+    """Создает резервную копию базы данных (gzip CSV в BACKUP_DIR)"""
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("❌ У вас нет прав администратора")
         return
@@ -272,17 +362,17 @@ async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Создаем имя для бэкапа
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = db_manager.excel_path.parent / f"places_backup_{timestamp}.xlsx"
+        backup_dir = BACKUP_DIR / "csv"
         
-        # Получаем все данные
-        all_places = db_manager.get_all_places()
-        if all_places:
-            df = pd.DataFrame(all_places)
-            df.to_excel(backup_path, index=False)
-            
+        # Пишем потоково: одна часть под лимит, без загрузки таблицы в память
+        files = await asyncio.get_running_loop().run_in_executor(
+            None, write_export_files, get_db_manager().engine, backup_dir, f"places_backup_{timestamp}"
+        )
+        if files:
             await update.message.reply_text(
-                f"✅ Резервная копия создана:\n`{backup_path.name}`\n"
-                f"📊 Записей: {len(all_places)}",
+                f"✅ Резервная копия создана:\n" +
+                "\n".join(f"`{path.name}`" for path, _ in files) +
+                f"\n📊 Записей: {sum(rows for _, rows in files)}",
                 parse_mode='Markdown'
             )
         else:
@@ -291,6 +381,107 @@ async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка при создании бэкапа: {e}")
 
+async def admin_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Принудительно перепарсивает место в обход кэша"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав администратора")
+        return
+    
+    if not context.args:
+        await update.message.reply_text("📝 Использование: /refresh <ссылка на Яндекс.Карты>")
+        return
+    
+    url = context.args[0]
+    user_id = update.effective_user.id
+    log_admin_action(user_id, f"запросил обновление без кэша: {url}")
+    
+    if not get_org_id(url):
+        await update.message.reply_text("❌ Не удалось определить ID организации в ссылке")
+        return
+    
+    try:
+        try:
+            job = parse_queue.submit(parse_yandex, url, True)
+        except ParseQueueFull:
+            await update.message.reply_text("⏳ Очередь парсинга переполнена, попробуйте позже")
+            return
+        
+        await update.message.reply_text(f"🔄 Обновляю без кэша (позиция в очереди: {job.position})...")
+        data = await job.result()
+        success, message = await async_db.update_place_data(url, data)
+        
+        if success:
+            await update.message.reply_text(
+                f"✅ {data.get('title')}\n"
+                f"⭐ {data.get('rating')} | 💬 {data.get('reviews')}\n"
+                f"{message}"
+            )
+        else:
+            await update.message.reply_text(message)
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка при обновлении: {e}")
+
+async def admin_reextract(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Заново извлекает данные из архива страниц без сетевых запросов"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав администратора")
+        return
+    
+    user_id = update.effective_user.id
+    log_admin_action(user_id, "запустил повторное извлечение из архива")
+    
+    if not page_archive:
+        await update.message.reply_text("❌ Архив страниц отключен (PAGE_ARCHIVE_ENABLED)")
+        return
+    
+    try:
+        archive_stats = page_archive.get_stats()
+        await update.message.reply_text(
+            f"♻️ Извлекаю данные из архива: {archive_stats['links']} ссылок, "
+            f"{archive_stats['objects']} страниц ({archive_stats['size_mb']} МБ)..."
+        )
+        
+        # Процессы извлечения свои - слот очереди парсинга не занимаем
+        stats = await asyncio.get_running_loop().run_in_executor(None, reextract_archive, get_db_manager())
+        
+        await update.message.reply_text(
+            f"✅ Повторное извлечение завершено за {stats['seconds']} с\n"
+            f"📄 Страниц: {stats['pages']}, извлечено: {stats['extracted']}, пропущено: {stats['skipped']}\n"
+            f"💾 Обновлено: {stats['updated']}, добавлено: {stats['inserted']}"
+        )
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка повторного извлечения: {e}")
+
+async def admin_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает время этапов обработки (p50/p95/p99, ошибки)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав администратора")
+        return
+    
+    user_id = update.effective_user.id
+    log_admin_action(user_id, "запросил метрики")
+    
+    stages = metrics.get_stats()
+    if not stages:
+        await update.message.reply_text("📭 Метрик пока нет: не было ни одного запроса")
+        return
+    
+    lines = ["этап               кол-во ошиб%    p50    p95    p99"]
+    for name, stats in stages.items():
+        lines.append(
+            f"{name[:18]:<18} {stats['count']:>6} {stats['error_rate']:>5} "
+            f"{stats['p50']:>6.2f} {stats['p95']:>6.2f} {stats['p99']:>6.2f}"
+        )
+    
+    await update.message.reply_text(
+        "⏱ Время этапов, сек\n"
+        f"<pre>{chr(10).join(lines)}</pre>\n"
+        f"🐢 Медленных запросов: {metrics.slow_traces}",
+        parse_mode='HTML'
+    )
+
 async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает справку по административным командам"""
     if not is_admin(update.effective_user.id):
@@ -301,8 +492,11 @@ async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🔧 **Административные команды**\n\n"
         "/stats - Показать статистику бота и базы данных\n"
         "/sync - Принудительная синхронизация с локальным Excel\n"
-        "/export - Экспортировать данные в CSV\n"
+        f"/export {'|'.join(EXPORT_FORMATS)} - Экспортировать данные (по умолчанию gzip CSV)\n"
         "/backup - Создать резервную копию\n"
+        "/refresh <ссылка> - Перепарсить место в обход кэша\n"
+        "/reextract - Заново извлечь данные из архива страниц\n"
+        "/metrics - Время этапов обработки (p50/p95/p99)\n"
         "/help - Показать эту справку\n\n"
         "📸 **Instagram команды**\n"
         "/instagram_search - Поиск Instagram для мест без Instagram\n"
@@ -311,7 +505,10 @@ async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/start - Запустить бота\n"
         "/status - Статус бота\n"
         "/recent - Последние добавленные места\n"
-        "Отправьте ссылку на Яндекс.Карты для парсинга\n\n"
+        "/near <радиус, м> [открыто] - Ближайшие места, по желанию только открытые сейчас (или отправьте геопозицию)\n"
+        "/find <название> - Поиск мест по названию или категории\n"
+        "Отправьте ссылку на Яндекс.Карты для парсинга\n"
+        "Несколько ссылок или файл .txt/.csv/.xlsx - пакетная загрузка\n\n"
         "🗄 **Интеграция с EatSpot_Bot_git**\n"
         "Данные автоматически сохраняются в PostgreSQL\n"
         "и синхронизируются с локальным Excel файлом"
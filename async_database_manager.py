@@ -0,0 +1,231 @@
+# async_database_manager.py
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from config import (
+    POSTGRES_ASYNC_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_STATEMENT_TIMEOUT_MS, DB_PREPARED_STATEMENT_CACHE_SIZE, EXCEL_SYNC_MAX_DELAY
+)
+from database_manager import UPSERT_PLACE_SQL, PLACE_STATS_SQL, place_params, build_place_stats
+from excel_sync import excel_sync
+from logger import log_excel_update
+from metrics import metrics
+from read_cache import read_cache
+from spatial_index import spatial_index
+from search_index import search_index
+from opening_hours import opening_index
+from write_journal import write_journal
+
+logger = logging.getLogger('ParserBot')
+
+
+def create_engine_for_bot(url: str = POSTGRES_ASYNC_URL) -> AsyncEngine:
+    """
+    Асинхронный движок asyncpg: фиксированный пул с проверкой соединений
+    перед выдачей, таймаут запросов на стороне сервера и кэш
+    подготовленных запросов на каждое соединение.
+    """
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+            "command_timeout": DB_STATEMENT_TIMEOUT_MS / 1000 + 5,
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+
+def _update_indexes(url: str, data: Dict):
+    """Обновляет индексы мест в памяти после записи"""
+    spatial_index.upsert(url, data)
+    search_index.upsert(url, data)
+    opening_index.upsert(url, data)
+
+
+class AsyncDatabaseManager:
+    """
+    Асинхронный вариант DatabaseManager для обработчиков бота: запросы не
+    блокируют event loop. Схему, журнал и синхронизацию Excel использует
+    общие с синхронным менеджером (он остается для скриптов и фоновых потоков).
+    """
+
+    def __init__(self):
+        # Соединения открываются лениво в event loop бота
+        self.engine = create_engine_for_bot()
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        await self.engine.dispose()
+
+    async def _fetch_all(self, sql: str, params: Optional[Dict] = None) -> List[Dict]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(sql), params or {})
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    async def _scalar(self, sql: str, params: Optional[Dict] = None):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(sql), params or {})
+            return result.scalar()
+
+    # ===== Запись =====
+
+    async def update_place_data(self, url: str, data: Dict) -> Tuple[bool, str]:
+        """
+        Обновляет данные места в PostgreSQL
+        Возвращает (успех, сообщение)
+        """
+        # Сначала журнал: при недоступной базе запись можно будет проиграть позже
+        write_journal.append_places([(url, data)])
+
+        try:
+            with metrics.span("db_upsert"):
+                async with self.engine.begin() as conn:
+                    inserted = (await conn.execute(UPSERT_PLACE_SQL, place_params(url, data))).scalar()
+            read_cache.invalidate()
+            # Индексы обновляются под своими блокировками - не в event loop
+            await asyncio.get_running_loop().run_in_executor(None, _update_indexes, url, data)
+
+            if inserted:
+                action = "добавлена"
+                log_excel_update(url, "создание новой записи в PostgreSQL")
+            else:
+                action = "обновлена"
+                log_excel_update(url, "обновление существующей записи в PostgreSQL")
+
+            excel_sync.mark_changed([url])
+
+            return True, f"✅ Запись {action} в PostgreSQL базу данных, локальный Excel обновится в течение {EXCEL_SYNC_MAX_DELAY} с"
+
+        except Exception as e:
+            error_msg = f"❌ Ошибка обновления PostgreSQL: {e}"
+            logger.error(error_msg)
+            return False, error_msg
+
+    async def update_instagram_for_place(self, place_name: str, instagram_url: str) -> bool:
+        """Обновляет Instagram ссылку для конкретного места"""
+        write_journal.append_instagram(place_name, instagram_url)
+
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(text("""
+                    UPDATE places SET "instagram" = :instagram_url, updated_at = now()
+                    WHERE "Название" = :place_name
+                    RETURNING "Ссылка"
+                """), {"instagram_url": instagram_url, "place_name": place_name})
+                links = [row[0] for row in result.fetchall()]
+            read_cache.invalidate()
+
+            if links:
+                logger.info(f"✅ Instagram обновлен для {place_name}: {instagram_url}")
+                excel_sync.mark_changed(links)
+                return True
+            logger.warning(f"⚠️ Место не найдено: {place_name}")
+            return False
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления Instagram для {place_name}: {e}")
+            return False
+
+    # ===== Чтение =====
+
+    async def get_places_count(self) -> int:
+        """Возвращает количество мест в базе данных (через кэш чтений)"""
+        try:
+            return await read_cache.get_async(
+                "places_count", lambda: self._scalar("SELECT COUNT(*) FROM places")
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета записей: {e}")
+            return 0
+
+    async def get_place_by_url(self, url: str) -> Optional[Dict]:
+        """Получает данные места по URL"""
+        try:
+            rows = await self._fetch_all("SELECT * FROM places WHERE \"Ссылка\" = :url", {"url": url})
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения записи: {e}")
+            return None
+
+    async def get_all_places(self) -> List[Dict]:
+        """Возвращает все места из базы данных"""
+        try:
+            return await self._fetch_all("SELECT * FROM places ORDER BY \"Ссылка\"")
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения всех записей: {e}")
+            return []
+
+    async def get_recent_places(self, limit: int = 10) -> List[Dict]:
+        """Возвращает последние добавленные места (по времени добавления, через кэш чтений)"""
+        try:
+            return await read_cache.get_async(f"recent_places:{limit}", lambda: self._fetch_all(
+                "SELECT * FROM places ORDER BY created_at DESC, \"Ссылка\" LIMIT :limit", {"limit": limit}
+            ))
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения последних записей: {e}")
+            return []
+
+    async def get_places_without_instagram(self, limit: int = 50) -> List[Dict]:
+        """Возвращает места без Instagram"""
+        try:
+            return await self._fetch_all("""
+                SELECT * FROM places
+                WHERE "instagram" IS NULL OR "instagram" = '' OR "instagram" = 'nan'
+                ORDER BY "Название"
+                LIMIT :limit
+            """, {"limit": limit})
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения мест без Instagram: {e}")
+            return []
+
+    async def get_instagram_stats(self) -> Dict:
+        """Возвращает статистику по Instagram (один запрос, через кэш чтений)"""
+        try:
+            return await read_cache.get_async("instagram_stats", self._load_instagram_stats)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики Instagram: {e}")
+            return {}
+
+    async def get_place_stats(self, top: int = 5) -> Dict:
+        """
+        Топ категорий, средний рейтинг и распределение рейтингов одним
+        агрегирующим запросом (через кэш чтений)
+        """
+        try:
+            return await read_cache.get_async(f"place_stats:{top}", lambda: self._load_place_stats(top))
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сводной статистики: {e}")
+            return {}
+
+    async def _load_place_stats(self, top: int) -> Dict:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(PLACE_STATS_SQL, {"top": top})
+            return build_place_stats(result.fetchall())
+
+    async def _load_instagram_stats(self) -> Dict:
+        rows = await self._fetch_all("""
+            SELECT COUNT(*) AS total,
+                   COUNT(*) FILTER (
+                       WHERE "instagram" IS NOT NULL AND "instagram" != '' AND "instagram" != 'nan'
+                   ) AS with_instagram
+            FROM places
+        """)
+        total_count = rows[0]["total"]
+        with_instagram = rows[0]["with_instagram"]
+        return {
+            'total_places': total_count,
+            'with_instagram': with_instagram,
+            'without_instagram': total_count - with_instagram,
+            'percentage': round((with_instagram / total_count * 100) if total_count > 0 else 0, 1)
+        }
+
+
+# Общий асинхронный менеджер для обработчиков бота (один пул на процесс)
+async_db = AsyncDatabaseManager()
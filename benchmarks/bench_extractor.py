@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк извлечения данных: старый код на BeautifulSoup (html.parser + regex)
+против общего lxml-экстрактора. Для каждой страницы печатает CPU-время
+и пиковую память обоих вариантов.
+
+Запуск:
+    python benchmarks/bench_extractor.py [page.html ...] [--repeat N]
+Без аргументов используется синтетическая страница ~2 МБ.
+"""
+
+import argparse
+import json
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from yandex_extractor import extract_place, get_review_form, day_map  # noqa: E402
+from opening_hours import DAYS_RU  # noqa: E402
+
+
+def legacy_extract(page_html: str) -> dict:
+    """Копия прежнего кода parse_yandex_requests (до общего экстрактора)"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_html, "html.parser")
+    title_tag = soup.find('h1')
+    title = title_tag.text.strip() if title_tag else ""
+
+    rating = None
+    rating_tag = soup.select_one("span.business-rating-badge-view__rating-text")
+    if rating_tag:
+        rating = rating_tag.get_text(strip=True)
+
+    reviews = None
+    reviews_tag = soup.select_one("meta[itemprop='reviewCount']")
+    if reviews_tag:
+        reviews = reviews_tag.get("content")
+        if reviews:
+            reviews = get_review_form(reviews)
+
+    latitude = longitude = None
+    el = soup.select_one('[data-coordinates]')
+    if el and el.get('data-coordinates'):
+        try:
+            lon_str, lat_str = el['data-coordinates'].split(',', 1)
+            longitude = float(lon_str.strip())
+            latitude = float(lat_str.strip())
+        except Exception:
+            pass
+
+    if latitude is None or longitude is None:
+        m = re.search(r'data-coordinates="([\-0-9\.]+),([\-0-9\.]+)"', page_html)
+        if m:
+            longitude = float(m.group(1))
+            latitude = float(m.group(2))
+
+    hours = {}
+    for tag in soup.select("meta[itemprop='openingHours']"):
+        content = tag.get("content")
+        if not content:
+            continue
+        match = re.match(r"([A-Za-z]{2}) (.+)", content)
+        if match:
+            eng_day, time_range = match.groups()
+            hours[day_map.get(eng_day, eng_day)] = time_range
+
+    categories = None
+    categories_tags = soup.select("a.orgpage-categories-info-view__link span.button__text")
+    if categories_tags:
+        parts = [tag.get_text(strip=True) for tag in categories_tags if tag.get_text(strip=True)]
+        if parts:
+            categories = ", ".join(parts)
+
+    return {
+        "title": title or "Название не найдено",
+        "rating": rating or "Рейтинг не найден",
+        "reviews": reviews or "Отзывы не найдены",
+        "coordinates": (latitude, longitude) if latitude is not None and longitude is not None else None,
+        "hours": hours,
+        "categories": categories
+    }
+
+
+VARIANTS = {
+    "legacy": legacy_extract,
+    "lxml": extract_place,
+}
+
+
+def synthetic_page(size_mb: float = 2.0) -> str:
+    """Страница организации с большим «хвостом» разметки и JSON-состояния"""
+    head = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Кроста</title></head><body>'
+        '<div class="orgpage-header-view"><h1 class="orgpage-header-view__header">Кроста</h1>'
+        '<div class="business-rating-badge-view">'
+        '<span class="business-rating-badge-view__rating-text">4,7</span></div>'
+        '<meta itemprop="reviewCount" content="553">'
+        '<meta itemprop="openingHours" content="Mo 10:00-23:00">'
+        '<meta itemprop="openingHours" content="Tu 10:00-23:00">'
+        '<meta itemprop="openingHours" content="We 10:00-23:00">'
+        '<meta itemprop="openingHours" content="Th 10:00-23:00">'
+        '<meta itemprop="openingHours" content="Fr 10:00-01:00">'
+        '<meta itemprop="openingHours" content="Sa 11:00-01:00">'
+        '<meta itemprop="openingHours" content="Su 11:00-23:00">'
+        '<div class="orgpage-categories-info-view">'
+        '<a class="orgpage-categories-info-view__link"><span class="button__text">Ресторан</span></a>'
+        '<a class="orgpage-categories-info-view__link"><span class="button__text">Бар, паб</span></a>'
+        '</div></div>'
+    )
+    block = (
+        '<div class="card-feature-view"><div class="card-feature-view__content">'
+        '<span class="card-feature-view__value">Wi-Fi</span><a href="/maps/org/x/1/">ссылка</a>'
+        '</div></div>'
+    )
+    tail = '<div class="map-container" data-coordinates="37.620393,55.753960"></div>'
+    state = '<script type="application/json">{"stack":[' + ','.join(['{"k":"value"}'] * 20000) + ']}</script>'
+    filler_size = int(size_mb * 1024 * 1024) - len(head) - len(tail) - len(state)
+    filler = block * max(1, filler_size // len(block))
+    return head + filler + tail + state + '</body></html>'
+
+
+def load_pages(paths):
+    if not paths:
+        return [("synthetic", synthetic_page())]
+    return [(Path(p).name, Path(p).read_text(encoding="utf-8")) for p in paths]
+
+
+def measure(variant: str, page_html: str, repeat: int) -> dict:
+    """CPU-время (мс на страницу) и пиковая память одного варианта"""
+    func = VARIANTS[variant]
+    func(page_html)  # прогрев
+
+    cpu_start = time.process_time()
+    for _ in range(repeat):
+        result = func(page_html)
+    cpu_ms = (time.process_time() - cpu_start) / repeat * 1000
+
+    tracemalloc.start()
+    func(page_html)
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"cpu_ms": cpu_ms, "py_peak_mb": py_peak / 1024 / 1024, "result": result}
+
+
+def peak_rss_mb() -> float:
+    """
+    Пиковый RSS текущего процесса. VmHWM сбрасывается при exec, в отличие
+    от ru_maxrss, который Linux наследует от родительского процесса.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child_rss(variant: str, path: str) -> float:
+    """
+    Прирост пикового RSS в отдельном процессе: tracemalloc не видит
+    память libxml2, поэтому для честного сравнения меряем весь процесс.
+    """
+    code = (
+        "import sys, json; "
+        f"sys.path.insert(0, {str(Path(__file__).resolve().parent)!r}); "
+        "import bench_extractor as b; "
+        f"page = b.load_pages([{path!r}] if {path!r} else [])[0][1]; "
+        "base = b.peak_rss_mb(); "
+        f"b.VARIANTS[{variant!r}](page); "
+        "print(json.dumps(b.peak_rss_mb() - base))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def same_result(legacy: dict, current: dict) -> bool:
+    """
+    Совпадение результатов без учета намеренного отличия: прежний regex
+    понимал только правила с одним днем ('Su 10:00-22:00'), а диапазоны и
+    списки дней ('Mo-Th ...', 'Fr,Sa ...') пропускал. Часы сравниваются по
+    дням, которые видит legacy; дни, добавленные разбором диапазонов, - не ошибка.
+    """
+    legacy_hours = legacy.get("hours") or {}
+    current_hours = current.get("hours") or {}
+    if any(current_hours.get(day) != value for day, value in legacy_hours.items()):
+        return False
+    return all(legacy.get(key) == current.get(key) for key in set(legacy) | set(current) if key != "hours")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк извлечения данных со страниц Яндекс.Карт")
+    parser.add_argument("pages", nargs="*", help="сохраненные HTML страницы")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов на страницу")
+    args = parser.parse_args()
+
+    paths = args.pages or [""]
+    pages = load_pages(args.pages)
+
+    print(f"{'страница':<28} {'вариант':<8} {'CPU, мс':>9} {'Python пик, МБ':>15} {'RSS прирост, МБ':>16}")
+    mismatches = 0
+    for (name, page_html), path in zip(pages, paths):
+        results = {}
+        for variant in VARIANTS:
+            stats = measure(variant, page_html, args.repeat)
+            rss = child_rss(variant, path)
+            results[variant] = stats["result"]
+            print(f"{name[:28]:<28} {variant:<8} {stats['cpu_ms']:>9.1f} {stats['py_peak_mb']:>15.1f} {rss:>16.1f}")
+        legacy_days, lxml_days = results["legacy"].get("hours") or {}, results["lxml"].get("hours") or {}
+        extra_days = [day for day in DAYS_RU if day in lxml_days and day not in legacy_days]
+        if extra_days:
+            print(f"  ℹ️ дни из диапазонов, которые legacy не разбирал: {', '.join(extra_days)}")
+        if not same_result(results["legacy"], results["lxml"]):
+            mismatches += 1
+            print(f"  ⚠️ результаты различаются:\n  legacy: {json.dumps(results['legacy'], ensure_ascii=False)}"
+                  f"\n  lxml:   {json.dumps(results['lxml'], ensure_ascii=False)}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк и проверка корректности парсера на корпусе сохраненных
+страниц (benchmarks/fixtures). Прогоняет извлечение быстрого метода
+(parse_yandex_html) по всем страницам и печатает пропускную способность,
+p50/p95 задержки на страницу и пиковую память.
+
+Завершается с кодом 1, если извлеченные поля отличаются от ожидаемых
+в manifest.json (или задержка выше --max-p95-ms).
+
+Запуск:
+    python benchmarks/bench_parser.py [--repeat N] [--max-p95-ms MS] [--update]
+Ожидаемые значения в manifest.json проверяются вручную по HTML страницы,
+а не копируются из вывода парсера (иначе проверка закрепит его ошибки).
+--update только заготавливает "expected" для новых страниц без него
+и печатает расхождения у остальных - их исправляют в manifest.json руками.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from yandex_parser import parse_yandex_html  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+MANIFEST_PATH = FIXTURES_DIR / "manifest.json"
+
+
+def percentile(values, pct: float) -> float:
+    """Процентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def normalize(result):
+    """Приводит результат к JSON-виду (кортежи -> списки, без служебных ключей)"""
+    if result is None:
+        return None
+    result = {key: value for key, value in result.items() if not key.startswith("_")}
+    return json.loads(json.dumps(result, ensure_ascii=False))
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def load_corpus():
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    for entry in manifest:
+        entry["html"] = (FIXTURES_DIR / entry["file"]).read_text(encoding="utf-8")
+    return manifest
+
+
+def check_fields(corpus) -> list:
+    """Сравнивает извлеченные поля с ожидаемыми, возвращает список расхождений"""
+    failures = []
+    for entry in corpus:
+        actual = normalize(parse_yandex_html(entry["html"], entry["url"]))
+        expected = entry["expected"]
+        if actual == expected:
+            continue
+        if actual is None or expected is None:
+            failures.append((entry["file"], "капча", expected is None, actual is None))
+            continue
+        for field in sorted(set(expected) | set(actual)):
+            if expected.get(field) != actual.get(field):
+                failures.append((entry["file"], field, expected.get(field), actual.get(field)))
+    return failures
+
+
+def run_benchmark(corpus, repeat: int) -> dict:
+    per_page = {}
+    all_latencies = []
+    total_bytes = 0
+
+    for entry in corpus:
+        parse_yandex_html(entry["html"], entry["url"])  # прогрев
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            parse_yandex_html(entry["html"], entry["url"])
+            latencies.append((time.perf_counter() - started) * 1000)
+        per_page[entry["file"]] = latencies
+        all_latencies.extend(latencies)
+        total_bytes += len(entry["html"].encode("utf-8")) * repeat
+
+    # Пиковая память одного прохода по корпусу
+    tracemalloc.start()
+    for entry in corpus:
+        parse_yandex_html(entry["html"], entry["url"])
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_seconds = sum(all_latencies) / 1000
+    return {
+        "per_page": per_page,
+        "pages": len(all_latencies),
+        "pages_per_sec": len(all_latencies) / total_seconds if total_seconds else 0,
+        "mb_per_sec": total_bytes / 1024 / 1024 / total_seconds if total_seconds else 0,
+        "p50": statistics.median(all_latencies),
+        "p95": percentile(all_latencies, 95),
+        "py_peak_mb": py_peak / 1024 / 1024,
+        "rss_peak_mb": peak_rss_mb(),
+    }
+
+
+def update_manifest(corpus):
+    """Заготовка expected для новых страниц; существующие значения не перезаписываются"""
+    manifest, drafted = [], []
+    for entry in corpus:
+        record = {key: entry[key] for key in ("file", "url", "note") if key in entry}
+        if "expected" in entry:
+            record["expected"] = entry["expected"]
+        else:
+            record["expected"] = normalize(parse_yandex_html(entry["html"], entry["url"]))
+            drafted.append(entry["file"])
+        manifest.append(record)
+    MANIFEST_PATH.write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if drafted:
+        print(f"📝 Заготовлены ожидаемые значения (проверьте по HTML вручную): {', '.join(drafted)}")
+    failures = check_fields([entry for entry in corpus if "expected" in entry])
+    for file, field, expected, actual in failures:
+        print(f"⚠️ {file}: {field}: в manifest {expected!r}, парсер дает {actual!r} - исправьте вручную, если парсер прав")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк парсера Яндекс.Карт")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов на страницу")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="порог p95 задержки, мс")
+    parser.add_argument("--update", action="store_true", help="заготовить ожидаемые значения для новых страниц")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if args.update:
+        update_manifest(corpus)
+        return
+
+    stats = run_benchmark(corpus, args.repeat)
+
+    print(f"{'страница':<40} {'КБ':>7} {'p50, мс':>9} {'p95, мс':>9}")
+    for entry in corpus:
+        latencies = stats["per_page"][entry["file"]]
+        size_kb = len(entry["html"].encode("utf-8")) / 1024
+        print(f"{entry['file']:<40} {size_kb:>7.1f} {statistics.median(latencies):>9.2f} {percentile(latencies, 95):>9.2f}")
+    print(
+        f"\nВсего: {stats['pages']} страниц, {stats['pages_per_sec']:.1f} стр/с, {stats['mb_per_sec']:.1f} МБ/с\n"
+        f"p50: {stats['p50']:.2f} мс, p95: {stats['p95']:.2f} мс\n"
+        f"Пиковая память: Python {stats['py_peak_mb']:.2f} МБ, RSS процесса {stats['rss_peak_mb']:.1f} МБ"
+    )
+
+    failed = False
+    failures = check_fields(corpus)
+    if failures:
+        failed = True
+        print(f"\n❌ Регрессия извлечения: {len(failures)} расхождений")
+        for file, field, expected, actual in failures:
+            print(f"  {file}: {field}\n    ожидалось: {expected!r}\n    получено:  {actual!r}")
+    else:
+        print(f"\n✅ Поля совпадают на всех {len(corpus)} страницах")
+
+    if args.max_p95_ms is not None and stats["p95"] > args.max_p95_ms:
+        failed = True
+        print(f"❌ p95 {stats['p95']:.2f} мс выше порога {args.max_p95_ms} мс")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
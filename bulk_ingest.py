@@ -0,0 +1,220 @@
+# bulk_ingest.py
+import asyncio
+import csv
+import io
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+import pandas as pd
+from config import (
+    BULK_CONCURRENCY, BULK_RATE_PER_SECOND, BULK_RATE_BURST,
+    BULK_DB_BATCH_SIZE, BULK_PROGRESS_INTERVAL, BULK_MAX_LINKS
+)
+from parse_queue import parse_queue, ParseQueueFull
+from place_cache import get_org_id, invalidate_cached_result, is_stored_for_url
+from rate_limiter import TokenBucket
+from yandex_parser import parse_yandex
+
+logger = logging.getLogger('ParserBot')
+
+# Регулярное выражение для ссылок Яндекс.Карт
+YANDEX_URL_PATTERN = re.compile(r"(https?://yandex\.(?:ru|com)/maps/org/[^\s]+)")
+
+# Форматы файлов со ссылками
+SUPPORTED_DOCUMENTS = {".txt", ".csv", ".xlsx"}
+
+# Общий лимит частоты для всех пакетных загрузок
+bulk_rate_limiter = TokenBucket(BULK_RATE_PER_SECOND, BULK_RATE_BURST)
+
+
+def extract_links(text: str) -> List[str]:
+    """Все ссылки на организации из текста, без повторов одной организации"""
+    links = []
+    seen = set()
+    for url in YANDEX_URL_PATTERN.findall(text or ""):
+        key = get_org_id(url) or url
+        if key not in seen:
+            seen.add(key)
+            links.append(url)
+    return links
+
+
+def _decode(content: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return content.decode("utf-8", errors="ignore")
+
+
+def read_links_from_document(content: bytes, filename: str) -> List[str]:
+    """Извлекает ссылки из .txt, .csv или .xlsx файла"""
+    suffix = Path(filename or "").suffix.lower()
+
+    if suffix == ".txt":
+        return extract_links(_decode(content))
+
+    if suffix == ".csv":
+        # Ищем по ячейкам: в ссылке могут быть запятые (?ll=37.6,55.7)
+        text = _decode(content)
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        cells = [cell for row in csv.reader(io.StringIO(text), dialect) for cell in row]
+        return extract_links("\n".join(cells))
+
+    if suffix == ".xlsx":
+        sheets = pd.read_excel(io.BytesIO(content), sheet_name=None, header=None, dtype=str)
+        cells = []
+        for df in sheets.values():
+            cells.extend(str(value) for value in df.values.ravel() if isinstance(value, str))
+        return extract_links("\n".join(cells))
+
+    raise ValueError(f"Неподдерживаемый формат файла: {suffix or filename}")
+
+
+class BulkIngestor:
+    """
+    Пакетная обработка ссылок: парсинг параллельно через общую очередь
+    под общим лимитом частоты, запись в базу пачками через upsert_many.
+    """
+
+    def __init__(self, db_manager, links: List[str], concurrency: int = BULK_CONCURRENCY,
+                 batch_size: int = BULK_DB_BATCH_SIZE):
+        self.db_manager = db_manager
+        self.links = links[:BULK_MAX_LINKS]
+        self.skipped = max(0, len(links) - BULK_MAX_LINKS)
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+
+        self.rows: List[Dict] = []
+        self._next = 0
+        self._pending: List[tuple] = []
+        self._pending_rows: List[Dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._started_at = None
+        self._finished_at = None
+
+    @property
+    def done(self) -> int:
+        return len(self.rows)
+
+    def _count(self, status: str) -> int:
+        return sum(1 for row in self.rows if row["Статус"] == status)
+
+    async def run(self, on_progress: Optional[Callable[[str], Awaitable]] = None) -> List[Dict]:
+        """Обрабатывает все ссылки; on_progress вызывается с текстом прогресса"""
+        self._started_at = time.monotonic()
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(min(self.concurrency, len(self.links)))]
+        reporter = asyncio.ensure_future(self._report(on_progress)) if on_progress else None
+        try:
+            await asyncio.gather(*workers)
+            await self._flush()
+        finally:
+            self._finished_at = time.monotonic()
+            if reporter:
+                reporter.cancel()
+        if on_progress:
+            await on_progress(self.progress_text())
+        logger.info(f"📥 Пакетная загрузка завершена: {self.summary_text()}")
+        return self.rows
+
+    async def _report(self, on_progress):
+        while True:
+            await asyncio.sleep(BULK_PROGRESS_INTERVAL)
+            await on_progress(self.progress_text())
+
+    async def _worker(self):
+        while self._next < len(self.links):
+            url = self.links[self._next]
+            self._next += 1
+
+            await bulk_rate_limiter.acquire_async()
+            row = {"Ссылка": url, "Статус": "", "Название": "", "Рейтинг": "", "Отзывы": "", "Ошибка": ""}
+            try:
+                data = await self._parse(url)
+                row.update({
+                    "Название": data.get("title", ""),
+                    "Рейтинг": data.get("rating", ""),
+                    "Отзывы": data.get("reviews", ""),
+                })
+                if is_stored_for_url(data, url):
+                    row["Статус"] = "из кэша"
+                elif data.get("title") == "Название не найдено":
+                    row["Статус"] = "нет данных"
+                else:
+                    row["Статус"] = "в очереди на запись"
+                    self._pending.append((url, data))
+                    self._pending_rows.append(row)
+            except Exception as e:
+                row["Статус"] = "ошибка"
+                row["Ошибка"] = str(e)
+            self.rows.append(row)
+
+            if len(self._pending) >= self.batch_size:
+                await self._flush()
+
+    async def _parse(self, url: str) -> Dict:
+        while True:
+            try:
+                return await parse_queue.run(parse_yandex, url)
+            except ParseQueueFull:
+                # Очередь занята интерактивными запросами - ждем
+                await asyncio.sleep(1)
+
+    async def _flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            items, rows = self._pending, self._pending_rows
+            self._pending, self._pending_rows = [], []
+
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.db_manager.upsert_many, items)
+                for row in rows:
+                    row["Статус"] = "сохранено"
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетной записи в PostgreSQL: {e}")
+                # Не даем кэшу скрыть неудачную запись при повторной загрузке
+                for url, _ in items:
+                    invalidate_cached_result(url)
+                for row in rows:
+                    row["Статус"] = "ошибка"
+                    row["Ошибка"] = f"Ошибка записи: {e}"
+
+    def progress_text(self) -> str:
+        """Текст сообщения с прогрессом"""
+        total = len(self.links)
+        elapsed = (self._finished_at or time.monotonic()) - (self._started_at or time.monotonic())
+        finished = self._finished_at is not None
+        text = (
+            f"{'✅ Обработка завершена' if finished else '⏳ Обрабатываю ссылки'}: {self.done}/{total}\n"
+            f"💾 Сохранено: {self._count('сохранено')}\n"
+            f"⚡ Из кэша: {self._count('из кэша')}\n"
+            f"⚠️ Без данных: {self._count('нет данных')}\n"
+            f"❌ Ошибок: {self._count('ошибка')}\n"
+            f"⏱ Прошло: {elapsed:.0f} с"
+        )
+        if self.skipped:
+            text += f"\n✂️ Пропущено сверх лимита {BULK_MAX_LINKS}: {self.skipped}"
+        return text
+
+    def summary_text(self) -> str:
+        """Короткий итог"""
+        return (
+            f"{self.done} ссылок, сохранено {self._count('сохранено')}, "
+            f"из кэша {self._count('из кэша')}, ошибок {self._count('ошибка')}"
+        )
+
+    def summary_file(self) -> io.BytesIO:
+        """Итоговый CSV по всем ссылкам"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["Ссылка", "Статус", "Название", "Рейтинг", "Отзывы", "Ошибка"])
+        writer.writeheader()
+        writer.writerows(self.rows)
+        return io.BytesIO(buffer.getvalue().encode("utf-8-sig"))
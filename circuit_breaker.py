@@ -0,0 +1,130 @@
+# circuit_breaker.py
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from config import (
+    FAST_PATH_BREAKER_WINDOW, FAST_PATH_BREAKER_MIN_SAMPLES,
+    FAST_PATH_BREAKER_THRESHOLD, FAST_PATH_BREAKER_COOLDOWN
+)
+
+# Исходы попытки быстрого метода
+OK = "ok"
+CAPTCHA = "captcha"
+ERROR = "error"
+
+# Состояния предохранителя
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель быстрого метода: скользящее окно последних попыток.
+    Если доля капч и ошибок в окне превышает порог, предохранитель
+    размыкается, и ссылки идут сразу в Selenium на время cooldown.
+    После паузы пропускается одна пробная попытка: успех замыкает
+    предохранитель, неудача размыкает его снова.
+    """
+
+    def __init__(self, window: int = FAST_PATH_BREAKER_WINDOW, min_samples: int = FAST_PATH_BREAKER_MIN_SAMPLES,
+                 threshold: float = FAST_PATH_BREAKER_THRESHOLD, cooldown: float = FAST_PATH_BREAKER_COOLDOWN):
+        self.min_samples = max(1, min_samples)
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._outcomes = deque(maxlen=window)
+        self._latencies = deque(maxlen=200)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._totals = {OK: 0, CAPTCHA: 0, ERROR: 0}
+        self._trips = 0
+        self._skipped = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли сейчас пробовать быстрый метод"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._skipped += 1
+            return False
+
+    def record(self, outcome: str, latency: Optional[float] = None):
+        """Учитывает исход попытки быстрого метода"""
+        with self._lock:
+            self._totals[outcome] += 1
+            if outcome == OK and latency is not None:
+                self._latencies.append(latency)
+
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probe_in_flight = False
+                if outcome == OK:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+
+            self._outcomes.append(outcome)
+            if state == CLOSED and len(self._outcomes) >= self.min_samples:
+                failures = sum(1 for item in self._outcomes if item != OK)
+                if failures / len(self._outcomes) >= self.threshold:
+                    self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._trips += 1
+        print(f"🚧 Быстрый метод отключен на {self.cooldown:.0f} с: слишком много капч и ошибок")
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """Процентиль времени успешных попыток, None - если данных мало"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * pct / 100))
+        return latencies[index]
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику предохранителя"""
+        with self._lock:
+            state = self._current_state()
+            window = list(self._outcomes)
+            totals = dict(self._totals)
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self._opened_at)) if state == OPEN else 0.0
+        attempts = sum(totals.values())
+        p95 = self.latency_percentile(95)
+        return {
+            'state': state,
+            'retry_in': round(retry_in),
+            'window_failure_rate': round(sum(1 for item in window if item != OK) / len(window) * 100, 1) if window else 0,
+            'attempts': attempts,
+            'ok_rate': round(totals[OK] / attempts * 100, 1) if attempts else 0,
+            'captcha_rate': round(totals[CAPTCHA] / attempts * 100, 1) if attempts else 0,
+            'error_rate': round(totals[ERROR] / attempts * 100, 1) if attempts else 0,
+            'trips': self._trips,
+            'skipped': self._skipped,
+            'p95': round(p95, 2) if p95 is not None else None,
+        }
@@ -24,10 +24,122 @@ POSTGRES_CONFIG = {
 # Строка подключения к PostgreSQL
 POSTGRES_URL = f"postgresql+psycopg2://{POSTGRES_CONFIG['user']}:{POSTGRES_CONFIG['password']}@{POSTGRES_CONFIG['host']}:{POSTGRES_CONFIG['port']}/{POSTGRES_CONFIG['database']}"
 
+# Асинхронное подключение для обработчиков бота (asyncpg)
+POSTGRES_ASYNC_URL = f"postgresql+asyncpg://{POSTGRES_CONFIG['user']}:{POSTGRES_CONFIG['password']}@{POSTGRES_CONFIG['host']}:{POSTGRES_CONFIG['port']}/{POSTGRES_CONFIG['database']}"
+DB_POOL_SIZE = 5                        # постоянных соединений
+DB_MAX_OVERFLOW = 5                     # дополнительных при пиковой нагрузке
+DB_POOL_TIMEOUT = 10                    # ожидание свободного соединения, сек
+DB_POOL_RECYCLE = 30 * 60               # переоткрывать соединения старше, сек
+DB_STATEMENT_TIMEOUT_MS = 15000         # statement_timeout на стороне сервера
+DB_PREPARED_STATEMENT_CACHE_SIZE = 100  # подготовленных запросов на соединение
+
 # Настройки парсинга
 PARSING_DELAY = 2
 HEADLESS_MODE = True
 
+# Настройки очереди парсинга
+PARSE_WORKERS = 2            # количество параллельных исполнителей
+PARSE_QUEUE_MAX_SIZE = 50    # максимум заданий в ожидании
+PARSE_USE_PROCESSES = False  # True - пул процессов вместо пула потоков
+
+# Настройки пула браузеров Selenium
+SELENIUM_POOL_SIZE = 2               # максимум одновременно открытых браузеров
+SELENIUM_MAX_PAGES_PER_DRIVER = 50   # перезапуск браузера после N страниц
+SELENIUM_MAX_RSS_MB = 1024           # перезапуск при превышении памяти (None - не проверять)
+SELENIUM_CHECKOUT_TIMEOUT = 60       # ожидание свободного браузера, сек
+SELENIUM_WAIT_MODE = "ready"         # "ready" - ждать элементы карточки, "sleep" - случайная пауза 3-6 сек
+SELENIUM_READY_TIMEOUT = 10          # максимум ожидания карточки в режиме "ready", сек
+SELENIUM_EAGER_LOAD = True           # не ждать загрузки всех ресурсов (page_load_strategy="eager")
+SELENIUM_BLOCK_RESOURCES = True      # не загружать картинки, шрифты и медиа
+
+# Настройки HTTP-клиента быстрого метода
+HTTP_CONNECT_TIMEOUT = 5        # сек
+HTTP_READ_TIMEOUT = 10          # сек
+HTTP_RETRIES = 2                # повторы при сетевых ошибках и 429/5xx
+HTTP_PER_HOST_CONCURRENCY = 4   # максимум параллельных запросов к одному хосту
+HTTP_POOL_SIZE = 10             # keep-alive соединений на хост
+
+# Предохранитель быстрого метода (капчи/ошибки -> сразу Selenium)
+FAST_PATH_BREAKER_WINDOW = 20          # последних попыток в скользящем окне
+FAST_PATH_BREAKER_MIN_SAMPLES = 5      # минимум попыток для решения
+FAST_PATH_BREAKER_THRESHOLD = 0.6      # доля капч и ошибок для размыкания
+FAST_PATH_BREAKER_COOLDOWN = 10 * 60   # сколько ссылки идут сразу в Selenium, сек
+
+# Хеджирование: Selenium стартует параллельно, если быстрый метод дольше своего p95
+FAST_PATH_HEDGE = False
+FAST_PATH_HEDGE_DEFAULT_DELAY = 3.0    # задержка, пока p95 еще не накоплен, сек
+FAST_PATH_HEDGE_MIN_DELAY = 1.0        # нижняя граница задержки, сек
+
+# Пакетная загрузка ссылок (несколько ссылок в сообщении, .txt/.csv/.xlsx файлы)
+BULK_CONCURRENCY = 2              # одновременно парсящихся ссылок одной загрузки
+BULK_RATE_PER_SECOND = 0.5        # общий лимит: ссылок в секунду для всех загрузок
+BULK_RATE_BURST = 3               # допустимая пачка сверх лимита
+BULK_DB_BATCH_SIZE = 25           # записей в одной пакетной записи в PostgreSQL
+BULK_PROGRESS_INTERVAL = 5        # интервал обновления сообщения с прогрессом, сек
+BULK_MAX_LINKS = 1000             # максимум ссылок за одну загрузку
+BULK_MAX_FILE_SIZE = 5 * 1024 * 1024  # максимальный размер файла со ссылками, байт
+
+# Журнал записей (вместо чтения/записи Excel на каждую ссылку)
+JOURNAL_DIR = BASE_DIR / "data" / "journal"
+JOURNAL_COMPRESS = False             # True - сегменты .jsonl.gz
+JOURNAL_FSYNC_INTERVAL = 1.0         # сброс на диск не реже, сек
+JOURNAL_FSYNC_BATCH = 50             # или по стольким записям
+JOURNAL_COMPACT_INTERVAL = 60 * 60   # обновление снимка EXCEL_PATH из журнала, сек
+JOURNAL_RETENTION_DAYS = 30          # хранение уплотненных сегментов для replay
+
+# Синхронизация локального Excel основного бота
+EXCEL_SYNC_DEBOUNCE = 5      # пауза без записей перед синхронизацией, сек
+EXCEL_SYNC_MAX_DELAY = 30    # максимальная задержка синхронизации, сек
+CHANGES_OVERLAP = 60         # перекрытие окна выборки изменений (поздние коммиты), сек
+
+# Кэш результатов парсинга (по ID организации)
+RESULT_CACHE_TTL = 6 * 60 * 60                   # время жизни записи, сек
+RESULT_CACHE_MAX_SIZE = 1000                     # записей в памяти
+RESULT_CACHE_DIR = BASE_DIR / "data" / "cache"   # дисковый уровень (None - только память)
+
+# Кэш частых чтений для /status и /stats (сбрасывается при любой записи)
+READ_CACHE_TTL = 30   # сек
+
+# Экспорт /export и резервные копии /backup
+EXPORT_CHUNK_SIZE = 2000                       # строк за одно чтение серверного курсора
+EXPORT_MAX_PART_SIZE = 45 * 1024 * 1024        # размер части (лимит документа Telegram - 50 МБ)
+EXPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024      # буфер части в памяти, дальше - временный файл
+BACKUP_DIR = BASE_DIR / "backups"
+
+# Поиск ближайших мест /near (сетка по координатам в памяти)
+NEAR_CELL_DEGREES = 0.01     # размер ячейки сетки (~1 км по широте)
+NEAR_RADIUS_METERS = 2000    # радиус поиска по умолчанию, м
+NEAR_MAX_RADIUS_METERS = 20000
+NEAR_LIMIT = 5               # мест в ответе
+
+# Поиск мест по названию /find (триграммный индекс в памяти)
+SEARCH_LIMIT = 10        # мест в ответе
+SEARCH_MIN_SCORE = 0.3   # минимальное сходство (как порог pg_trgm по умолчанию)
+
+# Часы работы мест ("открыто сейчас" по индексу интервалов в памяти)
+HOURS_TIMEZONE = "Europe/Moscow"   # часовой пояс, в котором указаны часы работы
+
+# Архив загруженных страниц (для повторного извлечения без сети)
+PAGE_ARCHIVE_ENABLED = True
+PAGE_ARCHIVE_DIR = BASE_DIR / "data" / "pages"
+REEXTRACT_WORKERS = os.cpu_count() or 2   # процессов для повторного извлечения
+
+# Фоновое обновление устаревших записей
+REFRESH_ENABLED = True
+REFRESH_RATE_PER_SECOND = 1 / 30       # не чаще одной ссылки в 30 сек
+REFRESH_RATE_BURST = 1
+REFRESH_DAILY_BUDGET = 150             # максимум ссылок в сутки
+REFRESH_MIN_AGE = 7 * 24 * 60 * 60     # не обновлять запись чаще, сек
+REFRESH_BATCH_SIZE = 10                # записей в одной пакетной записи в PostgreSQL
+REFRESH_IDLE_CHECK_INTERVAL = 30       # пауза, если очередь парсинга занята, сек
+REFRESH_STATE_PATH = BASE_DIR / "data" / "refresh_state.json"
+
+# Метрики этапов обработки
+METRICS_WINDOW = 1000                # последних замеров на этап для p50/p95/p99
+METRICS_SLOW_TRACE_SECONDS = 15      # запросы дольше пишутся в лог по этапам
+METRICS_HTTP_HOST = "127.0.0.1"
+METRICS_HTTP_PORT = None             # порт для Prometheus /metrics (None - отключено)
+
 # Настройки логирования
 LOG_FILE = BASE_DIR / "logs" / "parser_bot.log"
 LOG_LEVEL = "INFO"
@@ -1,21 +1,185 @@
 # database_manager.py
-import pandas as pd
+from psycopg2.extras import execute_values
 from sqlalchemy import create_engine, text, inspect
 from typing import Dict, Optional, Tuple, List
-from config import POSTGRES_URL, EXCEL_PATH
+from config import POSTGRES_URL, EXCEL_SYNC_MAX_DELAY, SEARCH_LIMIT, CHANGES_OVERLAP
 from logger import log_excel_update
+from db_migrations import apply_migrations
+from excel_sync import excel_sync
+from write_journal import write_journal
+from metrics import metrics
+from read_cache import read_cache
+from spatial_index import spatial_index
+from search_index import search_index
+from opening_hours import opening_index, hours_to_intervals, pack_intervals
 import logging
+import re
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 
 logger = logging.getLogger('ParserBot')
 
+PLACE_COLUMNS = """
+    "Ссылка", "Название", "Рейтинг", "Отзывы", "Категории",
+    "Широта", "Долгота", "Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс",
+    rating_value, reviews_count, lat, lon, hours_minutes
+"""
+
+# Обновляются все поля, кроме ссылки (instagram и прочие колонки не трогаем);
+# created_at задается DEFAULT при вставке, updated_at - при каждой записи
+PLACE_CONFLICT_UPDATE = """
+    ON CONFLICT ("Ссылка") DO UPDATE SET
+        "Название" = EXCLUDED."Название",
+        "Рейтинг" = EXCLUDED."Рейтинг",
+        "Отзывы" = EXCLUDED."Отзывы",
+        "Категории" = EXCLUDED."Категории",
+        "Широта" = EXCLUDED."Широта",
+        "Долгота" = EXCLUDED."Долгота",
+        "Пн" = EXCLUDED."Пн",
+        "Вт" = EXCLUDED."Вт",
+        "Ср" = EXCLUDED."Ср",
+        "Чт" = EXCLUDED."Чт",
+        "Пт" = EXCLUDED."Пт",
+        "Сб" = EXCLUDED."Сб",
+        "Вс" = EXCLUDED."Вс",
+        rating_value = EXCLUDED.rating_value,
+        reviews_count = EXCLUDED.reviews_count,
+        lat = EXCLUDED.lat,
+        lon = EXCLUDED.lon,
+        hours_minutes = EXCLUDED.hours_minutes,
+        updated_at = now()
+    RETURNING (xmax = 0) AS inserted
+"""
+
+# Один запрос вместо SELECT + UPDATE/INSERT; xmax = 0 - строка только что вставлена
+UPSERT_PLACE_SQL = text(f"""
+    INSERT INTO places ({PLACE_COLUMNS}) VALUES (
+        :url, :title, :rating, :reviews, :categories,
+        :latitude, :longitude, :monday, :tuesday, :wednesday,
+        :thursday, :friday, :saturday, :sunday,
+        :rating_value, :reviews_count, :latitude, :longitude, :hours_minutes
+    )
+    {PLACE_CONFLICT_UPDATE}
+""")
+
+# Для psycopg2.extras.execute_values: VALUES %s разворачивается в пачку строк
+UPSERT_MANY_SQL = f"INSERT INTO places ({PLACE_COLUMNS}) VALUES %s {PLACE_CONFLICT_UPDATE}"
+UPSERT_MANY_TEMPLATE = (
+    "(%(url)s, %(title)s, %(rating)s, %(reviews)s, %(categories)s, "
+    "%(latitude)s, %(longitude)s, %(monday)s, %(tuesday)s, %(wednesday)s, "
+    "%(thursday)s, %(friday)s, %(saturday)s, %(sunday)s, "
+    "%(rating_value)s, %(reviews_count)s, %(latitude)s, %(longitude)s, %(hours_minutes)s)"
+)
+
+# Сводная статистика одним запросом: категории разбиваются по запятой,
+# рейтинги берутся из числовой колонки rating_value
+PLACE_STATS_SQL = text("""
+    WITH ratings AS (
+        SELECT rating_value AS rating FROM places WHERE rating_value IS NOT NULL
+    ),
+    categories AS (
+        SELECT trim(category) AS category, COUNT(*) AS cnt
+        FROM places, unnest(string_to_array("Категории", ',')) AS category
+        WHERE trim(category) <> ''
+        GROUP BY 1
+        ORDER BY cnt DESC
+        LIMIT :top
+    ),
+    buckets AS (
+        SELECT CASE
+                   WHEN rating >= 4.5 THEN '4.5–5'
+                   WHEN rating >= 4 THEN '4–4.4'
+                   WHEN rating >= 3 THEN '3–3.9'
+                   ELSE 'ниже 3'
+               END AS bucket,
+               COUNT(*) AS cnt
+        FROM ratings
+        GROUP BY 1
+    )
+    SELECT 'category' AS kind, category AS label, cnt::numeric AS value FROM categories
+    UNION ALL
+    SELECT 'rating', bucket, cnt::numeric FROM buckets
+    UNION ALL
+    SELECT 'avg', NULL, round(AVG(rating), 2) FROM ratings
+    UNION ALL
+    SELECT 'rated', NULL, COUNT(*)::numeric FROM ratings
+""")
+
+RATING_BUCKETS = ['4.5–5', '4–4.4', '3–3.9', 'ниже 3']
+
+def build_place_stats(rows) -> Dict:
+    """Собирает результат PLACE_STATS_SQL в словарь для /stats"""
+    stats = {'avg_rating': None, 'rated': 0, 'categories': [], 'ratings': {bucket: 0 for bucket in RATING_BUCKETS}}
+    for kind, label, value in rows:
+        if kind == 'category':
+            stats['categories'].append((label, int(value)))
+        elif kind == 'rating':
+            stats['ratings'][label] = int(value)
+        elif kind == 'avg' and value is not None:
+            stats['avg_rating'] = float(value)
+        elif kind == 'rated':
+            stats['rated'] = int(value)
+    stats['categories'].sort(key=lambda item: (-item[1], item[0]))
+    return stats
+
+RATING_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*$")
+REVIEWS_COUNT_RE = re.compile(r"^\s*(\d[\d\s\u00a0]*)")
+
+def parse_rating(value) -> Optional[float]:
+    """'4,7' / '4.7' -> 4.7; 'Рейтинг не найден' и пустое -> None"""
+    if value is None:
+        return None
+    match = RATING_RE.match(str(value))
+    return float(match.group(1).replace(',', '.')) if match else None
+
+def parse_reviews_count(value) -> Optional[int]:
+    """'553 отзыва' / '1 204 отзыва' -> число; 'Отзывы не найдены' -> None"""
+    if value is None:
+        return None
+    match = REVIEWS_COUNT_RE.match(str(value))
+    return int(re.sub(r"\D", "", match.group(1))) if match else None
+
+def place_params(url: str, data: Dict) -> Dict:
+    """Параметры SQL-запроса из результата парсинга"""
+    coordinates = data.get('coordinates')
+    latitude = longitude = None
+    if coordinates and len(coordinates) == 2:
+        latitude, longitude = coordinates
+    
+    hours = data.get('hours', {})
+    
+    return {
+        "url": url,
+        "title": data.get('title', 'Название не найдено'),
+        "rating": data.get('rating', 'Рейтинг не найден'),
+        "reviews": data.get('reviews', 'Отзывы не найдены'),
+        "categories": data.get('categories'),
+        "latitude": latitude,
+        "longitude": longitude,
+        "monday": hours.get('Пн'),
+        "tuesday": hours.get('Вт'),
+        "wednesday": hours.get('Ср'),
+        "thursday": hours.get('Чт'),
+        "friday": hours.get('Пт'),
+        "saturday": hours.get('Сб'),
+        "sunday": hours.get('Вс'),
+        # Числовые дубли текстовых полей (миграция 2)
+        "rating_value": parse_rating(data.get('rating')),
+        "reviews_count": parse_reviews_count(data.get('reviews')),
+        # Часы интервалами в минутах недели (миграция 4)
+        "hours_minutes": pack_intervals(hours_to_intervals(hours)),
+    }
+
 class DatabaseManager:
     def __init__(self):
         self.engine = create_engine(POSTGRES_URL)
         self._ensure_table_exists()
+        self._apply_migrations()
         
         # Путь к локальному Excel файлу основного бота
         self.local_excel_path = Path("/Users/ivan/Desktop/EatSpot_Bot_git/data/places.xlsx")
+        excel_sync.attach(self)
     
     def _ensure_table_exists(self):
         """Проверяет существование таблицы places"""
@@ -28,107 +192,102 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"❌ Ошибка проверки таблицы: {e}")
     
+    def _apply_migrations(self):
+        """Приводит схему к актуальной версии (уникальный индекс по ссылке и т.д.)"""
+        try:
+            applied = apply_migrations(self.engine)
+            if applied:
+                logger.info(f"✅ Применены миграции: {applied}")
+        except Exception as e:
+            # Без уникального индекса ON CONFLICT не сработает - запись мест будет падать
+            logger.error(f"❌ Ошибка миграции схемы, запись мест недоступна: {e}")
+    
     def update_place_data(self, url: str, data: Dict) -> Tuple[bool, str]:
         """
         Обновляет данные места в PostgreSQL
         Возвращает (успех, сообщение)
         """
+        # Сначала журнал: при недоступной базе запись можно будет проиграть позже
+        write_journal.append_places([(url, data)])
+        
         try:
-            # Проверяем наличие записи (используем Ссылка вместо id)
-            check_sql = text("SELECT \"Ссылка\" FROM places WHERE \"Ссылка\" = :url")
-            
-            with self.engine.connect() as conn:
-                result = conn.execute(check_sql, {"url": url})
-                existing_record = result.fetchone()
-                
-                if existing_record:
-                    # Обновляем существующую запись
-                    update_sql = text("""
-                        UPDATE places SET 
-                            "Название" = :title,
-                            "Рейтинг" = :rating,
-                            "Отзывы" = :reviews,
-                            "Категории" = :categories,
-                            "Широта" = :latitude,
-                            "Долгота" = :longitude,
-                            "Пн" = :monday,
-                            "Вт" = :tuesday,
-                            "Ср" = :wednesday,
-                            "Чт" = :thursday,
-                            "Пт" = :friday,
-                            "Сб" = :saturday,
-                            "Вс" = :sunday
-                        WHERE "Ссылка" = :url
-                    """)
-                    action = "обновлена"
-                    log_excel_update(url, "обновление существующей записи в PostgreSQL")
-                else:
-                    # Создаем новую запись
-                    insert_sql = text("""
-                        INSERT INTO places (
-                            "Ссылка", "Название", "Рейтинг", "Отзывы", "Категории",
-                            "Широта", "Долгота", "Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"
-                        ) VALUES (
-                            :url, :title, :rating, :reviews, :categories,
-                            :latitude, :longitude, :monday, :tuesday, :wednesday,
-                            :thursday, :friday, :saturday, :sunday
-                        )
-                    """)
-                    action = "добавлена"
-                    log_excel_update(url, "создание новой записи в PostgreSQL")
-                
-                # Подготавливаем данные
-                coordinates = data.get('coordinates')
-                latitude = longitude = None
-                if coordinates and len(coordinates) == 2:
-                    latitude, longitude = coordinates
-                
-                hours = data.get('hours', {})
-                
-                params = {
-                    "url": url,
-                    "title": data.get('title', 'Название не найдено'),
-                    "rating": data.get('rating', 'Рейтинг не найден'),
-                    "reviews": data.get('reviews', 'Отзывы не найдены'),
-                    "categories": data.get('categories'),
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "monday": hours.get('Пн'),
-                    "tuesday": hours.get('Вт'),
-                    "wednesday": hours.get('Ср'),
-                    "thursday": hours.get('Чт'),
-                    "friday": hours.get('Пт'),
-                    "saturday": hours.get('Сб'),
-                    "sunday": hours.get('Вс')
-                }
-                
-                # Выполняем запрос
-                if existing_record:
-                    conn.execute(update_sql, params)
-                else:
-                    conn.execute(insert_sql, params)
-                
+            with metrics.span("db_upsert"), self.engine.connect() as conn:
+                inserted = conn.execute(UPSERT_PLACE_SQL, place_params(url, data)).scalar()
                 conn.commit()
+            read_cache.invalidate()
+            spatial_index.upsert(url, data)
+            search_index.upsert(url, data)
+            opening_index.upsert(url, data)
             
-            # Синхронизируем с локальным Excel файлом
-            self._sync_with_local_excel()
+            if inserted:
+                action = "добавлена"
+                log_excel_update(url, "создание новой записи в PostgreSQL")
+            else:
+                action = "обновлена"
+                log_excel_update(url, "обновление существующей записи в PostgreSQL")
             
-            # Также сохраняем в Excel для бэкапа
-            self._backup_to_excel(url, data)
+            # Синхронизируем с локальным Excel файлом (отложенно, вместе с соседними записями)
+            self._sync_with_local_excel([url])
             
-            return True, f"✅ Запись {action} в PostgreSQL базу данных и синхронизирована с локальным Excel"
+            return True, f"✅ Запись {action} в PostgreSQL базу данных, локальный Excel обновится в течение {EXCEL_SYNC_MAX_DELAY} с"
             
         except Exception as e:
             error_msg = f"❌ Ошибка обновления PostgreSQL: {e}"
             logger.error(error_msg)
             return False, error_msg
     
-    def update_instagram_for_place(self, place_name: str, instagram_url: str) -> bool:
+    def upsert_many(self, items: List[Tuple[str, Dict]], journal: bool = True) -> Tuple[int, int]:
+        """
+        Пакетно добавляет/обновляет места одной транзакцией.
+        items - список (ссылка, данные парсинга). Возвращает (добавлено, обновлено).
+        Excel синхронизируется один раз на весь пакет.
+        journal=False - не писать в журнал (повтор из самого журнала).
+        Ошибки базы данных пробрасываются вызывающему.
+        """
+        if not items:
+            return 0, 0
+        if journal:
+            write_journal.append_places(items)
+        
+        # Последний результат для каждой ссылки: ON CONFLICT не обновляет строку дважды за запрос
+        latest = dict(items)
+        params = [place_params(url, data) for url, data in latest.items()]
+        
+        with metrics.span("db_upsert_many"):
+            raw = self.engine.raw_connection()
+            try:
+                with raw.cursor() as cursor:
+                    rows = execute_values(cursor, UPSERT_MANY_SQL, params, template=UPSERT_MANY_TEMPLATE,
+                                          page_size=500, fetch=True)
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                raw.close()
+        read_cache.invalidate()
+        spatial_index.upsert_many(latest.items())
+        search_index.upsert_many(latest.items())
+        opening_index.upsert_many(latest.items())
+        
+        inserted = sum(1 for (is_new,) in rows if is_new)
+        updated = len(rows) - inserted
+        logger.info(f"✅ Пакетная запись в PostgreSQL: добавлено {inserted}, обновлено {updated}")
+        
+        self._sync_with_local_excel(list(latest))
+        
+        return inserted, updated
+    
+    def update_instagram_for_place(self, place_name: str, instagram_url: str, journal: bool = True) -> bool:
         """Обновляет Instagram ссылку для конкретного места"""
+        if journal:
+            write_journal.append_instagram(place_name, instagram_url)
+        
         try:
             update_sql = text("""
-                UPDATE places SET "instagram" = :instagram_url
+                UPDATE places SET "instagram" = :instagram_url, updated_at = now()
                 WHERE "Название" = :place_name
+                RETURNING "Ссылка"
             """)
             
             with self.engine.connect() as conn:
@@ -136,12 +295,14 @@ class DatabaseManager:
                     "instagram_url": instagram_url,
                     "place_name": place_name
                 })
+                links = [row[0] for row in result.fetchall()]
                 conn.commit()
+                read_cache.invalidate()
                 
-                if result.rowcount > 0:
+                if links:
                     logger.info(f"✅ Instagram обновлен для {place_name}: {instagram_url}")
                     # Синхронизируем с локальным Excel
-                    self._sync_with_local_excel()
+                    self._sync_with_local_excel(links)
                     return True
                 else:
                     logger.warning(f"⚠️ Место не найдено: {place_name}")
@@ -167,115 +328,58 @@ class DatabaseManager:
             return []
     
     def get_instagram_stats(self) -> Dict:
-        """Возвращает статистику по Instagram"""
+        """Возвращает статистику по Instagram (через кэш чтений)"""
         try:
-            with self.engine.connect() as conn:
-                # Общее количество мест
-                total_result = conn.execute(text("SELECT COUNT(*) FROM places"))
-                total_count = total_result.scalar()
-                
-                # Места с Instagram
-                with_insta_result = conn.execute(text("""
-                    SELECT COUNT(*) FROM places 
-                    WHERE "instagram" IS NOT NULL AND "instagram" != '' AND "instagram" != 'nan'
-                """))
-                with_instagram = with_insta_result.scalar()
-                
-                # Места без Instagram
-                without_instagram = total_count - with_instagram
-                
-                return {
-                    'total_places': total_count,
-                    'with_instagram': with_instagram,
-                    'without_instagram': without_instagram,
-                    'percentage': round((with_instagram / total_count * 100) if total_count > 0 else 0, 1)
-                }
+            return read_cache.get("instagram_stats", self._load_instagram_stats)
         except Exception as e:
             logger.error(f"❌ Ошибка получения статистики Instagram: {e}")
             return {}
     
-    def _sync_with_local_excel(self):
-        """Синхронизирует данные из PostgreSQL с локальным Excel файлом"""
-        try:
-            # Получаем все данные из PostgreSQL
-            all_places = self.get_all_places()
+    def _load_instagram_stats(self) -> Dict:
+        with self.engine.connect() as conn:
+            # Общее количество мест
+            total_result = conn.execute(text("SELECT COUNT(*) FROM places"))
+            total_count = total_result.scalar()
             
-            if not all_places:
-                logger.warning("⚠️ Нет данных для синхронизации с Excel")
-                return
+            # Места с Instagram
+            with_insta_result = conn.execute(text("""
+                SELECT COUNT(*) FROM places 
+                WHERE "instagram" IS NOT NULL AND "instagram" != '' AND "instagram" != 'nan'
+            """))
+            with_instagram = with_insta_result.scalar()
             
-            # Создаем DataFrame
-            df = pd.DataFrame(all_places)
-            
-            # Проверяем существование локального файла
-            if self.local_excel_path.exists():
-                logger.info(f"📊 Синхронизация с локальным Excel: {self.local_excel_path}")
-            else:
-                logger.info(f"📊 Создание нового локального Excel файла: {self.local_excel_path}")
+            # Места без Instagram
+            without_instagram = total_count - with_instagram
             
-            # Сохраняем в локальный Excel файл
-            df.to_excel(self.local_excel_path, index=False)
-            logger.info(f"✅ Локальный Excel файл обновлен: {len(all_places)} записей")
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка синхронизации с локальным Excel: {e}")
+            return {
+                'total_places': total_count,
+                'with_instagram': with_instagram,
+                'without_instagram': without_instagram,
+                'percentage': round((with_instagram / total_count * 100) if total_count > 0 else 0, 1)
+            }
     
-    def _backup_to_excel(self, url: str, data: Dict):
-        """Создает резервную копию в Excel файле"""
-        try:
-            import pandas as pd
-            
-            # Загружаем существующий Excel или создаем новый
-            if EXCEL_PATH.exists():
-                df = pd.read_excel(EXCEL_PATH)
-            else:
-                columns = [
-                    'Ссылка', 'Название', 'Рейтинг', 'Отзывы', 'Категории',
-                    'Широта', 'Долгота', 'Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'
-                ]
-                df = pd.DataFrame(columns=columns)
-            
-            # Обновляем или добавляем запись
-            if url in df['Ссылка'].values:
-                row_idx = df[df['Ссылка'] == url].index[0]
-            else:
-                row_idx = len(df)
-                df.loc[row_idx] = [None] * len(df.columns)
-                df.at[row_idx, 'Ссылка'] = url
-            
-            # Обновляем данные
-            df.at[row_idx, 'Название'] = data.get('title', 'Название не найдено')
-            df.at[row_idx, 'Рейтинг'] = data.get('rating', 'Рейтинг не найден')
-            df.at[row_idx, 'Отзывы'] = data.get('reviews', 'Отзывы не найдены')
-            df.at[row_idx, 'Категории'] = data.get('categories')
-            
-            coordinates = data.get('coordinates')
-            if coordinates and len(coordinates) == 2:
-                latitude, longitude = coordinates
-                df.at[row_idx, 'Широта'] = latitude
-                df.at[row_idx, 'Долгота'] = longitude
-            
-            hours = data.get('hours', {})
-            for day, time_range in hours.items():
-                if day in df.columns:
-                    df.at[row_idx, day] = time_range
-            
-            df.to_excel(EXCEL_PATH, index=False)
-            logger.info(f"📊 Резервная копия сохранена в Excel: {url}")
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка создания Excel бэкапа: {e}")
+    def _sync_with_local_excel(self, links: Optional[List[str]] = None):
+        """
+        Ставит синхронизацию с локальным Excel файлом: измененные ссылки
+        или (без links) всю таблицу. Запись файла - в фоне, одна на окно.
+        """
+        if links:
+            excel_sync.mark_changed(links)
+        else:
+            excel_sync.request_full()
     
     def get_places_count(self) -> int:
-        """Возвращает количество мест в базе данных"""
+        """Возвращает количество мест в базе данных (через кэш чтений)"""
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text("SELECT COUNT(*) FROM places"))
-                return result.scalar()
+            return read_cache.get("places_count", self._load_places_count)
         except Exception as e:
             logger.error(f"❌ Ошибка подсчета записей: {e}")
             return 0
     
+    def _load_places_count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM places")).scalar()
+    
     def get_place_by_url(self, url: str) -> Optional[Dict]:
         """Получает данные места по URL"""
         try:
@@ -302,24 +406,131 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка получения всех записей: {e}")
             return []
     
-    def get_recent_places(self, limit: int = 10) -> List[Dict]:
-        """Возвращает последние добавленные места (по Ссылке)"""
-        try:
-            with self.engine.connect() as conn:
+    def get_refresh_candidates(self, min_age: float, limit: int, exclude: List[str] = ()) -> List[Dict]:
+        """
+        Ссылки для фонового обновления: не обновлявшиеся дольше min_age
+        секунд, сначала неполные, затем самые давние (ошибки пробрасываются)
+        """
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT "Ссылка",
+                       ("Название" IS NULL OR "Название" = 'Название не найдено'
+                        OR rating_value IS NULL OR lat IS NULL) AS incomplete,
+                       updated_at
+                FROM places
+                WHERE "Ссылка" IS NOT NULL
+                  AND updated_at < now() - make_interval(secs => :min_age)
+                  AND NOT ("Ссылка" = ANY(:exclude))
+                ORDER BY incomplete DESC, updated_at
+                LIMIT :limit
+            """), {"min_age": min_age, "limit": limit, "exclude": list(exclude)})
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    def get_place_points(self) -> List[Dict]:
+        """Места с координатами для пространственного индекса (ошибки пробрасываются)"""
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT "Ссылка", "Название", "Рейтинг", "Категории", lat, lon
+                FROM places
+                WHERE lat IS NOT NULL AND lon IS NOT NULL
+            """))
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    def get_search_documents(self) -> List[Dict]:
+        """Названия и категории всех мест для поискового индекса (ошибки пробрасываются)"""
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT "Ссылка", "Название", "Категории", "Рейтинг"
+                FROM places
+                WHERE "Ссылка" IS NOT NULL
+            """))
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    def get_hours_documents(self) -> List[Dict]:
+        """Интервалы часов работы для индекса "открыто сейчас" (ошибки пробрасываются)"""
+        with self.engine.connect() as conn:
+            result = conn.execute(text("""
+                SELECT "Ссылка", hours_minutes
+                FROM places
+                WHERE hours_minutes IS NOT NULL
+            """))
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    def search_places(self, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """
+        Нечеткий поиск мест по названию и категориям (триграммный индекс
+        в памяти, при первом вызове строится из базы)
+        """
+        search_index.ensure_loaded(self)
+        return search_index.search(query, limit=limit)
+
+    def get_changed_since(self, watermark: Optional[datetime], overlap: float = CHANGES_OVERLAP) -> List[Dict]:
+        """
+        Места, измененные после watermark (None - все), по возрастанию
+        updated_at: следующий watermark - updated_at последней строки.
+        updated_at = now() - время начала транзакции, а видна строка после
+        коммита, поэтому окно начинается на overlap секунд раньше watermark:
+        строки на стыке приходят повторно, вызывающий склеивает их по "Ссылка".
+        Ошибки пробрасываются.
+        """
+        with self.engine.connect() as conn:
+            if watermark is None:
+                result = conn.execute(text("SELECT * FROM places ORDER BY updated_at"))
+            else:
                 result = conn.execute(
-                    text("SELECT * FROM places ORDER BY \"Ссылка\" DESC LIMIT :limit"),
-                    {"limit": limit}
+                    text("SELECT * FROM places WHERE updated_at > :since ORDER BY updated_at"),
+                    {"since": watermark - timedelta(seconds=overlap)}
                 )
-                return [dict(row._mapping) for row in result.fetchall()]
+            return [dict(row._mapping) for row in result.fetchall()]
+
+    def get_places_by_urls(self, urls: List[str]) -> List[Dict]:
+        """Возвращает места по списку ссылок (ошибки пробрасываются)"""
+        if not urls:
+            return []
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT * FROM places WHERE \"Ссылка\" = ANY(:urls)"),
+                {"urls": list(urls)}
+            )
+            return [dict(row._mapping) for row in result.fetchall()]
+    
+    def get_recent_places(self, limit: int = 10) -> List[Dict]:
+        """Возвращает последние добавленные места (по времени добавления, через кэш чтений)"""
+        try:
+            return read_cache.get(f"recent_places:{limit}", lambda: self._load_recent_places(limit))
         except Exception as e:
             logger.error(f"❌ Ошибка получения последних записей: {e}")
             return []
     
+    def _load_recent_places(self, limit: int) -> List[Dict]:
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT * FROM places ORDER BY created_at DESC, \"Ссылка\" LIMIT :limit"),
+                {"limit": limit}
+            )
+            return [dict(row._mapping) for row in result.fetchall()]
+    
     def force_sync_excel(self) -> bool:
         """Принудительная синхронизация с локальным Excel файлом"""
         try:
-            self._sync_with_local_excel()
-            return True
+            return excel_sync.flush(full=True)
         except Exception as e:
             logger.error(f"❌ Ошибка принудительной синхронизации: {e}")
             return False
+
+
+_shared_manager: Optional[DatabaseManager] = None
+_shared_lock = threading.Lock()
+
+
+def get_db_manager() -> DatabaseManager:
+    """
+    Общий DatabaseManager процесса. Создается при первом обращении, а не при
+    импорте: spawn-процессы повторно импортируют точку входа бота, и подключение,
+    миграции и синхронизация Excel в них не нужны.
+    """
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = DatabaseManager()
+        return _shared_manager
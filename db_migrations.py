@@ -0,0 +1,245 @@
+# db_migrations.py
+import logging
+from typing import Callable, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from opening_hours import DAYS_RU, hours_to_intervals, pack_intervals
+
+logger = logging.getLogger('ParserBot')
+
+# Ключ pg_advisory_lock: бот и админ-модуль создают DatabaseManager одновременно
+MIGRATIONS_LOCK_KEY = 7310425
+
+
+# Пустые значения при слиянии дублей (instagram исторически пишется как 'nan')
+_EMPTY_VALUES = ("", "nan")
+
+
+def _is_empty(value) -> bool:
+    # float('nan') != самому себе: таблица могла быть создана из pandas
+    return value is None or value != value or (isinstance(value, str) and value.strip() in _EMPTY_VALUES)
+
+
+def _merge_duplicates(rows: List[dict], columns: List[str]) -> Tuple[dict, List[str]]:
+    """
+    Дубли одной ссылки -> (значения для оставляемой строки, ctid удаляемых).
+    Остается строка с наибольшим числом заполненных полей; пустые поля
+    дополняются из остальных строк (ctid - физическое место, не свежесть).
+    """
+    def filled(row):
+        return sum(1 for column in columns if not _is_empty(row[column]))
+
+    keeper = max(rows, key=filled)
+    merged = {}
+    for column in columns:
+        value = keeper[column]
+        if _is_empty(value):
+            value = next((row[column] for row in rows if not _is_empty(row[column])), value)
+        merged[column] = value
+    return dict(merged, _ctid=keeper["_ctid"]), [row["_ctid"] for row in rows if row is not keeper]
+
+
+def _unique_link_index(conn: Connection):
+    """
+    Сливает дубли по "Ссылка" в одну строку и создает уникальный индекс.
+    Удаляемые строки сначала копируются в places_duplicates_backup,
+    ссылки с дублями пишутся в лог.
+    """
+    links = [row[0] for row in conn.execute(text("""
+        SELECT "Ссылка" FROM places
+        WHERE "Ссылка" IS NOT NULL
+        GROUP BY "Ссылка" HAVING COUNT(*) > 1
+    """))]
+    if links:
+        logger.warning(f"⚠️ Дубли по ссылке: {len(links)} ссылок: {', '.join(links[:20])}"
+                       + (" ..." if len(links) > 20 else ""))
+        result = conn.execute(
+            text('SELECT ctid::text AS _ctid, * FROM places WHERE "Ссылка" = ANY(:links)'),
+            {"links": links}
+        )
+        columns = [column for column in result.keys() if column != "_ctid"]
+        groups = {}
+        for row in result.mappings():
+            groups.setdefault(row["Ссылка"], []).append(dict(row))
+
+        conn.execute(text("CREATE TABLE IF NOT EXISTS places_duplicates_backup (LIKE places)"))
+        conn.execute(text(
+            "ALTER TABLE places_duplicates_backup "
+            "ADD COLUMN IF NOT EXISTS backed_up_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ))
+        assignments = ", ".join(f'"{column}" = :c{i}' for i, column in enumerate(columns))
+        update = text(f"UPDATE places SET {assignments} WHERE ctid = CAST(:_ctid AS tid)")
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        backup = text(
+            f"INSERT INTO places_duplicates_backup ({column_list}) "
+            f"SELECT {column_list} FROM places WHERE ctid = ANY(CAST(:ctids AS tid[]))"
+        )
+        removed = 0
+        for rows in groups.values():
+            merged, losers = _merge_duplicates(rows, columns)
+            conn.execute(backup, {"ctids": losers})
+            # Сначала удаляем остальные строки: ctid оставляемой после UPDATE меняется
+            conn.execute(text("DELETE FROM places WHERE ctid = ANY(CAST(:ctids AS tid[]))"), {"ctids": losers})
+            conn.execute(update, dict(
+                {f"c{i}": merged[column] for i, column in enumerate(columns)}, _ctid=merged["_ctid"]
+            ))
+            removed += len(losers)
+        logger.warning(f"⚠️ Дубли слиты: удалено {removed} строк (копии в places_duplicates_backup)")
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS places_link_uidx ON places ("Ссылка")'))
+
+
+# Выражения разбора текстовых колонок (те же правила, что parse_rating / parse_reviews_count)
+RATING_VALUE_SQL = r"""CASE WHEN trim("Рейтинг"::text) ~ '^[0-9]+([.,][0-9]+)?$'
+    THEN replace(trim("Рейтинг"::text), ',', '.')::numeric END"""
+REVIEWS_COUNT_SQL = r"""NULLIF(regexp_replace(substring("Отзывы"::text from '^\s*[0-9][0-9\s]*'), '\D', '', 'g'), '')::integer"""
+COORDINATE_SQL = r"""CASE WHEN trim({column}::text) ~ '^-?[0-9]+(\.[0-9]+)?$' THEN trim({column}::text)::double precision END"""
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _typed_numeric_columns(conn: Connection):
+    """
+    Числовые колонки рядом с текстовыми: rating_value, reviews_count, lat, lon.
+    Заполняются пачками по ссылке (каждая пачка - отдельная транзакция,
+    чтобы не держать блокировку всей таблицы), затем строятся индексы.
+    """
+    conn.execute(text("""
+        ALTER TABLE places
+            ADD COLUMN IF NOT EXISTS rating_value NUMERIC(3, 2),
+            ADD COLUMN IF NOT EXISTS reviews_count INTEGER,
+            ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION
+    """))
+    conn.commit()
+
+    backfill = text(f"""
+        WITH batch AS (
+            SELECT "Ссылка" FROM places
+            WHERE "Ссылка" > :after
+            ORDER BY "Ссылка"
+            LIMIT :limit
+        ), updated AS (
+            UPDATE places SET
+                rating_value = {RATING_VALUE_SQL},
+                reviews_count = {REVIEWS_COUNT_SQL},
+                lat = {COORDINATE_SQL.format(column='"Широта"')},
+                lon = {COORDINATE_SQL.format(column='"Долгота"')}
+            FROM batch
+            WHERE places."Ссылка" = batch."Ссылка"
+            RETURNING places."Ссылка"
+        )
+        -- Курсор считает PostgreSQL: max() по той же сортировке, что и ORDER BY пачки
+        SELECT count(*), max("Ссылка") FROM updated
+    """)
+    after, total = "", 0
+    while True:
+        count, last = conn.execute(backfill, {"after": after, "limit": BACKFILL_BATCH_SIZE}).one()
+        conn.commit()
+        if not count:
+            break
+        after = last
+        total += count
+    logger.info(f"🛠 Числовые колонки заполнены: {total} записей")
+
+    conn.execute(text("CREATE INDEX IF NOT EXISTS places_rating_value_idx ON places (rating_value DESC NULLS LAST)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS places_reviews_count_idx ON places (reviews_count DESC NULLS LAST)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS places_lat_lon_idx ON places (lat, lon)"))
+
+
+def _timestamps(conn: Connection):
+    """
+    created_at / updated_at. Существующие строки получают время миграции
+    (DEFAULT now() вычисляется один раз - ALTER без перезаписи таблицы).
+    Дальше их ведет upsert; индексы - для "последних" и выборки изменений.
+    """
+    conn.execute(text("""
+        ALTER TABLE places
+            ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS places_created_at_idx ON places (created_at DESC)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS places_updated_at_idx ON places (updated_at)"))
+
+
+def _hours_minutes(conn: Connection):
+    """
+    hours_minutes INTEGER[] - интервалы работы в минутах от начала недели
+    плоским массивом [начало, конец, ...]. Текст часов разбирается в Python
+    (те же правила, что при записи), обновление - пачками по ссылке.
+    """
+    conn.execute(text("ALTER TABLE places ADD COLUMN IF NOT EXISTS hours_minutes INTEGER[]"))
+    conn.commit()
+
+    select = text(f"""
+        SELECT "Ссылка", {", ".join(f'"{day}"' for day in DAYS_RU)} FROM places
+        WHERE "Ссылка" > :after
+        ORDER BY "Ссылка"
+        LIMIT :limit
+    """)
+    update = text('UPDATE places SET hours_minutes = :hours_minutes WHERE "Ссылка" = :url')
+    after, total = "", 0
+    while True:
+        rows = [dict(row._mapping) for row in conn.execute(select, {"after": after, "limit": BACKFILL_BATCH_SIZE})]
+        if not rows:
+            break
+        params = [
+            {"url": row["Ссылка"], "hours_minutes": pack_intervals(hours_to_intervals(row))}
+            for row in rows
+        ]
+        params = [item for item in params if item["hours_minutes"]]
+        if params:
+            conn.execute(update, params)
+        conn.commit()
+        after = rows[-1]["Ссылка"]
+        total += len(params)
+    logger.info(f"🛠 Интервалы часов работы заполнены: {total} записей")
+
+
+# (версия, описание, функция миграции); новые миграции - только в конец списка
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "уникальный индекс по ссылке", _unique_link_index),
+    (2, "числовые колонки рейтинга, отзывов и координат", _typed_numeric_columns),
+    (3, "created_at / updated_at", _timestamps),
+    (4, "часы работы интервалами в минутах", _hours_minutes),
+]
+
+
+def apply_migrations(engine: Engine) -> List[int]:
+    """
+    Применяет недостающие миграции по порядку, каждую в своей транзакции.
+    Возвращает список примененных версий; ошибка миграции пробрасывается.
+    """
+    applied = []
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+        conn.commit()
+
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        try:
+            done = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+            conn.commit()
+            for version, description, migrate in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info(f"🛠 Миграция {version}: {description}")
+                try:
+                    migrate(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                        {"version": version, "description": description}
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+            conn.commit()
+    return applied
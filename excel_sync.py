@@ -0,0 +1,198 @@
+# excel_sync.py
+import atexit
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+import pandas as pd
+from config import EXCEL_SYNC_DEBOUNCE, EXCEL_SYNC_MAX_DELAY
+from metrics import metrics
+
+logger = logging.getLogger('ParserBot')
+
+
+def write_excel_atomic(df: pd.DataFrame, path: Path):
+    """Пишет Excel во временный файл рядом и подменяет целиком: читатель не увидит половину файла"""
+    path = Path(path)
+    # Массив интервалов Excel не хранит; часы по дням остаются в колонках Пн..Вс
+    if "hours_minutes" in df.columns:
+        df = df.drop(columns=["hours_minutes"])
+    # Excel не хранит часовой пояс: created_at / updated_at пишутся в UTC без него
+    tz_columns = df.select_dtypes(include=["datetimetz"]).columns
+    if len(tz_columns):
+        df = df.copy()
+        for column in tz_columns:
+            df[column] = df[column].dt.tz_convert(None)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        df.to_excel(tmp_path, index=False, engine="openpyxl")
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class ExcelSyncService:
+    """
+    Отложенная синхронизация локального Excel основного бота.
+    Записи помечают измененные ссылки; фоновый поток ждет паузы
+    в записях (debounce, но не дольше max_delay) и одним проходом
+    подтягивает из PostgreSQL строки с updated_at после прошлой
+    синхронизации (в том числе записанные другими процессами) в копию
+    таблицы в памяти, после чего атомарно перезаписывает файл.
+    """
+
+    def __init__(self, debounce: float = EXCEL_SYNC_DEBOUNCE, max_delay: float = EXCEL_SYNC_MAX_DELAY):
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self._db = None
+        self._mirror: Optional[pd.DataFrame] = None
+        self._watermark = None
+        self._changed: Set[str] = set()
+        self._full = False
+        self._first_mark = 0.0
+        self._last_mark = 0.0
+
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        # Счетчики
+        self._marks = 0
+        self._flushes = 0
+        self._rows_synced = 0
+        self._last_flush_at = None
+        self._last_error = None
+
+    def attach(self, db_manager):
+        """Подключает DatabaseManager, через который читаются строки (первый побеждает)"""
+        with self._condition:
+            if self._db is None:
+                self._db = db_manager
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="excel-sync", daemon=True)
+            self._thread.start()
+
+    def mark_changed(self, links: Iterable[str]):
+        """Отмечает измененные ссылки; синхронизация произойдет после паузы"""
+        links = [link for link in links if link]
+        if not links:
+            return
+        self._schedule(links, full=False)
+
+    def request_full(self):
+        """Запрашивает полную перезапись файла из PostgreSQL"""
+        self._schedule([], full=True)
+
+    def _schedule(self, links, full: bool):
+        now = time.monotonic()
+        with self._condition:
+            if not self._changed and not self._full:
+                self._first_mark = now
+            self._last_mark = now
+            self._changed.update(links)
+            self._full = self._full or full
+            self._marks += 1
+            self._ensure_thread()
+            self._condition.notify()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._changed and not self._full:
+                    self._condition.wait()
+                now = time.monotonic()
+                wait = min(self._last_mark + self.debounce, self._first_mark + self.max_delay) - now
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+            self.flush()
+
+    def flush(self, full: bool = False) -> bool:
+        """Синхронизирует файл сейчас; возвращает успех"""
+        with self._flush_lock:
+            with self._condition:
+                changed, self._changed = self._changed, set()
+                # Без копии в памяти инкрементальное обновление невозможно
+                full = full or self._full or (bool(changed) and self._mirror is None)
+                self._full = False
+            if not changed and not full:
+                return True
+            if self._db is None:
+                logger.warning("⚠️ Синхронизация Excel: база данных не подключена")
+                return False
+
+            try:
+                with metrics.span("excel_sync"):
+                    rows = self._apply(changed, full)
+                self._flushes += 1
+                self._rows_synced += rows
+                self._last_flush_at = time.time()
+                self._last_error = None
+                return True
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"❌ Ошибка синхронизации с локальным Excel: {e}")
+                # Повторим после следующего окна ожидания
+                with self._condition:
+                    self._changed.update(changed)
+                    self._full = self._full or full
+                    self._first_mark = self._last_mark = time.monotonic()
+                return False
+
+    def _apply(self, changed: Set[str], full: bool) -> int:
+        path = self._db.local_excel_path
+        if full:
+            self._mirror = pd.DataFrame(self._db.get_changed_since(None))
+            rows = len(self._mirror)
+            if self._mirror.empty:
+                self._mirror = None
+                logger.warning("⚠️ Нет данных для синхронизации с Excel")
+                return 0
+            self._watermark = self._mirror["updated_at"].max()
+            self._mirror = self._mirror.sort_values("Ссылка", ignore_index=True)
+        else:
+            # Окно с перекрытием: строки на стыке придут повторно и заменят свои копии
+            fresh = pd.DataFrame(self._db.get_changed_since(self._watermark))
+            if fresh.empty:
+                return 0
+            self._watermark = max(self._watermark, fresh["updated_at"].max())
+            kept = self._mirror[~self._mirror["Ссылка"].isin(fresh["Ссылка"])]
+            self._mirror = pd.concat([kept, fresh], ignore_index=True).sort_values("Ссылка", ignore_index=True)
+            rows = len(fresh)
+
+        if path.exists():
+            logger.info(f"📊 Синхронизация с локальным Excel: {path}")
+        else:
+            logger.info(f"📊 Создание нового локального Excel файла: {path}")
+        write_excel_atomic(self._mirror, path)
+        logger.info(
+            f"✅ Локальный Excel файл обновлен: {len(self._mirror)} записей"
+            + ("" if full else f" (изменено {rows})")
+        )
+        return rows
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику синхронизации"""
+        with self._condition:
+            pending = len(self._changed)
+            full = self._full
+        return {
+            'pending': pending,
+            'full_pending': full,
+            'marks': self._marks,
+            'flushes': self._flushes,
+            'rows_synced': self._rows_synced,
+            'last_flush_at': self._last_flush_at,
+            'last_error': self._last_error,
+        }
+
+
+# Общий сервис синхронизации (один файл - один писатель)
+excel_sync = ExcelSyncService()
+atexit.register(excel_sync.flush)
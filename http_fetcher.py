@@ -0,0 +1,97 @@
+# http_fetcher.py
+import logging
+import threading
+from typing import Dict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES,
+    HTTP_PER_HOST_CONCURRENCY, HTTP_POOL_SIZE
+)
+
+logger = logging.getLogger('ParserBot')
+
+# Заголовки обычного браузера для быстрого метода
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2.1 Safari/605.1.15',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+    # br не указываем: без пакета brotli requests не сможет распаковать ответ
+    'Accept-Encoding': 'gzip, deflate',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class HttpFetcher:
+    """
+    Общая HTTP-сессия с пулом keep-alive соединений, cookies,
+    повторами и ограничением параллельных запросов к одному хосту.
+    """
+
+    def __init__(self, connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT,
+                 retries: int = HTTP_RETRIES, per_host_concurrency: int = HTTP_PER_HOST_CONCURRENCY,
+                 pool_size: int = HTTP_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._requests = 0
+        self._errors = 0
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            semaphore = self._host_limits.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_concurrency)
+                self._host_limits[host] = semaphore
+            return semaphore
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET через общую сессию с учетом лимита на хост"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._host_semaphore(url):
+            self._requests += 1
+            try:
+                return self.session.get(url, **kwargs)
+            except requests.RequestException:
+                self._errors += 1
+                raise
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику запросов"""
+        return {
+            'requests': self._requests,
+            'errors': self._errors,
+            'hosts': len(self._host_limits),
+            'cookies': len(self.session.cookies),
+        }
+
+    def close(self):
+        """Закрывает сессию и все соединения"""
+        self.session.close()
+
+
+# Общий клиент для парсеров
+fetcher = HttpFetcher()
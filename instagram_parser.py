@@ -10,6 +10,24 @@ from logger import setup_logger
 
 logger = setup_logger()
 
+# Типографские кавычки -> обычные
+QUOTES_TABLE = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u2032": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u00ab": '"', "\u00bb": '"',
+})
+
+def normalize_name(name) -> str:
+    """Нормализует название для сравнения (ё, кавычки, дефисы, пробелы)"""
+    if not isinstance(name, str):
+        name = "" if pd.isna(name) else str(name)
+    s = name.strip().lower()
+    s = s.replace("ё", "е")
+    # унифицируем кавычки/дефисы/многопробелье
+    s = s.translate(QUOTES_TABLE)
+    s = re.sub(r"[-‐‑‒–—―]+", "-", s)
+    s = re.sub(r"\s+", " ", s)
+    return s
+
 class InstagramParser:
     def __init__(self, data_dir: str = "/Users/ivan/Desktop/EatSpot_Bot_git/data"):
         self.data_dir = Path(data_dir)
@@ -25,15 +43,7 @@ class InstagramParser:
     
     def normalize_name(self, name: str) -> str:
         """Нормализует название для сравнения"""
-        if not isinstance(name, str):
-            name = "" if pd.isna(name) else str(name)
-        s = name.strip().lower()
-        s = s.replace("ё", "е")
-        # унифицируем кавычки/дефисы/многопробелье
-        s = s.replace("'", "'").replace("'", "'").replace(""", '"').replace(""", '"')
-        s = re.sub(r"[-–—]+", "-", s)
-        s = re.sub(r"\s+", " ", s)
-        return s
+        return normalize_name(name)
     
     def load_blacklist(self) -> Set[str]:
         """Загружает чёрный список из файла"""
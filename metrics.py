@@ -0,0 +1,181 @@
+# metrics.py
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from config import METRICS_WINDOW, METRICS_SLOW_TRACE_SECONDS, METRICS_HTTP_HOST, METRICS_HTTP_PORT
+
+logger = logging.getLogger('ParserBot')
+
+# Трасса текущего запроса; наследуется задачами asyncio и (через copy_context) потоками
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("metrics_trace", default=None)
+
+
+class Histogram:
+    """Окно последних длительностей этапа и общие счетчики"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float, error: bool = False):
+        with self._lock:
+            self._values.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if error:
+                self.errors += 1
+
+    def percentiles(self, *pcts: float) -> List[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return [0.0 for _ in pcts]
+        return [values[min(len(values) - 1, int(len(values) * pct / 100))] for pct in pcts]
+
+    def snapshot(self) -> Dict:
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.count * 100, 1) if self.count else 0,
+            'sum': round(self.total, 3),
+            'p50': round(p50, 3),
+            'p95': round(p95, 3),
+            'p99': round(p99, 3),
+        }
+
+
+class Trace:
+    """Этапы одного запроса: (этап, длительность, ошибка)"""
+
+    def __init__(self, name: str, label: str = ""):
+        self.name = name
+        self.label = label
+        self.spans: List[tuple] = []
+        self.started = time.monotonic()
+        self.error = False
+        self._token = None
+
+    def format(self) -> str:
+        return ", ".join(f"{stage} {seconds:.2f} с{' ❌' if error else ''}" for stage, seconds, error in self.spans)
+
+
+class Metrics:
+    """Реестр гистограмм по этапам обработки"""
+
+    def __init__(self, slow_trace_seconds: float = METRICS_SLOW_TRACE_SECONDS):
+        self.slow_trace_seconds = slow_trace_seconds
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._slow_traces = 0
+
+    def _histogram(self, name: str) -> Histogram:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            return histogram
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        """Учитывает длительность этапа (и добавляет ее в текущую трассу)"""
+        self._histogram(name).observe(seconds, error)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, seconds, error))
+
+    @contextmanager
+    def span(self, name: str):
+        """Замеряет время блока как этап name"""
+        started = time.monotonic()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.monotonic() - started, error)
+
+    def start_trace(self, name: str, label: str = "") -> Trace:
+        """
+        Начинает трассу запроса: все этапы до finish_trace попадают в нее,
+        в том числе выполненные в очереди парсинга.
+        """
+        trace = Trace(name, label)
+        trace._token = _current_trace.set(trace)
+        return trace
+
+    def finish_trace(self, trace: Trace):
+        """Завершает трассу: общее время - в гистограмму, медленные трассы - в лог"""
+        _current_trace.reset(trace._token)
+        elapsed = time.monotonic() - trace.started
+        self._histogram(trace.name).observe(elapsed, trace.error)
+        if elapsed >= self.slow_trace_seconds:
+            self._slow_traces += 1
+            logger.warning(f"🐢 Медленный запрос {trace.name} {trace.label} ({elapsed:.2f} с): {trace.format()}")
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Снимок всех гистограмм"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
+
+    @property
+    def slow_traces(self) -> int:
+        return self._slow_traces
+
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP parser_stage_seconds Длительность этапов обработки",
+            "# TYPE parser_stage_seconds summary",
+        ]
+        errors = ["# TYPE parser_stage_errors_total counter"]
+        for name, stats in self.get_stats().items():
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'parser_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'parser_stage_seconds_sum{{stage="{name}"}} {stats["sum"]}')
+            lines.append(f'parser_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            errors.append(f'parser_stage_errors_total{{stage="{name}"}} {stats["errors"]}')
+        lines.extend(errors)
+        lines.append("# TYPE parser_slow_traces_total counter")
+        lines.append(f"parser_slow_traces_total {self._slow_traces}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str = METRICS_HTTP_HOST, port: Optional[int] = METRICS_HTTP_PORT) -> Optional[ThreadingHTTPServer]:
+    """Запускает локальный HTTP /metrics в фоновом потоке (если задан порт)"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+    return server
+
+
+# Общий реестр метрик
+metrics = Metrics()
@@ -0,0 +1,301 @@
+# opening_hours.py
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import numpy as np
+from config import HOURS_TIMEZONE
+
+logger = logging.getLogger('ParserBot')
+
+# Дни недели по порядку: openingHours (schema.org) и колонки таблицы places
+DAYS_EN = ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")
+DAYS_RU = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# "Mo-Th 18:00-02:00", "Fr,Sa 18:00-06:00", "Mo-Fr,Su 10:00-22:00"; без дней - "24/7", "00:00-24:00"
+_SPEC_RE = re.compile(r"^\s*(?:([A-Za-z]{2}(?:\s*[-,]\s*[A-Za-z]{2})*)\s+)?(.+?)\s*$")
+_TIME_RANGE_RE = re.compile(r"(\d{1,2})[:.](\d{2})\s*[-–—]\s*(\d{1,2})[:.](\d{2})")
+_ALL_DAY_MARKERS = ("круглосуточно", "24/7", "24 часа")
+
+# Перестраивать массивы, когда мертвых слотов больше этой доли
+COMPACT_RATIO = 0.2
+
+
+def _day_index(token: str) -> Optional[int]:
+    token = token.strip().capitalize()
+    return DAYS_EN.index(token) if token in DAYS_EN else None
+
+
+def parse_opening_hours_spec(content: str) -> Dict[str, str]:
+    """
+    Значение meta openingHours -> {день: время}.
+    'Mo-Th 18:00-02:00' -> {'Пн': '18:00-02:00', ..., 'Чт': '18:00-02:00'};
+    'Fr,Sa 18:00-06:00' -> {'Пт': ..., 'Сб': ...}; 'Sa-Mo' переходит через неделю.
+    Правило без дней ('24/7', '00:00-24:00') относится ко всем дням недели.
+    Несколько правил через ';' разбираются по очереди.
+    """
+    hours = {}
+    for rule in (content or "").split(";"):
+        match = _SPEC_RE.match(rule)
+        if not match:
+            continue
+        days_part, time_range = match.groups()
+        if days_part is None:
+            # Без дней принимаем только то, что похоже на часы работы
+            if not _day_intervals(time_range):
+                continue
+            days_part = f"{DAYS_EN[0]}-{DAYS_EN[-1]}"
+        for item in days_part.split(","):
+            bounds = [_day_index(token) for token in item.split("-")]
+            if None in bounds or len(bounds) > 2:
+                continue
+            first, last = bounds[0], bounds[-1]
+            for offset in range((last - first) % 7 + 1):
+                hours[DAYS_RU[(first + offset) % 7]] = time_range
+    return hours
+
+
+def _day_intervals(value: str) -> List[Tuple[int, int]]:
+    """'10:00-14:00, 15:00-01:00' -> [(600, 840), (900, 1500)] в минутах от начала дня"""
+    text = value.strip().lower()
+    if any(marker in text for marker in _ALL_DAY_MARKERS):
+        return [(0, MINUTES_PER_DAY)]
+    intervals = []
+    for h1, m1, h2, m2 in _TIME_RANGE_RE.findall(text):
+        start, end = int(h1) * 60 + int(m1), int(h2) * 60 + int(m2)
+        if start >= MINUTES_PER_DAY or end > MINUTES_PER_DAY:
+            continue
+        # Конец не позже начала - работа после полуночи ('18:00-02:00', '00:00-00:00')
+        if end <= start:
+            end += MINUTES_PER_DAY
+        intervals.append((start, end))
+    return intervals
+
+
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Сортирует и склеивает пересекающиеся и смежные интервалы"""
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def hours_to_intervals(hours: Dict[str, Optional[str]]) -> List[Tuple[int, int]]:
+    """
+    Часы по дням -> интервалы в минутах от начала недели (Пн 00:00 = 0).
+    Ночь с воскресенья на понедельник переносится в начало недели.
+    """
+    intervals = []
+    for day, column in enumerate(DAYS_RU):
+        value = (hours or {}).get(column)
+        if not value or not isinstance(value, str):
+            continue
+        base = day * MINUTES_PER_DAY
+        for start, end in _day_intervals(value):
+            start, end = base + start, base + end
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+    return merge_intervals(intervals)
+
+
+def pack_intervals(intervals: List[Tuple[int, int]]) -> Optional[List[int]]:
+    """[(s0, e0), (s1, e1)] -> [s0, e0, s1, e1] для колонки hours_minutes (нет часов - None)"""
+    return [minute for interval in intervals for minute in interval] or None
+
+
+def unpack_intervals(packed: Optional[List[int]]) -> List[Tuple[int, int]]:
+    packed = packed or []
+    return list(zip(packed[0::2], packed[1::2]))
+
+
+def week_minute(when: Optional[datetime] = None, tz: str = HOURS_TIMEZONE) -> int:
+    """Минута недели по местному времени мест (без часового пояса - уже местное)"""
+    zone = ZoneInfo(tz)
+    if when is None:
+        when = datetime.now(zone)
+    elif when.tzinfo is not None:
+        when = when.astimezone(zone)
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+class OpeningHoursIndex:
+    """
+    Интервалы работы всех мест в плоских массивах NumPy (начало, конец,
+    слот места). "Открыто в момент T" - одно векторное сравнение по всем
+    интервалам вместо разбора строк часов по каждой записи. Обновленное
+    место получает новый слот, старый помечается мертвым; при накоплении
+    мертвых слотов массивы перестраиваются.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._loaded_at = None
+
+        # Записи, пришедшие во время полной загрузки (применяются поверх нее)
+        self._loading = False
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+
+        # Счетчики
+        self._queries = 0
+        self._query_time = 0.0
+        self._compactions = 0
+
+    def _reset(self, capacity: int = 4096):
+        self._starts = np.zeros(capacity, dtype=np.int32)
+        self._ends = np.zeros(capacity, dtype=np.int32)
+        self._owners = np.zeros(capacity, dtype=np.int32)
+        self._size = 0
+        self._urls: List[str] = []
+        self._alive = np.zeros(1024, dtype=bool)
+        self._slot_of: Dict[str, int] = {}
+        self._intervals_of: Dict[str, List[Tuple[int, int]]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def _put(self, url: str, intervals: List[Tuple[int, int]]):
+        old = self._slot_of.pop(url, None)
+        if old is not None:
+            self._alive[old] = False
+        self._intervals_of.pop(url, None)
+        if not intervals:
+            return
+
+        slot = len(self._urls)
+        if slot == len(self._alive):
+            self._alive = np.resize(self._alive, slot * 2)
+        self._urls.append(url)
+        self._alive[slot] = True
+        self._slot_of[url] = slot
+        self._intervals_of[url] = intervals
+
+        needed = self._size + len(intervals)
+        if needed > len(self._starts):
+            capacity = max(needed, len(self._starts) * 2)
+            self._starts = np.resize(self._starts, capacity)
+            self._ends = np.resize(self._ends, capacity)
+            self._owners = np.resize(self._owners, capacity)
+        for start, end in intervals:
+            self._starts[self._size], self._ends[self._size] = start, end
+            self._owners[self._size] = slot
+            self._size += 1
+
+    def _swap(self, fresh: "OpeningHoursIndex"):
+        for name in ("_starts", "_ends", "_owners", "_size", "_urls", "_alive", "_slot_of", "_intervals_of"):
+            setattr(self, name, getattr(fresh, name))
+
+    def _build(self, items: Iterable[Tuple[str, List[Tuple[int, int]]]]) -> "OpeningHoursIndex":
+        fresh = OpeningHoursIndex()
+        for url, intervals in items:
+            fresh._put(url, intervals)
+        return fresh
+
+    # ===== Наполнение =====
+
+    def load(self, db_manager):
+        """Полная загрузка интервалов из базы (запросы продолжают работать по старому индексу)"""
+        with self._lock:
+            self._loading = True
+            self._pending = {}
+        try:
+            fresh = self._build(
+                (row["Ссылка"], unpack_intervals(row["hours_minutes"]))
+                for row in db_manager.get_hours_documents()
+            )
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        with self._lock:
+            self._swap(fresh)
+            pending, self._pending, self._loading = self._pending, {}, False
+            for url, intervals in pending.items():
+                self._put(url, intervals)
+            self._loaded_at = time.time()
+        logger.info(f"🕒 Индекс часов работы загружен: {len(self._slot_of)} мест")
+
+    def upsert(self, url: str, data: Dict):
+        """Обновляет часы места по результату парсинга"""
+        if not url:
+            return
+        intervals = hours_to_intervals(data.get('hours') or {})
+        with self._lock:
+            if self._loading:
+                self._pending[url] = intervals
+            self._put(url, intervals)
+            dead = len(self._urls) - len(self._slot_of)
+            if dead > max(1000, COMPACT_RATIO * len(self._urls)):
+                self._swap(self._build(list(self._intervals_of.items())))
+                self._compactions += 1
+
+    def upsert_many(self, items: Iterable[Tuple[str, Dict]]):
+        for url, data in items:
+            self.upsert(url, data)
+
+    # ===== Запросы =====
+
+    def _open_mask(self, minute: int) -> np.ndarray:
+        """Маска открытых слотов: интервалы сравниваются векторно, слоты - через bincount"""
+        size = self._size
+        hits = (self._starts[:size] <= minute) & (minute < self._ends[:size])
+        slots = len(self._urls)
+        mask = np.bincount(self._owners[:size][hits], minlength=slots).astype(bool)
+        return mask & self._alive[:slots]
+
+    def open_at(self, when: Optional[datetime] = None) -> List[str]:
+        """Ссылки мест, открытых в момент when (по умолчанию - сейчас)"""
+        minute = week_minute(when)
+        started = time.perf_counter()
+        with self._lock:
+            result = [self._urls[slot] for slot in np.flatnonzero(self._open_mask(minute))]
+        self._queries += 1
+        self._query_time += time.perf_counter() - started
+        return result
+
+    def count_open(self, when: Optional[datetime] = None) -> int:
+        """Сколько мест открыто в момент when"""
+        minute = week_minute(when)
+        started = time.perf_counter()
+        with self._lock:
+            count = int(np.count_nonzero(self._open_mask(minute)))
+        self._queries += 1
+        self._query_time += time.perf_counter() - started
+        return count
+
+    def is_open(self, url: str, when: Optional[datetime] = None) -> Optional[bool]:
+        """Открыто ли место в момент when; None - часы неизвестны"""
+        intervals = self._intervals_of.get(url)
+        if not intervals:
+            return None
+        minute = week_minute(when)
+        return any(start <= minute < end for start, end in intervals)
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику индекса"""
+        with self._lock:
+            return {
+                'places': len(self._slot_of),
+                'intervals': self._size,
+                'compactions': self._compactions,
+                'queries': self._queries,
+                'avg_query_ms': round(self._query_time / self._queries * 1000, 3) if self._queries else 0.0,
+                'loaded_at': self._loaded_at,
+            }
+
+
+# Общий индекс часов работы: наполняется при запуске бота и при каждой записи места
+opening_index = OpeningHoursIndex()
@@ -0,0 +1,140 @@
+# page_archive.py
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import PAGE_ARCHIVE_ENABLED, PAGE_ARCHIVE_DIR, REEXTRACT_WORKERS
+from place_cache import get_org_id, result_cache
+from reextract_worker import extract_pages
+
+logger = logging.getLogger('ParserBot')
+
+
+class PageArchive:
+    """
+    Архив загруженных страниц: тела сжаты gzip и лежат по sha256
+    (одинаковые страницы хранятся один раз), индекс в SQLite -
+    по ID организации, ссылке и времени загрузки.
+    """
+
+    def __init__(self, root: Path = PAGE_ARCHIVE_DIR):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.sqlite3"
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    org_id TEXT,
+                    url TEXT NOT NULL,
+                    final_url TEXT,
+                    sha256 TEXT NOT NULL,
+                    method TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_org_idx ON pages (org_id, fetched_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_url_idx ON pages (url, fetched_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / f"{sha256}.html.gz"
+
+    def store(self, url: str, page_html: str, final_url: str = None, method: str = None) -> Optional[str]:
+        """Сохраняет страницу, возвращает ее sha256 (None при ошибке)"""
+        try:
+            body = page_html.encode("utf-8")
+            sha256 = hashlib.sha256(body).hexdigest()
+            path = self.object_path(sha256)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(gzip.compress(body, compresslevel=6))
+                os.replace(tmp_path, path)
+
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO pages (org_id, url, final_url, sha256, method, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (get_org_id(final_url or url) or get_org_id(url), url, final_url, sha256, method, time.time())
+                )
+            return sha256
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить страницу в архив: {e}")
+            return None
+
+    def load(self, sha256: str) -> str:
+        """Возвращает HTML страницы по хэшу"""
+        with gzip.open(self.object_path(sha256), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def latest_pages(self) -> List[Tuple[str, str, str]]:
+        """Последняя сохраненная страница каждой ссылки: (url, final_url, sha256)"""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT p.url, p.final_url, p.sha256
+                FROM pages p
+                JOIN (SELECT url, MAX(fetched_at) AS fetched_at FROM pages GROUP BY url) latest
+                  ON latest.url = p.url AND latest.fetched_at = p.fetched_at
+            """).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику архива"""
+        with self._connect() as conn:
+            pages, links, objects = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT url), COUNT(DISTINCT sha256) FROM pages"
+            ).fetchone()
+        size = sum(path.stat().st_size for path in self.objects_dir.glob("*/*.html.gz"))
+        return {
+            'pages': pages,
+            'links': links,
+            'objects': objects,
+            'size_mb': round(size / 1024 / 1024, 1),
+        }
+
+
+def reextract_archive(db_manager, archive: "PageArchive" = None, workers: int = REEXTRACT_WORKERS) -> Dict:
+    """
+    Заново извлекает данные из архивных страниц на всех ядрах и
+    обновляет places одной пакетной записью, без сетевых запросов.
+    """
+    archive = archive or page_archive
+    started = time.monotonic()
+    jobs = [(url, final_url, str(archive.object_path(sha256)))
+            for url, final_url, sha256 in archive.latest_pages()]
+
+    extracted = list(extract_pages(jobs, workers))
+
+    inserted, updated = db_manager.upsert_many(extracted)
+
+    # Кэш хранит результаты старого извлечения
+    for url, _ in extracted:
+        org_id = get_org_id(url)
+        if org_id:
+            result_cache.invalidate(org_id)
+
+    stats = {
+        'pages': len(jobs),
+        'extracted': len(extracted),
+        'skipped': len(jobs) - len(extracted),
+        'inserted': inserted,
+        'updated': updated,
+        'seconds': round(time.monotonic() - started, 1),
+    }
+    logger.info(f"♻️ Повторное извлечение из архива: {stats}")
+    return stats
+
+
+# Общий архив страниц (None - архивирование отключено)
+page_archive = PageArchive() if PAGE_ARCHIVE_ENABLED else None
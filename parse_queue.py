@@ -0,0 +1,161 @@
+# parse_queue.py
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict
+from config import PARSE_WORKERS, PARSE_QUEUE_MAX_SIZE, PARSE_USE_PROCESSES
+from metrics import metrics
+
+logger = logging.getLogger('ParserBot')
+
+
+class ParseQueueFull(Exception):
+    """Очередь парсинга переполнена"""
+
+
+class ParseJob:
+    """Задание в очереди парсинга"""
+
+    def __init__(self, position: int, task: asyncio.Task):
+        # 0 - задание сразу взято в работу, N - номер в очереди ожидания
+        self.position = position
+        self.task = task
+
+    async def result(self):
+        """Ожидает завершения задания и возвращает результат"""
+        return await self.task
+
+
+class ParseQueue:
+    """
+    Ограниченная очередь блокирующих заданий (парсинг, запись в БД).
+    Задания выполняются в пуле потоков или процессов и не блокируют event loop.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS, max_size: int = PARSE_QUEUE_MAX_SIZE,
+                 use_processes: bool = PARSE_USE_PROCESSES):
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.use_processes = use_processes
+
+        self._executor = None
+        self._io_executor = None
+        self._semaphore = None
+
+        # Счетчики состояния
+        self._waiting = 0
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+
+    def _get_executor(self):
+        """Лениво создает пул исполнителей"""
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        return self._executor
+
+    def _get_io_executor(self):
+        """Пул потоков для заданий, которые нельзя передать в процесс (БД, файлы)"""
+        if not self.use_processes:
+            return self._get_executor()
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse-io")
+        return self._io_executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    @property
+    def depth(self) -> int:
+        """Количество заданий, ожидающих свободного исполнителя"""
+        return self._waiting
+
+    def submit(self, func: Callable, *args, io_bound: bool = False) -> ParseJob:
+        """
+        Ставит задание в очередь и сразу возвращает ParseJob с позицией.
+        io_bound=True - задание всегда выполняется в потоке (нужно для объектов,
+        которые нельзя передать в процесс, например DatabaseManager).
+        """
+        if self._waiting + self._running >= self.workers + self.max_size:
+            self._rejected += 1
+            logger.warning(f"⚠️ Очередь парсинга переполнена: {self._waiting} в ожидании")
+            raise ParseQueueFull(f"Очередь переполнена ({self.max_size} заданий в ожидании)")
+
+        ahead = self._waiting + self._running
+        position = ahead - self.workers + 1 if ahead >= self.workers else 0
+        self._waiting += 1
+
+        task = asyncio.ensure_future(self._run(func, args, io_bound))
+        return ParseJob(position, task)
+
+    async def run(self, func: Callable, *args, io_bound: bool = False):
+        """Ставит задание в очередь и ожидает результат"""
+        return await self.submit(func, *args, io_bound=io_bound).result()
+
+    async def _run(self, func: Callable, args: tuple, io_bound: bool):
+        enqueued_at = time.monotonic()
+        async with self._get_semaphore():
+            self._waiting -= 1
+            self._running += 1
+            started_at = time.monotonic()
+            self._wait_times.append(started_at - enqueued_at)
+            metrics.observe("queue_wait", started_at - enqueued_at)
+
+            executor = self._get_io_executor() if io_bound else self._get_executor()
+            loop = asyncio.get_running_loop()
+            try:
+                if isinstance(executor, ProcessPoolExecutor):
+                    result = await loop.run_in_executor(executor, func, *args)
+                else:
+                    # Передаем в поток контекст задания, чтобы этапы попали в трассу запроса
+                    context = contextvars.copy_context()
+                    result = await loop.run_in_executor(executor, context.run, func, *args)
+                self._processed += 1
+                return result
+            except Exception:
+                self._failed += 1
+                raise
+            finally:
+                self._running -= 1
+                self._run_times.append(time.monotonic() - started_at)
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику очереди"""
+        wait_times = list(self._wait_times)
+        run_times = list(self._run_times)
+        return {
+            'workers': self.workers,
+            'mode': 'processes' if self.use_processes else 'threads',
+            'waiting': self._waiting,
+            'running': self._running,
+            'max_size': self.max_size,
+            'processed': self._processed,
+            'failed': self._failed,
+            'rejected': self._rejected,
+            'avg_wait': round(sum(wait_times) / len(wait_times), 2) if wait_times else 0,
+            'max_wait': round(max(wait_times), 2) if wait_times else 0,
+            'avg_run': round(sum(run_times) / len(run_times), 2) if run_times else 0,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Останавливает пулы исполнителей"""
+        for executor in (self._executor, self._io_executor):
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        self._executor = None
+        self._io_executor = None
+
+
+# Общая очередь для обработчиков бота
+parse_queue = ParseQueue()
@@ -0,0 +1,155 @@
+# place_cache.py
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from config import RESULT_CACHE_TTL, RESULT_CACHE_MAX_SIZE, RESULT_CACHE_DIR
+
+logger = logging.getLogger('ParserBot')
+
+# /maps/org/<slug>/<id>/, /maps/org/<id>/ или /maps/<город>/org/<slug>/<id>/
+ORG_ID_PATTERN = re.compile(r"/org/(?:[^/?#]+/)?(\d+)")
+
+
+def get_org_id(url: str) -> Optional[str]:
+    """Возвращает числовой ID организации из ссылки Яндекс.Карт"""
+    if not url:
+        return None
+    match = ORG_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def _copy_result(data: Dict) -> Dict:
+    """Копия результата без служебных ключей (_timings и т.п.); ссылка, по которой он сохранен, остается"""
+    result = {key: value for key, value in data.items() if not key.startswith("_") or key == "_source_url"}
+    result["hours"] = dict(data.get("hours") or {})
+    if result.get("coordinates") is not None:
+        result["coordinates"] = tuple(result["coordinates"])
+    return result
+
+
+class ResultCache:
+    """
+    TTL-кэш результатов парсинга по ID организации:
+    LRU в памяти и (опционально) JSON-файлы на диске.
+    """
+
+    def __init__(self, ttl: int = RESULT_CACHE_TTL, max_size: int = RESULT_CACHE_MAX_SIZE,
+                 disk_dir: Optional[Path] = RESULT_CACHE_DIR):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        return self.disk_dir / f"{key}.json" if self.disk_dir else None
+
+    def _remember(self, key: str, expires_at: float, data: Dict):
+        with self._lock:
+            self._memory[key] = (expires_at, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Возвращает копию результата или None, если его нет или он устарел"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return _copy_result(data)
+                del self._memory[key]
+
+        path = self._disk_path(key)
+        if path and path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry["expires_at"] > now:
+                    data = _copy_result(entry["data"])
+                    self._remember(key, entry["expires_at"], data)
+                    self._disk_hits += 1
+                    return _copy_result(data)
+                path.unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось прочитать кэш {path.name}: {e}")
+
+        self._misses += 1
+        return None
+
+    def set(self, key: str, data: Dict, url: Optional[str] = None):
+        """Сохраняет результат в кэш (url - ссылка, под которой результат пишется в базу)"""
+        expires_at = time.time() + self.ttl
+        data = _copy_result(data)
+        if url:
+            data["_source_url"] = url
+        self._remember(key, expires_at, data)
+
+        path = self._disk_path(key)
+        if path:
+            try:
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": expires_at, "data": data}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось записать кэш {path.name}: {e}")
+
+    def invalidate(self, key: str):
+        """Удаляет результат из кэша"""
+        with self._lock:
+            self._memory.pop(key, None)
+        path = self._disk_path(key)
+        if path:
+            path.unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику кэша"""
+        lookups = self._hits + self._disk_hits + self._misses
+        return {
+            'size': len(self._memory),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self._hits,
+            'disk_hits': self._disk_hits,
+            'misses': self._misses,
+            'hit_rate': round((self._hits + self._disk_hits) / lookups * 100, 1) if lookups else 0,
+        }
+
+
+# Общий кэш результатов парсинга
+result_cache = ResultCache()
+
+
+def is_stored_for_url(data: Dict, url: str) -> bool:
+    """
+    Результат из кэша, сохраненный по этой же ссылке: строка с ней в базе уже есть.
+    Кэш общий для всех ссылок организации (/org/123 и /org/name/123) -
+    для другой ссылки запись все равно нужна.
+    """
+    return bool(data.get("_cached")) and data.get("_source_url") == url
+
+
+def invalidate_cached_result(url: str):
+    """Удаляет из кэша результат для организации из ссылки"""
+    org_id = get_org_id(url)
+    if org_id:
+        result_cache.invalidate(org_id)
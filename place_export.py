@@ -0,0 +1,194 @@
+# place_export.py
+import csv
+import gzip
+import io
+import json
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import text
+from config import EXPORT_CHUNK_SIZE, EXPORT_MAX_PART_SIZE, EXPORT_SPOOL_MAX_MEMORY
+from metrics import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet - опционально
+    pa = pq = None
+
+logger = logging.getLogger('ParserBot')
+
+# Parquet доступен только при установленном pyarrow
+EXPORT_FORMATS = ("csv", "jsonl", "parquet") if pq is not None else ("csv", "jsonl")
+
+
+def iter_place_chunks(engine, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """
+    Читает places серверным курсором пачками по chunk_size строк:
+    в памяти не больше одной пачки при любом размере таблицы
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+            text("SELECT * FROM places ORDER BY \"Ссылка\"")
+        )
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+
+@dataclass
+class ExportPart:
+    """Часть экспорта: файл во временном буфере (в памяти до EXPORT_SPOOL_MAX_MEMORY, дальше на диске)"""
+    filename: str
+    buffer: SpooledTemporaryFile
+    rows: int
+    size: int
+
+    def close(self):
+        self.buffer.close()
+
+
+class _GzipTextPart:
+    """Общая часть CSV и JSON Lines: текст -> gzip -> буфер"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._gzip = gzip.GzipFile(fileobj=buffer, mode="wb")
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+
+    def size(self) -> int:
+        # Сжатые данные, уже ушедшие в буфер (zlib держит у себя немного)
+        return self.buffer.tell()
+
+    def finish(self):
+        self._text.flush()
+        self._text.detach()
+        self._gzip.close()
+
+
+class _CsvPart(_GzipTextPart):
+    def __init__(self, buffer):
+        super().__init__(buffer)
+        self._writer = None
+
+    def write(self, rows: List[Dict]):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._text, fieldnames=list(rows[0]))
+            self._writer.writeheader()
+        self._writer.writerows(rows)
+
+
+class _JsonlPart(_GzipTextPart):
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            self._text.write(json.dumps(row, ensure_ascii=False, default=str))
+            self._text.write("\n")
+
+
+class _ParquetPart:
+    """Пачки пишутся отдельными row group; схема - по первой пачке"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._writer = None
+        self._text_columns: List[str] = []
+
+    def write(self, rows: List[Dict]):
+        if self._writer is None:
+            schema = pa.Table.from_pylist(rows).schema
+            # Полностью пустые в первой пачке колонки иначе получат тип null
+            self._text_columns = [field.name for field in schema if pa.types.is_null(field.type)]
+            for name in self._text_columns:
+                schema = schema.set(schema.get_field_index(name), pa.field(name, pa.string()))
+            self._writer = pq.ParquetWriter(self.buffer, schema, compression="zstd")
+        for name in self._text_columns:
+            for row in rows:
+                if row[name] is not None:
+                    row[name] = str(row[name])
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self._writer.schema))
+
+    def size(self) -> int:
+        return self.buffer.tell()
+
+    def finish(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_PART_WRITERS = {
+    "csv": (_CsvPart, "csv.gz"),
+    "jsonl": (_JsonlPart, "jsonl.gz"),
+    "parquet": (_ParquetPart, "parquet"),
+}
+
+
+def export_places(engine, fmt: str = "csv", max_part_size: int = EXPORT_MAX_PART_SIZE,
+                  chunk_size: int = EXPORT_CHUNK_SIZE, basename: Optional[str] = None) -> List[ExportPart]:
+    """
+    Потоковый экспорт places в gzip CSV, gzip JSON Lines или Parquet.
+    Новая часть начинается, когда текущая превысила max_part_size
+    (с запасом под лимит документа Telegram). Буферы закрывает вызывающий.
+    """
+    if fmt == "parquet" and pq is None:
+        raise ValueError("Для Parquet нужен пакет pyarrow")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt} (доступны: {', '.join(EXPORT_FORMATS)})")
+
+    writer_class, extension = _PART_WRITERS[fmt]
+    basename = basename or f"places_export_{time.strftime('%Y%m%d_%H%M%S')}"
+    parts: List[ExportPart] = []
+    current = None
+    rows_in_part = 0
+
+    def close_current():
+        current.finish()
+        size = current.buffer.tell()
+        current.buffer.seek(0)
+        parts.append(ExportPart(f"{basename}_part{len(parts) + 1}.{extension}", current.buffer, rows_in_part, size))
+
+    try:
+        with metrics.span("export"):
+            for rows in iter_place_chunks(engine, chunk_size):
+                if current is None:
+                    current = writer_class(SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MEMORY))
+                    rows_in_part = 0
+                current.write(rows)
+                rows_in_part += len(rows)
+                if current.size() >= max_part_size:
+                    close_current()
+                    current = None
+            if current is not None:
+                close_current()
+    except Exception:
+        for part in parts:
+            part.close()
+        if current is not None:
+            current.buffer.close()
+        raise
+
+    # Одна часть - без суффикса _part1
+    if len(parts) == 1:
+        parts[0].filename = f"{basename}.{extension}"
+    logger.info(f"📤 Экспорт {fmt}: {sum(part.rows for part in parts)} записей, частей: {len(parts)}")
+    return parts
+
+
+def write_export_files(engine, directory: Path, basename: str, fmt: str = "csv") -> List[Tuple[Path, int]]:
+    """Экспорт в файлы каталога directory; возвращает [(путь, записей)]"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = []
+    parts = export_places(engine, fmt, basename=basename)
+    try:
+        for part in parts:
+            path = directory / part.filename
+            with open(path, "wb") as f:
+                shutil.copyfileobj(part.buffer, f)
+            files.append((path, part.rows))
+    finally:
+        for part in parts:
+            part.close()
+    return files
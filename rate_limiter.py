@@ -0,0 +1,69 @@
+# rate_limiter.py
+import asyncio
+import threading
+import time
+from typing import Dict
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты «ведро токенов»: rate токенов в секунду,
+    не больше capacity подряд. Потокобезопасен, есть async-вариант ожидания.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._granted = 0
+        self._waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Берет токены, если они есть; иначе возвращает, сколько секунд ждать"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self._granted += 1
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """Блокирующее ожидание токенов (для рабочих потоков)"""
+        while True:
+            delay = self.try_acquire(tokens)
+            if not delay:
+                return
+            self._waited += delay
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Ожидание токенов без блокировки event loop"""
+        while True:
+            delay = self.try_acquire(tokens)
+            if not delay:
+                return
+            self._waited += delay
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику ограничителя"""
+        with self._lock:
+            self._refill()
+            tokens = self._tokens
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'tokens': round(tokens, 2),
+            'granted': self._granted,
+            'waited': round(self._waited, 1),
+        }
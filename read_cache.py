@@ -0,0 +1,82 @@
+# read_cache.py
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import READ_CACHE_TTL
+
+
+class ReadCache:
+    """
+    Кэш частых чтений (количество мест, последние места, статистика
+    Instagram) с коротким TTL. Любая запись в places сбрасывает его
+    целиком: ключей мало, а точечная инвалидация не стоит сложности.
+    Результат чтения, начатого до сброса, в кэш не попадает.
+    """
+
+    def __init__(self, ttl: float = READ_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def _lookup(self, key: str):
+        """(найдено, значение, поколение на момент промаха)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._hits += 1
+                return True, entry[1], self._generation
+            self._misses += 1
+            return False, None, self._generation
+
+    def _store(self, key: str, value: Any, generation: int, ttl: Optional[float]):
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def get(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Значение из кэша или loader() (исключения loader не кэшируются)"""
+        found, value, generation = self._lookup(key)
+        if found:
+            return value
+        value = loader()
+        self._store(key, value, generation, ttl)
+        return value
+
+    async def get_async(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Асинхронный вариант get для AsyncDatabaseManager"""
+        found, value, generation = self._lookup(key)
+        if found:
+            return value
+        value = await loader()
+        self._store(key, value, generation, ttl)
+        return value
+
+    def invalidate(self):
+        """Сбрасывает все значения (вызывается после записи в places)"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidations += 1
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику кэша"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total * 100, 1) if total else 0.0,
+                'invalidations': self._invalidations,
+            }
+
+
+# Общий кэш чтений: синхронный и асинхронный менеджеры работают в одном процессе
+read_cache = ReadCache()
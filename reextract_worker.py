@@ -0,0 +1,32 @@
+# reextract_worker.py
+# Процессы повторного извлечения: модуль импортирует только парсер разметки,
+# чтобы spawn-процессы не тянули за собой бота, базу и Selenium
+import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from yandex_extractor import extract_place, is_captcha_title
+
+
+def _extract_archived(job: Tuple[str, str, str]) -> Tuple[str, Optional[Dict]]:
+    """Извлечение в дочернем процессе: (url, данные или None)"""
+    url, final_url, object_path = job
+    try:
+        with gzip.open(object_path, "rb") as f:
+            page_html = f.read().decode("utf-8")
+        result = extract_place(page_html, final_url or url)
+        if is_captcha_title(result["title"]) or result["title"] == "Название не найдено":
+            return url, None
+        return url, result
+    except Exception:
+        return url, None
+
+
+def extract_pages(jobs: List[Tuple[str, str, str]], workers: int) -> Iterator[Tuple[str, Dict]]:
+    """Извлекает данные из архивных страниц (url, final_url, путь к gzip) на workers процессах"""
+    # spawn: бот многопоточный, fork из такого процесса небезопасен
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for url, data in executor.map(_extract_archived, jobs, chunksize=16):
+            if data is not None:
+                yield url, data
@@ -0,0 +1,358 @@
+# search_index.py
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+import numpy as np
+from config import SEARCH_LIMIT, SEARCH_MIN_SCORE
+from instagram_parser import normalize_name
+
+logger = logging.getLogger('ParserBot')
+
+# Слова для триграмм: буквы и цифры, кавычки и дефисы - разделители
+WORD_RE = re.compile(r"\w+")
+
+# Совпадение по категориям весит меньше, чем по названию
+CATEGORY_WEIGHT = 0.6
+# Бонус за вхождение запроса в название целиком (среди лучших кандидатов)
+SUBSTRING_BONUS = 0.2
+# Перестраивать индекс, когда дописанных после сборки записей больше этой доли
+REBUILD_RATIO = 0.2
+
+
+def trigrams(text: str, normalized: bool = False) -> Set[str]:
+    """Триграммы слов нормализованного текста (как pg_trgm: "  к", " ка", "каф", ..., "фе ")"""
+    result = set()
+    for word in WORD_RE.findall(text if normalized else normalize_name(text)):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def split_categories(categories) -> List[str]:
+    """'Бар, паб' -> ['бар', 'паб']"""
+    if not categories or not isinstance(categories, str):
+        return []
+    return [part for part in (normalize_name(item) for item in categories.split(",")) if part]
+
+
+class _Snapshot:
+    """
+    Неизменяемая часть индекса: триграммы названий в CSR-виде
+    (gram -> срез массива слотов)
+    """
+
+    def __init__(self, gram_ids: Dict[str, int], indptr: np.ndarray, postings: np.ndarray):
+        self.gram_ids = gram_ids
+        self.indptr = indptr
+        self.postings = postings
+
+    def slots(self, gram: str) -> Optional[np.ndarray]:
+        gram_id = self.gram_ids.get(gram)
+        if gram_id is None:
+            return None
+        return self.postings[self.indptr[gram_id]:self.indptr[gram_id + 1]]
+
+    @classmethod
+    def build(cls, name_grams: List[Set[str]]) -> "_Snapshot":
+        gram_ids: Dict[str, int] = {}
+        gram_column, slot_column = [], []
+        for slot, grams in enumerate(name_grams):
+            for gram in grams:
+                gram_column.append(gram_ids.setdefault(gram, len(gram_ids)))
+                slot_column.append(slot)
+        grams_array = np.asarray(gram_column, dtype=np.int32)
+        order = np.argsort(grams_array, kind="stable")
+        postings = np.asarray(slot_column, dtype=np.int32)[order]
+        indptr = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(grams_array, minlength=len(gram_ids)), out=indptr[1:])
+        return cls(gram_ids, indptr, postings)
+
+
+class TrigramIndex:
+    """
+    Инвертированный индекс триграмм по названиям и категориям мест.
+    Триграммы названий лежат в массивах NumPy: общие с запросом триграммы
+    считаются одним bincount, оценка - среднее сходства Жаккара и доли
+    покрытых триграмм запроса (находит и короткий запрос в длинном названии).
+    Категории (их немного разных) сравниваются с запросом по отдельности,
+    совпадение добавляется с весом CATEGORY_WEIGHT. Записи после сборки
+    дописываются в дельту, при ее росте индекс перестраивается из памяти
+    в фоновом потоке.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._loaded_at = None
+
+        # Одна сборка за раз (загрузка из базы или перестройка из памяти);
+        # записи, пришедшие во время сборки, применяются поверх нее
+        self._build_lock = threading.Lock()
+        self._building = False
+        self._pending: Dict[str, Dict] = {}
+
+        # Счетчики
+        self._queries = 0
+        self._query_time = 0.0
+        self._rebuilds = 0
+
+    def _reset(self):
+        # Слоты: данные места по номеру; замененный слот помечается мертвым
+        self._urls: List[str] = []
+        self._titles: List[Optional[str]] = []
+        self._categories: List[Optional[str]] = []
+        self._ratings: List[Optional[str]] = []
+        self._normalized: List[str] = []
+        self._name_sizes = np.zeros(1024, dtype=np.int32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._slot_of: Dict[str, int] = {}
+
+        self._snapshot = _Snapshot({}, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        self._delta: Dict[str, List[int]] = defaultdict(list)
+        self._delta_slots = 0
+
+        # Категории: нормализованное название -> номер, его триграммы и слоты мест
+        self._category_ids: Dict[str, int] = {}
+        self._category_grams: List[Set[str]] = []
+        self._category_slots: List[List[int]] = []
+        # Строка категорий места -> номера категорий (разных строк немного)
+        self._category_cache: Dict[str, List[int]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def _add_slot(self, url: str, title, categories, rating) -> Set[str]:
+        """Новый слот для места; возвращает триграммы названия"""
+        old = self._slot_of.get(url)
+        if old is not None:
+            self._alive[old] = False
+
+        slot = len(self._urls)
+        if slot == len(self._alive):
+            self._alive = np.resize(self._alive, slot * 2)
+            self._name_sizes = np.resize(self._name_sizes, slot * 2)
+        normalized = normalize_name(title)
+        grams = trigrams(normalized, normalized=True)
+        self._urls.append(url)
+        self._titles.append(title)
+        self._categories.append(categories)
+        self._ratings.append(rating)
+        self._normalized.append(normalized)
+        self._name_sizes[slot] = len(grams)
+        self._alive[slot] = True
+        self._slot_of[url] = slot
+
+        for category_id in self._category_ids_of(categories):
+            self._category_slots[category_id].append(slot)
+        return grams
+
+    def _category_ids_of(self, categories) -> List[int]:
+        key = categories if isinstance(categories, str) else ""
+        ids = self._category_cache.get(key)
+        if ids is None:
+            ids = []
+            for category in split_categories(key):
+                category_id = self._category_ids.get(category)
+                if category_id is None:
+                    category_id = self._category_ids[category] = len(self._category_grams)
+                    self._category_grams.append(trigrams(category, normalized=True))
+                    self._category_slots.append([])
+                ids.append(category_id)
+            self._category_cache[key] = ids
+        return ids
+
+    # ===== Наполнение =====
+
+    def _build(self, rows) -> "TrigramIndex":
+        fresh = TrigramIndex()
+        name_grams = [
+            fresh._add_slot(row["url"], row["title"], row["categories"], row["rating"])
+            for row in rows
+        ]
+        fresh._snapshot = _Snapshot.build(name_grams)
+        return fresh
+
+    def _swap(self, fresh: "TrigramIndex"):
+        for name in ("_urls", "_titles", "_categories", "_ratings", "_normalized", "_name_sizes",
+                     "_alive", "_slot_of", "_snapshot", "_delta", "_delta_slots",
+                     "_category_ids", "_category_grams", "_category_slots", "_category_cache"):
+            setattr(self, name, getattr(fresh, name))
+
+    def _begin_build(self):
+        with self._lock:
+            self._building = True
+            self._pending = {}
+
+    def _finish_build(self, fresh: Optional["TrigramIndex"]):
+        """Подменяет индекс собранным (None - сборка не удалась) и применяет записи, пришедшие за время сборки"""
+        with self._lock:
+            if fresh is not None:
+                self._swap(fresh)
+                for url, data in self._pending.items():
+                    self._upsert_locked(url, data)
+            self._pending, self._building = {}, False
+
+    def load(self, db_manager):
+        """Строит индекс по всем местам базы (повторный вызов перестраивает; параллельные вызовы ждут друг друга)"""
+        with self._build_lock:
+            self._load_locked(db_manager)
+
+    def ensure_loaded(self, db_manager):
+        """Загружает индекс, если он еще не загружен; идущую загрузку ждет, а не повторяет"""
+        if self.loaded:
+            return
+        with self._build_lock:
+            if not self.loaded:
+                self._load_locked(db_manager)
+
+    def _load_locked(self, db_manager):
+        self._begin_build()
+        fresh = None
+        try:
+            rows = [
+                {'url': row["Ссылка"], 'title': row.get("Название"),
+                 'categories': row.get("Категории"), 'rating': row.get("Рейтинг")}
+                for row in db_manager.get_search_documents()
+            ]
+            fresh = self._build(rows)
+        finally:
+            self._finish_build(fresh)
+        self._loaded_at = time.time()
+        logger.info(f"🔎 Поисковый индекс загружен: {len(rows)} мест")
+
+    def _live_rows(self) -> List[Dict]:
+        # Под блокировкой только срезы списков; словари строк собираются потом
+        with self._lock:
+            size = len(self._urls)
+            slots = np.flatnonzero(self._alive[:size])
+            urls, titles = self._urls[:size], self._titles[:size]
+            categories, ratings = self._categories[:size], self._ratings[:size]
+        return [
+            {'url': urls[slot], 'title': titles[slot], 'categories': categories[slot], 'rating': ratings[slot]}
+            for slot in slots
+        ]
+
+    def _rebuild(self):
+        """Перестройка из памяти в фоновом потоке: поиск и записи идут по старому индексу"""
+        fresh = None
+        try:
+            self._begin_build()
+            fresh = self._build(self._live_rows())
+            self._rebuilds += 1
+        except Exception as e:
+            logger.error(f"❌ Ошибка перестройки поискового индекса: {e}")
+        finally:
+            self._finish_build(fresh)
+            self._build_lock.release()
+
+    def upsert(self, url: str, data: Dict):
+        """Обновляет место по результату парсинга"""
+        if not url:
+            return
+        with self._lock:
+            if self._building:
+                self._pending[url] = data
+            self._upsert_locked(url, data)
+            need_rebuild = self._delta_slots > max(1000, REBUILD_RATIO * len(self._slot_of))
+        # Сборка уже идет (загрузка или перестройка) - следующая запись проверит снова
+        if need_rebuild and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, name="search-rebuild", daemon=True).start()
+
+    def _upsert_locked(self, url: str, data: Dict):
+        slot = len(self._urls)
+        for gram in self._add_slot(url, data.get('title'), data.get('categories'), data.get('rating')):
+            self._delta[gram].append(slot)
+        self._delta_slots += 1
+
+    def upsert_many(self, items):
+        for url, data in items:
+            self.upsert(url, data)
+
+    # ===== Поиск =====
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT, min_score: float = SEARCH_MIN_SCORE) -> List[Dict]:
+        """Места, похожие на запрос, по убыванию оценки"""
+        started = time.perf_counter()
+        query_grams = trigrams(query)
+        normalized_query = normalize_name(query)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            size = len(self._urls)
+            parts = []
+            for gram in query_grams:
+                base = self._snapshot.slots(gram)
+                if base is not None and len(base):
+                    parts.append(base)
+                delta = self._delta.get(gram)
+                if delta:
+                    parts.append(np.asarray(delta, dtype=np.int32))
+
+            scores = np.zeros(size, dtype=np.float64)
+            if parts:
+                shared = np.bincount(np.concatenate(parts), minlength=size).astype(np.float64)
+                union = len(query_grams) + self._name_sizes[:size] - shared
+                jaccard = np.divide(shared, union, out=np.zeros(size), where=union > 0)
+                scores = (jaccard + shared / len(query_grams)) / 2
+
+            # Совпадение по категории добавляется к оценке названия:
+            # "ресторан елки" поднимает ресторан с похожим названием
+            category_scores = np.zeros(size, dtype=np.float64)
+            for category_id, grams in enumerate(self._category_grams):
+                category_score = CATEGORY_WEIGHT * len(query_grams & grams) / len(query_grams)
+                if category_score >= min_score:
+                    slots = np.asarray(self._category_slots[category_id], dtype=np.int64)
+                    category_scores[slots] = np.maximum(category_scores[slots], category_score)
+            scores += category_scores
+
+            scores[~self._alive[:size]] = 0.0
+            candidates = np.flatnonzero(scores >= min_score)
+            # Бонус за вхождение целиком считаем только для лучших кандидатов
+            if len(candidates) > limit * 5:
+                candidates = candidates[np.argpartition(-scores[candidates], limit * 5 - 1)[:limit * 5]]
+
+            ranked = []
+            for slot in candidates:
+                score = float(scores[slot])
+                if normalized_query in self._normalized[slot]:
+                    score += SUBSTRING_BONUS
+                ranked.append((score, self._normalized[slot], int(slot)))
+            ranked.sort(key=lambda item: (-item[0], item[1]))
+
+            result = [
+                {
+                    'url': self._urls[slot],
+                    'title': self._titles[slot],
+                    'categories': self._categories[slot],
+                    'rating': self._ratings[slot],
+                    'score': round(score, 3),
+                }
+                for score, _, slot in ranked[:limit]
+            ]
+
+        self._queries += 1
+        self._query_time += time.perf_counter() - started
+        return result
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику индекса"""
+        with self._lock:
+            return {
+                'places': len(self._slot_of),
+                'trigrams': len(self._snapshot.gram_ids),
+                'delta': self._delta_slots,
+                'rebuilds': self._rebuilds,
+                'building': self._building,
+                'queries': self._queries,
+                'avg_query_ms': round(self._query_time / self._queries * 1000, 3) if self._queries else 0.0,
+                'loaded_at': self._loaded_at,
+            }
+
+
+# Общий поисковый индекс процесса
+search_index = TrigramIndex()
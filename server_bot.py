@@ -1,20 +1,29 @@
 # server_bot.py
-import re
 import asyncio
-from telegram import Update
+import math
+from pathlib import Path
+from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
-from config import BOT_TOKEN, ADMIN_IDS
-from database_manager import DatabaseManager
+from config import BOT_TOKEN, ADMIN_IDS, BULK_MAX_FILE_SIZE, REFRESH_ENABLED, NEAR_RADIUS_METERS, NEAR_MAX_RADIUS_METERS
+from database_manager import DatabaseManager, get_db_manager
+from async_database_manager import async_db
 from yandex_parser import parse_yandex
-from admin_commands import admin_stats, admin_export, admin_backup, admin_help, admin_sync, admin_instagram_search, admin_instagram_stats, is_admin
+from parse_queue import parse_queue, ParseQueueFull
+from place_cache import invalidate_cached_result, is_stored_for_url
+from stale_refresher import StaleRefresher
+from spatial_index import spatial_index
+from search_index import search_index
+from opening_hours import opening_index
+from bulk_ingest import YANDEX_URL_PATTERN, SUPPORTED_DOCUMENTS, BulkIngestor, extract_links, read_links_from_document
+from admin_commands import admin_stats, admin_export, admin_backup, admin_help, admin_sync, admin_instagram_search, admin_instagram_stats, admin_refresh, admin_reextract, admin_metrics, is_admin
+from metrics import metrics, start_metrics_server
 from logger import setup_logger, log_parsing_result, log_admin_action
 
 # Настройка логирования
 logger = setup_logger()
-db_manager = DatabaseManager()
-
-# Регулярное выражение для ссылок Яндекс.Карт
-YANDEX_URL_PATTERN = re.compile(r"(https?://yandex\.(?:ru|com)/maps/org/[^\s]+)")
+# Создается в main(): модуль импортируется и в spawn-процессах повторного извлечения
+db_manager: DatabaseManager = None
 
 def escape_markdown(text: str) -> str:
     """Экранирует специальные символы для Markdown"""
@@ -42,6 +51,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Я автоматически извлеку всю информацию\n"
         "3. Данные сохранятся в PostgreSQL базу данных\n"
         "4. И синхронизируются с локальным Excel файлом\n\n"
+        "Можно прислать сразу несколько ссылок или файл .txt/.csv/.xlsx со ссылками 📎\n\n"
+        "Пришлите геопозицию или /near - покажу ближайшие места 🗺 (/near открыто - только открытые сейчас)\n"
+        "Поиск по названию: /find <название> 🔎\n\n"
         "**Что я собираю:**\n"
         "• Название заведения\n"
         "• Рейтинг и отзывы\n"
@@ -67,19 +79,47 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Логируем входящее сообщение
     logger.info(f"📨 Сообщение от {user_id}: {text[:50]}...")
     
+    # Несколько ссылок в одном сообщении - пакетная обработка
+    links = extract_links(text)
+    if len(links) > 1:
+        await run_bulk_ingest(update, links)
+        return
+    
     # Ищем ссылку на Яндекс.Карты
     match = YANDEX_URL_PATTERN.search(text)
     
     if match:
         url = match.group(1)
-        await update.message.reply_text(f"🔍 Обрабатываю ссылку: {url}")
         
+        # Трасса запроса: этапы очереди, парсинга и записи попадают в /metrics
+        trace = metrics.start_trace("request", url)
         try:
+            # Ставим парсинг в очередь, чтобы не блокировать других пользователей
+            try:
+                job = parse_queue.submit(parse_yandex, url)
+            except ParseQueueFull:
+                await update.message.reply_text("⏳ Очередь парсинга переполнена, попробуйте через пару минут")
+                return
+            
+            if job.position:
+                await update.message.reply_text(f"⏳ Ссылка в очереди, позиция {job.position}: {url}")
+            else:
+                await update.message.reply_text(f"🔍 Обрабатываю ссылку: {url}")
+            
             # Парсим данные
-            data = parse_yandex(url)
+            data = await job.result()
             
-            # Обновляем PostgreSQL базу данных
-            success, message = db_manager.update_place_data(url, data)
+            if is_stored_for_url(data, url):
+                # Свежий результат из кэша уже записан в базу по этой ссылке - повторная запись не нужна
+                success, message = True, "⚡ Данные взяты из кэша, запись в базе актуальна"
+            else:
+                # Обновляем PostgreSQL базу данных. Результат, полученный вместе с параллельным
+                # запросом (_shared), тоже пишем: upsert идемпотентен, а запись того запроса
+                # могла не пройти, быть отложенной (пакет, фоновое обновление) или идти по другой ссылке
+                success, message = await async_db.update_place_data(url, data)
+                if not success:
+                    # Не даем кэшу скрыть неудачную запись при повторной отправке
+                    invalidate_cached_result(url)
             
 
             
@@ -118,7 +158,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"🕐 **Часы работы:**\n{hours_text or '—'}\n\n"
                     f"📊 {escaped_message}\n\n"
                     f"🔄 Данные теперь доступны для основного бота!\n"
-                    f"📁 Локальный Excel файл обновлен"
+                    f"📁 Локальный Excel файл обновится автоматически"
                 )
                 
                 await update.message.reply_text(response, parse_mode='Markdown')
@@ -129,9 +169,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(f"❌ {escape_markdown(message)}")
                 
         except Exception as e:
+            trace.error = True
             error_msg = f"Ошибка при обработке ссылки: {e}"
             log_parsing_result(url, False, error=error_msg)
             await update.message.reply_text(f"❌ {escape_markdown(error_msg)}")
+        finally:
+            metrics.finish_trace(trace)
             
     else:
         # Если это не ссылка, предлагаем помощь
@@ -146,17 +189,77 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(help_text, parse_mode='Markdown')
 
+async def run_bulk_ingest(update: Update, links: list):
+    """Пакетно обрабатывает ссылки с прогрессом в одном сообщении и итоговым файлом"""
+    user_id = update.effective_user.id
+    logger.info(f"📥 Пакетная загрузка от {user_id}: {len(links)} ссылок")
+    
+    progress_message = await update.message.reply_text(f"📥 Найдено ссылок: {len(links)}. Начинаю обработку...")
+    last_text = progress_message.text
+    
+    async def on_progress(text: str):
+        nonlocal last_text
+        if text == last_text:
+            return
+        try:
+            await progress_message.edit_text(text)
+            last_text = text
+        except BadRequest:
+            # Сообщение не изменилось или удалено - прогресс не критичен
+            pass
+    
+    ingestor = BulkIngestor(db_manager, links)
+    await ingestor.run(on_progress)
+    
+    await update.message.reply_document(
+        document=ingestor.summary_file(),
+        filename="bulk_summary.csv",
+        caption=f"📊 Итог: {ingestor.summary_text()}"
+    )
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик файлов со ссылками (.txt, .csv, .xlsx)"""
+    document = update.message.document
+    filename = document.file_name or ""
+    suffix = Path(filename).suffix.lower()
+    
+    if suffix not in SUPPORTED_DOCUMENTS:
+        await update.message.reply_text(
+            f"❌ Поддерживаются файлы: {', '.join(sorted(SUPPORTED_DOCUMENTS))}"
+        )
+        return
+    
+    if document.file_size and document.file_size > BULK_MAX_FILE_SIZE:
+        await update.message.reply_text(
+            f"❌ Файл слишком большой (максимум {BULK_MAX_FILE_SIZE // 1024 // 1024} МБ)"
+        )
+        return
+    
+    try:
+        telegram_file = await document.get_file()
+        content = bytes(await telegram_file.download_as_bytearray())
+        links = read_links_from_document(content, filename)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Не удалось прочитать файл: {e}")
+        return
+    
+    if not links:
+        await update.message.reply_text("📭 В файле не найдено ссылок на Яндекс.Карты")
+        return
+    
+    await run_bulk_ingest(update, links)
+
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает статус бота"""
     user_id = update.effective_user.id
     
     try:
-        places_count = db_manager.get_places_count()
-        recent_places = db_manager.get_recent_places(3)
+        places_count = await async_db.get_places_count()
+        recent_places = await async_db.get_recent_places(3)
         local_excel_exists = db_manager.local_excel_path.exists()
         
         # Статистика Instagram
-        instagram_stats = db_manager.get_instagram_stats()
+        instagram_stats = await async_db.get_instagram_stats()
         instagram_info = ""
         if instagram_stats:
             instagram_info = (
@@ -170,6 +273,7 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📍 Мест в базе: {places_count}\n"
             f"🗄 База данных: PostgreSQL\n"
             f"📊 Локальный Excel: {'✅' if local_excel_exists else '❌'}\n"
+            f"⏳ Очередь парсинга: {parse_queue.depth}\n"
             f"🆔 Ваш ID: `{user_id}`"
         )
         
@@ -190,7 +294,7 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def recent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает последние добавленные места"""
     try:
-        recent_places = db_manager.get_recent_places(10)
+        recent_places = await async_db.get_recent_places(10)
         
         if not recent_places:
             await update.message.reply_text("📭 База данных пуста")
@@ -213,26 +317,195 @@ async def recent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка при получении списка: {escape_markdown(str(e))}")
 
+def format_distance(meters: float) -> str:
+    """1234 -> '1.2 км', 350 -> '350 м'"""
+    return f"{meters / 1000:.1f} км" if meters >= 1000 else f"{meters:.0f} м"
+
+# Слово в аргументах /near: только открытые сейчас места
+OPEN_NOW_WORDS = ("открыто", "open")
+
+def format_open_status(url: str) -> str:
+    """Отметка "открыто сейчас" по индексу часов работы (часы неизвестны - пусто)"""
+    is_open = opening_index.is_open(url)
+    if is_open is None:
+        return ""
+    return " | 🟢 открыто" if is_open else " | 🔴 закрыто"
+
+async def reply_nearest(update: Update, lat: float, lon: float, radius: float, open_now: bool = False):
+    """Отвечает списком ближайших мест из пространственного индекса (open_now - только открытые сейчас)"""
+    if open_now and not opening_index.loaded:
+        await update.message.reply_text("⏳ Часы работы мест еще загружаются, попробуйте через минуту",
+                                        reply_markup=ReplyKeyboardRemove())
+        return
+    only = set(opening_index.open_at()) if open_now else None
+    places = spatial_index.nearest(lat, lon, radius=radius, only=only)
+    if not places:
+        if not spatial_index.get_stats()['loaded_at']:
+            text = "⏳ Индекс мест еще загружается, попробуйте через минуту"
+        else:
+            what = "открытых сейчас мест" if open_now else "мест"
+            text = f"📭 В радиусе {format_distance(radius)} {what} не найдено. Попробуйте /near {int(radius * 3)}"
+        await update.message.reply_text(text, reply_markup=ReplyKeyboardRemove())
+        return
+    
+    title = "Ближайшие открытые сейчас места" if open_now else "Ближайшие места"
+    lines = [f"📍 {title} (радиус {format_distance(radius)}):\n"]
+    for i, place in enumerate(places, 1):
+        lines.append(
+            f"{i}. {place.get('title') or 'N/A'} — {format_distance(place['distance'])}\n"
+            f"   ⭐ {place.get('rating') or 'N/A'} | 🏪 {place.get('categories') or 'N/A'}{format_open_status(place['url'])}\n"
+            f"   {place['url']}"
+        )
+    await update.message.reply_text("\n".join(lines), reply_markup=ReplyKeyboardRemove(),
+                                    disable_web_page_preview=True)
+
+async def near(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /near [радиус, м] - просит геопозицию и ищет места рядом;
+    /near <широта> <долгота> [радиус, м] - поиск по координатам;
+    слово "открыто" в любом месте - только открытые сейчас
+    """
+    args = [arg for arg in context.args if arg.lower() not in OPEN_NOW_WORDS]
+    open_now = len(args) != len(context.args)
+    try:
+        numbers = [float(arg.replace(',', '.')) for arg in args]
+    except ValueError:
+        numbers = None
+    if numbers is None or len(numbers) > 3 or not all(math.isfinite(number) for number in numbers):
+        await update.message.reply_text(
+            "📝 Использование: /near [радиус, м] или /near <широта> <долгота> [радиус, м]\n"
+            "Добавьте «открыто», чтобы показать только открытые сейчас места"
+        )
+        return
+    if len(numbers) >= 2 and not (-90 <= numbers[0] <= 90 and -180 <= numbers[1] <= 180):
+        await update.message.reply_text("❌ Широта должна быть от -90 до 90, долгота - от -180 до 180")
+        return
+    
+    radius = numbers[2] if len(numbers) == 3 else numbers[0] if len(numbers) == 1 else NEAR_RADIUS_METERS
+    radius = min(max(radius, 50), NEAR_MAX_RADIUS_METERS)
+    
+    if len(numbers) >= 2:
+        await reply_nearest(update, numbers[0], numbers[1], radius, open_now)
+        return
+    
+    context.user_data["near_radius"] = radius
+    context.user_data["near_open_now"] = open_now
+    keyboard = ReplyKeyboardMarkup(
+        [[KeyboardButton("📍 Отправить геопозицию", request_location=True)]],
+        resize_keyboard=True, one_time_keyboard=True
+    )
+    await update.message.reply_text(
+        f"📍 Отправьте геопозицию - покажу места в радиусе {format_distance(radius)}",
+        reply_markup=keyboard
+    )
+
+async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Геопозиция пользователя - ближайшие места"""
+    location = update.message.location
+    radius = context.user_data.pop("near_radius", NEAR_RADIUS_METERS)
+    open_now = context.user_data.pop("near_open_now", False)
+    await reply_nearest(update, location.latitude, location.longitude, radius, open_now)
+
+async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/find <текст> - поиск мест по названию или категории"""
+    query = " ".join(context.args).strip()
+    if not query:
+        await update.message.reply_text("📝 Использование: /find <название или категория>")
+        return
+    
+    try:
+        # Первый вызов может строить индекс из базы - не в event loop
+        places = await asyncio.get_running_loop().run_in_executor(None, db_manager.search_places, query)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка поиска: {e}")
+        return
+    
+    if not places:
+        await update.message.reply_text(f"📭 По запросу «{query}» ничего не найдено")
+        return
+    
+    lines = [f"🔎 Найдено по запросу «{query}»:\n"]
+    for i, place in enumerate(places, 1):
+        lines.append(
+            f"{i}. {place.get('title') or 'N/A'}\n"
+            f"   ⭐ {place.get('rating') or 'N/A'} | 🏪 {place.get('categories') or 'N/A'}{format_open_status(place['url'])}\n"
+            f"   {place['url']}"
+        )
+    await update.message.reply_text("\n".join(lines), disable_web_page_preview=True)
+
+async def load_spatial_index():
+    """Загружает координаты мест в память, не блокируя event loop"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, spatial_index.load, db_manager)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки пространственного индекса: {e}")
+
+async def load_search_index():
+    """Строит поисковый индекс по названиям, не блокируя event loop"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, search_index.ensure_loaded, db_manager)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки поискового индекса: {e}")
+
+async def load_opening_index():
+    """Загружает интервалы часов работы в память, не блокируя event loop"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, opening_index.load, db_manager)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки индекса часов работы: {e}")
+
+async def start_background_tasks(app):
+    """Запускает фоновое обновление устаревших записей, загрузку индексов мест и HTTP-метрики"""
+    start_metrics_server()
+    app.bot_data["spatial_index_task"] = asyncio.ensure_future(load_spatial_index())
+    app.bot_data["search_index_task"] = asyncio.ensure_future(load_search_index())
+    app.bot_data["opening_index_task"] = asyncio.ensure_future(load_opening_index())
+    if REFRESH_ENABLED:
+        refresher = StaleRefresher(db_manager)
+        app.bot_data["refresher"] = refresher
+        refresher.start()
+
+async def stop_background_tasks(app):
+    """Останавливает фоновые задачи, сохраняет их состояние и закрывает пул соединений"""
+    refresher = app.bot_data.get("refresher")
+    if refresher:
+        await refresher.stop()
+    await async_db.close()
+
 def main():
     """Основная функция запуска бота"""
+    global db_manager
+    db_manager = get_db_manager()
     logger.info("🚀 Запуск серверного бота для PostgreSQL...")
     
     # Проверяем администраторов
     logger.info(f"🔧 Администраторы: {ADMIN_IDS}")
     
-    # Создаем приложение
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Создаем приложение (обновления обрабатываются параллельно, парсинг идет через очередь)
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .post_init(start_background_tasks)
+        .post_shutdown(stop_background_tasks)
+        .build()
+    )
     
     # Регистрируем обработчики
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("status", status))
     app.add_handler(CommandHandler("recent", recent))
+    app.add_handler(CommandHandler("near", near))
+    app.add_handler(CommandHandler("find", find))
     
     # Административные команды
     app.add_handler(CommandHandler("stats", admin_stats))
     app.add_handler(CommandHandler("sync", admin_sync))
     app.add_handler(CommandHandler("export", admin_export))
     app.add_handler(CommandHandler("backup", admin_backup))
+    app.add_handler(CommandHandler("refresh", admin_refresh))
+    app.add_handler(CommandHandler("reextract", admin_reextract))
+    app.add_handler(CommandHandler("metrics", admin_metrics))
     app.add_handler(CommandHandler("help", admin_help))
     
     # Instagram команды
@@ -242,6 +515,12 @@ def main():
     # Обработчик текстовых сообщений
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     
+    # Геопозиция - поиск ближайших мест
+    app.add_handler(MessageHandler(filters.LOCATION, handle_location))
+    
+    # Файлы со ссылками для пакетной загрузки
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    
     logger.info("✅ Бот запущен и готов к работе!")
     logger.info(f"🔧 Администраторы: {ADMIN_IDS}")
     logger.info("🗄 Подключение к PostgreSQL: 109.69.56.200:5432/places")
@@ -0,0 +1,75 @@
+# singleflight.py
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """Выполняющийся вызов и его результат"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом:
+    функция выполняется один раз, остальные вызывающие ждут и получают
+    копию того же результата (или то же исключение).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+        # Счетчики
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """Возвращает (результат, shared); shared=True - результат получен от чужого вызова"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            result = func(*args, **kwargs)
+            # Снимок для ожидающих: вызывающий может изменять свой результат
+            call.result = copy.deepcopy(result)
+            return result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику объединения вызовов"""
+        with self._lock:
+            in_flight = len(self._calls)
+            waiting = sum(call.waiters for call in self._calls.values())
+        return {
+            'in_flight': in_flight,
+            'waiting': waiting,
+            'executed': self._executed,
+            'coalesced': self._coalesced,
+        }
@@ -0,0 +1,229 @@
+# spatial_index.py
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from config import NEAR_CELL_DEGREES, NEAR_RADIUS_METERS, NEAR_LIMIT
+
+logger = logging.getLogger('ParserBot')
+
+EARTH_RADIUS_METERS = 6371000.0
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_meters(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Расстояния от точки до массива точек по большой окружности, м"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Равномерная сетка по координатам мест поверх массивов NumPy.
+    Запрос перебирает только ячейки, покрывающие радиус, и считает
+    расстояния векторно. Записи добавляются и переносятся на месте
+    (upsert), полная загрузка из базы подменяет индекс целиком.
+    """
+
+    def __init__(self, cell_degrees: float = NEAR_CELL_DEGREES):
+        self.cell = cell_degrees
+        self._lock = threading.Lock()
+        self._reset(capacity=1024)
+
+        # Записи, пришедшие во время полной загрузки (применяются поверх нее)
+        self._loading = False
+        self._pending: Dict[str, Tuple[float, float, Dict]] = {}
+
+        # Счетчики
+        self._queries = 0
+        self._query_time = 0.0
+        self._loaded_at = None
+
+    def _reset(self, capacity: int):
+        self._lats = np.empty(capacity, dtype=np.float64)
+        self._lons = np.empty(capacity, dtype=np.float64)
+        self._info: List[Dict] = []
+        self._slots: Dict[str, int] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def _put(self, url: str, lat: float, lon: float, info: Dict):
+        cell = self._cell_of(lat, lon)
+        slot = self._slots.get(url)
+        if slot is None:
+            slot = len(self._info)
+            if slot == len(self._lats):
+                self._lats = np.resize(self._lats, slot * 2)
+                self._lons = np.resize(self._lons, slot * 2)
+            self._slots[url] = slot
+            self._info.append(info)
+            self._cells[cell].append(slot)
+        else:
+            old_cell = self._cell_of(self._lats[slot], self._lons[slot])
+            if old_cell != cell:
+                self._cells[old_cell].remove(slot)
+                self._cells[cell].append(slot)
+            self._info[slot] = info
+        self._lats[slot], self._lons[slot] = lat, lon
+
+    # ===== Наполнение =====
+
+    def load(self, db_manager):
+        """Полная загрузка точек из базы (в фоне, запросы продолжают работать по старому индексу)"""
+        with self._lock:
+            self._loading = True
+            self._pending = {}
+        try:
+            rows = db_manager.get_place_points()
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        fresh = SpatialIndex(self.cell)
+        fresh._reset(capacity=max(1024, len(rows)))
+        for row in rows:
+            fresh._put(row["Ссылка"], float(row["lat"]), float(row["lon"]), _point_info(row))
+
+        with self._lock:
+            for url, (lat, lon, info) in self._pending.items():
+                fresh._put(url, lat, lon, info)
+            self._lats, self._lons = fresh._lats, fresh._lons
+            self._info, self._slots, self._cells = fresh._info, fresh._slots, fresh._cells
+            self._loading = False
+            self._pending = {}
+            self._loaded_at = time.time()
+        logger.info(f"🗺 Пространственный индекс загружен: {len(self._info)} мест")
+
+    def upsert(self, url: str, data: Dict):
+        """Добавляет или переносит место по результату парсинга (без координат - пропуск)"""
+        coordinates = data.get('coordinates')
+        if not url or not coordinates or len(coordinates) != 2:
+            return
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        info = {
+            'url': url,
+            'title': data.get('title'),
+            'rating': data.get('rating'),
+            'categories': data.get('categories'),
+        }
+        with self._lock:
+            if self._loading:
+                self._pending[url] = (lat, lon, info)
+            self._put(url, lat, lon, info)
+
+    def upsert_many(self, items: Iterable[Tuple[str, Dict]]):
+        for url, data in items:
+            self.upsert(url, data)
+
+    # ===== Поиск =====
+
+    def _ring(self, center_i: int, center_j: int, ring: int, bounds: Tuple[int, int, int, int]):
+        """Ячейки кольца ring вокруг центральной (квадрат со стороной 2*ring+1), в пределах bounds"""
+        min_i, max_i, min_j, max_j = bounds
+        if ring == 0:
+            yield center_i, center_j
+            return
+        j_range = range(max(center_j - ring, min_j), min(center_j + ring, max_j) + 1)
+        for i in (center_i - ring, center_i + ring):
+            if min_i <= i <= max_i:
+                for j in j_range:
+                    yield i, j
+        for j in (center_j - ring, center_j + ring):
+            if min_j <= j <= max_j:
+                for i in range(max(center_i - ring + 1, min_i), min(center_i + ring - 1, max_i) + 1):
+                    yield i, j
+
+    def _covered_meters(self, lat: float, lon: float, center_i: int, center_j: int, ring: int) -> float:
+        """Расстояние от точки до края просмотренного квадрата: все места ближе уже найдены"""
+        lat_low, lat_high = (center_i - ring) * self.cell, (center_i + ring + 1) * self.cell
+        lon_low, lon_high = (center_j - ring) * self.cell, (center_j + ring + 1) * self.cell
+        widest = min(max(abs(lat_low), abs(lat_high)), 90.0)
+        lat_meters = min(lat - lat_low, lat_high - lat) * METERS_PER_DEGREE
+        lon_meters = min(lon - lon_low, lon_high - lon) * METERS_PER_DEGREE * math.cos(math.radians(widest))
+        return min(lat_meters, lon_meters)
+
+    def nearest(self, lat: float, lon: float, limit: int = NEAR_LIMIT,
+                radius: float = NEAR_RADIUS_METERS, only: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        До limit ближайших мест в радиусе radius метров, по возрастанию расстояния.
+        Ячейки просматриваются кольцами от центра; как только limit мест найдено
+        ближе края просмотренной области, дальние кольца не нужны.
+        only - учитывать только места с этими ссылками (например, открытые сейчас).
+        """
+        if not all(math.isfinite(value) for value in (lat, lon, radius)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"Некорректные координаты или радиус: {lat}, {lon}, {radius}")
+        started = time.perf_counter()
+        lat_span = radius / METERS_PER_DEGREE
+        lon_span = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_i, min_j = self._cell_of(lat - lat_span, lon - lon_span)
+        max_i, max_j = self._cell_of(lat + lat_span, lon + lon_span)
+        bounds = (min_i, max_i, min_j, max_j)
+        center_i, center_j = self._cell_of(lat, lon)
+        last_ring = max(center_i - min_i, max_i - center_i, center_j - min_j, max_j - center_j)
+
+        found_slots, found_distances = [], []
+        found = 0
+        with self._lock:
+            for ring in range(last_ring + 1):
+                candidates = [slot for cell in self._ring(center_i, center_j, ring, bounds)
+                              for slot in self._cells.get(cell, ())]
+                if only is not None:
+                    candidates = [slot for slot in candidates if self._info[slot]['url'] in only]
+                if candidates:
+                    slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                    distances = haversine_meters(lat, lon, self._lats[slots], self._lons[slots])
+                    inside = distances <= radius
+                    found_slots.append(slots[inside])
+                    found_distances.append(distances[inside])
+                    found += int(np.count_nonzero(inside))
+                if found >= limit:
+                    covered = min(self._covered_meters(lat, lon, center_i, center_j, ring), radius)
+                    if sum(int(np.count_nonzero(d <= covered)) for d in found_distances) >= limit:
+                        break
+
+            if not found:
+                result = []
+            else:
+                slots = np.concatenate(found_slots)
+                distances = np.concatenate(found_distances)
+                order = np.arange(len(distances))
+                if len(order) > limit:
+                    order = np.argpartition(distances, limit - 1)[:limit]
+                order = order[np.argsort(distances[order])]
+                result = [dict(self._info[slots[index]], distance=float(distances[index])) for index in order]
+
+        self._queries += 1
+        self._query_time += time.perf_counter() - started
+        return result
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику индекса"""
+        with self._lock:
+            return {
+                'places': len(self._info),
+                'cells': sum(1 for slots in self._cells.values() if slots),
+                'queries': self._queries,
+                'avg_query_ms': round(self._query_time / self._queries * 1000, 3) if self._queries else 0.0,
+                'loaded_at': self._loaded_at,
+            }
+
+
+def _point_info(row: Dict) -> Dict:
+    return {
+        'url': row["Ссылка"],
+        'title': row.get("Название"),
+        'rating': row.get("Рейтинг"),
+        'categories': row.get("Категории"),
+    }
+
+
+# Общий индекс процесса: наполняется при запуске бота и при каждой записи места
+spatial_index = SpatialIndex()
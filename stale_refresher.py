@@ -0,0 +1,215 @@
+# stale_refresher.py
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import (
+    REFRESH_RATE_PER_SECOND, REFRESH_RATE_BURST, REFRESH_DAILY_BUDGET,
+    REFRESH_MIN_AGE, REFRESH_BATCH_SIZE, REFRESH_IDLE_CHECK_INTERVAL, REFRESH_STATE_PATH
+)
+from parse_queue import parse_queue, ParseQueueFull
+from rate_limiter import TokenBucket
+from yandex_parser import parse_yandex
+
+logger = logging.getLogger('ParserBot')
+
+
+class StaleRefresher:
+    """
+    Фоновое обновление устаревших записей places.
+    Берет записи по приоритету (сначала неполные, затем с самым давним
+    updated_at), парсит их под лимитом частоты и суточным бюджетом только
+    когда очередь парсинга свободна, пишет пачками через upsert_many.
+    Неудачные попытки (в базу не попадают) хранятся в файле, чтобы не
+    повторять их по кругу и после перезапуска.
+    """
+
+    def __init__(self, db_manager, rate: float = REFRESH_RATE_PER_SECOND,
+                 burst: float = REFRESH_RATE_BURST, daily_budget: int = REFRESH_DAILY_BUDGET,
+                 min_age: float = REFRESH_MIN_AGE, batch_size: int = REFRESH_BATCH_SIZE,
+                 state_path: Path = REFRESH_STATE_PATH):
+        self.db_manager = db_manager
+        self.limiter = TokenBucket(rate, burst)
+        self.daily_budget = daily_budget
+        self.min_age = min_age
+        self.batch_size = max(1, batch_size)
+        self.state_path = Path(state_path)
+
+        # url -> время последней попытки обновления, еще не отраженной в updated_at
+        self._refreshed: Dict[str, float] = {}
+        self._day = date.today().isoformat()
+        self._used_today = 0
+        self._load_state()
+
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[tuple] = []
+
+        # Счетчики
+        self._updated = 0
+        self._empty = 0
+        self._failed = 0
+        self._paused = 0
+
+    # ===== Состояние =====
+
+    def _load_state(self):
+        if not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._refreshed = {url: float(ts) for url, ts in state.get("refreshed", {}).items()}
+            if state.get("day") == self._day:
+                self._used_today = int(state.get("used_today", 0))
+            logger.info(f"🔁 Состояние обновления загружено: {len(self._refreshed)} записей")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать состояние обновления: {e}")
+
+    def _save_state(self):
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "day": self._day,
+                    "used_today": self._used_today,
+                    "refreshed": self._refreshed,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить состояние обновления: {e}")
+
+    def _budget_left(self) -> int:
+        today = date.today().isoformat()
+        if today != self._day:
+            self._day = today
+            self._used_today = 0
+        return max(0, self.daily_budget - self._used_today)
+
+    # ===== Выбор записей =====
+
+    def _recent_attempts(self) -> List[str]:
+        """Ссылки, которые пытались обновить недавно (старые попытки забываются)"""
+        cutoff = time.time() - self.min_age
+        self._refreshed = {url: ts for url, ts in self._refreshed.items() if ts >= cutoff}
+        return list(self._refreshed)
+
+    def _queue_idle(self) -> bool:
+        """Очередь парсинга свободна от интерактивных и пакетных заданий"""
+        stats = parse_queue.get_stats()
+        return stats['waiting'] == 0 and stats['running'] == 0
+
+    # ===== Работа =====
+
+    def start(self):
+        """Запускает фоновую задачу в текущем event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+            logger.info(
+                f"🔁 Фоновое обновление запущено: до {self.daily_budget} ссылок в сутки, "
+                f"не чаще раза в {self.min_age // 3600} ч на запись"
+            )
+
+    async def stop(self):
+        """Останавливает задачу и сохраняет несохраненные результаты"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._flush()
+        self._save_state()
+
+    async def run(self):
+        """Бесконечный цикл: выбирает устаревшие записи и обновляет их"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                budget = self._budget_left()
+                if not budget:
+                    await asyncio.sleep(REFRESH_IDLE_CHECK_INTERVAL * 10)
+                    continue
+
+                candidates = await loop.run_in_executor(
+                    None, self.db_manager.get_refresh_candidates,
+                    self.min_age, min(budget, self.batch_size), self._recent_attempts()
+                )
+                urls = [row["Ссылка"] for row in candidates]
+                if not urls:
+                    await asyncio.sleep(REFRESH_IDLE_CHECK_INTERVAL * 10)
+                    continue
+
+                for url in urls:
+                    await self._refresh_one(url)
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка фонового обновления: {e}")
+                await asyncio.sleep(REFRESH_IDLE_CHECK_INTERVAL)
+
+    async def _refresh_one(self, url: str):
+        # Уступаем очередь интерактивным запросам
+        while not self._queue_idle():
+            self._paused += 1
+            await asyncio.sleep(REFRESH_IDLE_CHECK_INTERVAL)
+        await self.limiter.acquire_async()
+        if not self._queue_idle():
+            return
+
+        self._used_today += 1
+        try:
+            data = await parse_queue.run(parse_yandex, url, True)
+        except ParseQueueFull:
+            self._used_today -= 1
+            return
+        except Exception as e:
+            self._failed += 1
+            logger.warning(f"⚠️ Не удалось обновить {url}: {e}")
+            data = None
+
+        # Неудачную попытку тоже запоминаем, чтобы не повторять ее по кругу
+        self._refreshed[url] = time.time()
+        if data is None:
+            self._save_state()
+        elif data.get("title") == "Название не найдено":
+            self._empty += 1
+            self._save_state()
+        else:
+            self._pending.append((url, data))
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.db_manager.upsert_many, items)
+            self._updated += len(items)
+            logger.info(f"🔁 Фоновое обновление: обновлено {len(items)} записей")
+        except Exception as e:
+            self._failed += len(items)
+            logger.error(f"❌ Ошибка записи фонового обновления: {e}")
+            # Вернем эти записи в выборку при следующем проходе
+            for url, _ in items:
+                self._refreshed.pop(url, None)
+        self._save_state()
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику обновления"""
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'tracked': len(self._refreshed),
+            'used_today': self._used_today,
+            'daily_budget': self.daily_budget,
+            'updated': self._updated,
+            'empty': self._empty,
+            'failed': self._failed,
+            'paused': self._paused,
+        }
@@ -0,0 +1,296 @@
+# webdriver_pool.py
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from config import (
+    HEADLESS_MODE, SELENIUM_POOL_SIZE, SELENIUM_MAX_PAGES_PER_DRIVER,
+    SELENIUM_MAX_RSS_MB, SELENIUM_CHECKOUT_TIMEOUT,
+    SELENIUM_EAGER_LOAD, SELENIUM_BLOCK_RESOURCES
+)
+
+logger = logging.getLogger('ParserBot')
+
+# Ресурсы, которые не нужны для извлечения данных
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3",
+]
+
+
+class WebDriverPoolTimeout(Exception):
+    """Не удалось получить браузер из пула за отведенное время"""
+
+
+class CheckoutCancelled(Exception):
+    """Ожидание браузера отменено (результат уже не нужен)"""
+
+
+class PooledDriver:
+    """Браузер из пула и его счетчики"""
+
+    def __init__(self, driver: webdriver.Chrome):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+        self.broken = False
+
+
+def _build_options() -> Options:
+    """Настройки Chrome для парсинга"""
+    options = Options()
+    if HEADLESS_MODE:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+
+    # Маскировка под обычный браузер
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-plugins")
+
+    # Отключаем webdriver режим
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+
+    if SELENIUM_EAGER_LOAD:
+        # Управление возвращается после DOMContentLoaded, готовность карточки проверяет парсер
+        options.page_load_strategy = "eager"
+    if SELENIUM_BLOCK_RESOURCES:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return options
+
+
+def _process_tree_rss_mb(root_pid: int) -> Optional[float]:
+    """Суммарный RSS процесса и всех его потомков (Linux /proc), МБ"""
+    try:
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as f:
+                    stat = f.read()
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(stat.rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+
+        total_kb = 0
+        stack = [root_pid]
+        while stack:
+            pid = stack.pop()
+            stack.extend(children.get(pid, []))
+            try:
+                with open(f"/proc/{pid}/status", "r") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total_kb += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return total_kb / 1024
+    except OSError:
+        # Нет /proc (не Linux) - проверка по памяти отключается
+        return None
+
+
+class WebDriverPool:
+    """
+    Пул долгоживущих headless-браузеров.
+    Браузер выдается на одну страницу и возвращается в пул; после
+    max_pages страниц, превышения RSS или неудачной проверки здоровья
+    он закрывается, и вместо него при необходимости создается новый.
+    """
+
+    def __init__(self, size: int = SELENIUM_POOL_SIZE, max_pages: int = SELENIUM_MAX_PAGES_PER_DRIVER,
+                 max_rss_mb: Optional[float] = SELENIUM_MAX_RSS_MB,
+                 checkout_timeout: float = SELENIUM_CHECKOUT_TIMEOUT):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.checkout_timeout = checkout_timeout
+
+        self._idle: List[PooledDriver] = []
+        self._total = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        # Счетчики для /stats
+        self._created = 0
+        self._recycled = 0
+        self._failed_health = 0
+        self._checkouts = 0
+        self._wait_total = 0.0
+
+    def _create(self) -> PooledDriver:
+        driver = webdriver.Chrome(options=_build_options())
+        try:
+            # Скрываем navigator.webdriver на всех страницах этого браузера
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+                "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+            })
+        except Exception:
+            pass
+        if SELENIUM_BLOCK_RESOURCES:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+            except Exception:
+                pass
+        self._created += 1
+        logger.info(f"🌐 Запущен новый браузер для пула ({self._total}/{self.size})")
+        return PooledDriver(driver)
+
+    def _is_healthy(self, pooled: PooledDriver) -> bool:
+        """Проверяет, что браузер отвечает"""
+        if pooled.broken:
+            return False
+        try:
+            pooled.driver.window_handles
+            return True
+        except Exception:
+            self._failed_health += 1
+            return False
+
+    def _rss_mb(self, pooled: PooledDriver) -> Optional[float]:
+        try:
+            pid = pooled.driver.service.process.pid
+        except Exception:
+            return None
+        return _process_tree_rss_mb(pid)
+
+    def _needs_recycle(self, pooled: PooledDriver) -> bool:
+        if not self._is_healthy(pooled):
+            return True
+        if self.max_pages and pooled.pages >= self.max_pages:
+            return True
+        if self.max_rss_mb:
+            rss = self._rss_mb(pooled)
+            if rss is not None and rss > self.max_rss_mb:
+                logger.info(f"♻️ Браузер превысил лимит памяти: {rss:.0f} МБ")
+                return True
+        return False
+
+    def _quit(self, pooled: PooledDriver):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+
+    def checkout(self, cancel: Optional[threading.Event] = None) -> PooledDriver:
+        """Берет браузер из пула, при необходимости создает новый (cancel - прервать ожидание)"""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise WebDriverPoolTimeout("Пул браузеров закрыт")
+                if cancel is not None and cancel.is_set():
+                    raise CheckoutCancelled("Ожидание браузера отменено")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._total < self.size:
+                    # Резервируем место и создаем браузер вне блокировки
+                    self._total += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise WebDriverPoolTimeout(f"Все {self.size} браузеров заняты")
+                # С отменой просыпаемся периодически: событие не будит condition
+                self._condition.wait(remaining if cancel is None else min(remaining, 0.2))
+
+        if pooled is None:
+            try:
+                pooled = self._create()
+            except Exception:
+                with self._condition:
+                    self._total -= 1
+                    self._condition.notify()
+                raise
+        elif not self._is_healthy(pooled):
+            self._discard(pooled)
+            return self.checkout(cancel)
+
+        self._checkouts += 1
+        self._wait_total += time.monotonic() - started
+        return pooled
+
+    def release(self, pooled: PooledDriver):
+        """Возвращает браузер в пул или закрывает его"""
+        pooled.pages += 1
+        if self._closed or self._needs_recycle(pooled):
+            self._recycled += 1
+            self._discard(pooled)
+            return
+
+        try:
+            # Освобождаем память страницы, cookies сохраняем
+            pooled.driver.get("about:blank")
+        except Exception:
+            self._discard(pooled)
+            return
+
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    def _discard(self, pooled: PooledDriver):
+        self._quit(pooled)
+        with self._condition:
+            self._total -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def driver(self, cancel: Optional[threading.Event] = None):
+        """Контекстный менеджер: выдает webdriver и возвращает его в пул"""
+        pooled = self.checkout(cancel)
+        try:
+            yield pooled.driver
+        except Exception:
+            pooled.broken = True
+            raise
+        finally:
+            self.release(pooled)
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику пула"""
+        with self._condition:
+            idle = len(self._idle)
+            total = self._total
+        return {
+            'size': self.size,
+            'total': total,
+            'idle': idle,
+            'in_use': total - idle,
+            'created': self._created,
+            'recycled': self._recycled,
+            'failed_health': self._failed_health,
+            'checkouts': self._checkouts,
+            'avg_wait': round(self._wait_total / self._checkouts, 2) if self._checkouts else 0,
+        }
+
+    def close_all(self):
+        """Закрывает все свободные браузеры; занятые закроются при возврате"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._quit(pooled)
+
+
+# Общий пул браузеров для парсера
+driver_pool = WebDriverPool()
+atexit.register(driver_pool.close_all)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# write_journal.py
+"""
+Журнал записей: каждое изменение places дописывается строкой JSON
+в конец текущего сегмента (опционально gzip), fsync - пачками.
+Периодическое уплотнение собирает из журнала снимок Excel/CSV
+(EXCEL_PATH), а replay заново проигрывает журнал в PostgreSQL
+после недоступности базы.
+
+Запуск повторной записи в PostgreSQL:
+    python write_journal.py replay --since "2024-05-01 12:00"
+"""
+
+import argparse
+import atexit
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from config import (
+    EXCEL_PATH, JOURNAL_DIR, JOURNAL_COMPRESS, JOURNAL_FSYNC_INTERVAL,
+    JOURNAL_FSYNC_BATCH, JOURNAL_COMPACT_INTERVAL, JOURNAL_RETENTION_DAYS
+)
+from excel_sync import write_excel_atomic
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка уплотнения между процессами недоступна
+    fcntl = None
+
+logger = logging.getLogger('ParserBot')
+
+# journal-<дата>-<время>-<pid>-<номер>.jsonl[.gz]
+SEGMENT_PID_RE = re.compile(r"^journal-\d{8}-\d{6}-(\d+)-\d+\.")
+
+SNAPSHOT_COLUMNS = [
+    'Ссылка', 'Название', 'Рейтинг', 'Отзывы', 'Категории',
+    'Широта', 'Долгота', 'Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'
+]
+
+
+def _pid_alive(pid: int) -> bool:
+    """Жив ли процесс (вне POSIX проверить нельзя - считаем живым)"""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def apply_to_row(row: Dict, data: Dict) -> Dict:
+    """Накладывает результат парсинга на строку снимка (координаты и часы - только найденные)"""
+    row['Название'] = data.get('title', 'Название не найдено')
+    row['Рейтинг'] = data.get('rating', 'Рейтинг не найден')
+    row['Отзывы'] = data.get('reviews', 'Отзывы не найдены')
+    row['Категории'] = data.get('categories')
+
+    coordinates = data.get('coordinates')
+    if coordinates and len(coordinates) == 2:
+        row['Широта'], row['Долгота'] = coordinates
+
+    for day, time_range in (data.get('hours') or {}).items():
+        if day in SNAPSHOT_COLUMNS:
+            row[day] = time_range
+    return row
+
+
+class WriteJournal:
+    """
+    Журнал только на дописывание. Запись в память мгновенная; фоновый
+    поток сбрасывает накопленное на диск с fsync раз в fsync_interval
+    или по fsync_batch записей и раз в compact_interval уплотняет журнал.
+    """
+
+    def __init__(self, journal_dir: Path = JOURNAL_DIR, compress: bool = JOURNAL_COMPRESS,
+                 fsync_interval: float = JOURNAL_FSYNC_INTERVAL, fsync_batch: int = JOURNAL_FSYNC_BATCH,
+                 compact_interval: float = JOURNAL_COMPACT_INTERVAL, snapshot_path: Path = EXCEL_PATH):
+        self.dir = Path(journal_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.compress = compress
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = max(1, fsync_batch)
+        self.compact_interval = compact_interval
+        self.snapshot_path = Path(snapshot_path)
+        self.state_path = self.dir / "compaction.json"
+        self.lock_path = self.dir / "compaction.lock"
+
+        self._buffer: List[str] = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.RLock()
+        self._sequence = 0
+        self._segment = self._new_segment_path()
+        self._last_compact = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+
+        # Счетчики
+        self._appended = 0
+        self._fsyncs = 0
+        self._compactions = 0
+
+    # ===== Запись =====
+
+    def _new_segment_path(self) -> Path:
+        # Имена сортируются в порядке создания
+        self._sequence += 1
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        return self.dir / f"journal-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence:04d}{suffix}"
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="write-journal", daemon=True)
+            self._thread.start()
+
+    def _append(self, record: Dict):
+        record["ts"] = time.time()
+        line = json.dumps(record, ensure_ascii=False, default=list)
+        with self._condition:
+            self._buffer.append(line)
+            self._appended += 1
+            self._ensure_thread()
+            if len(self._buffer) >= self.fsync_batch:
+                self._condition.notify()
+
+    def append_places(self, items: List[Tuple[str, Dict]]):
+        """Записывает результаты парсинга (до записи в PostgreSQL)"""
+        for url, data in items:
+            clean = {key: value for key, value in data.items() if not key.startswith("_")}
+            self._append({"op": "upsert", "url": url, "data": clean})
+
+    def append_instagram(self, place_name: str, instagram_url: str):
+        """Записывает обновление Instagram"""
+        self._append({"op": "instagram", "name": place_name, "instagram": instagram_url})
+
+    def flush(self):
+        """Сбрасывает буфер на диск с fsync"""
+        with self._write_lock:
+            with self._condition:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            payload = ("\n".join(lines) + "\n").encode("utf-8")
+            if self.compress:
+                # Каждая пачка - отдельный gzip-member, файл читается gzip.open целиком
+                payload = gzip.compress(payload)
+            with open(self._segment, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._fsyncs += 1
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if len(self._buffer) < self.fsync_batch:
+                    self._condition.wait(self.fsync_interval)
+            try:
+                self.flush()
+                if time.monotonic() - self._last_compact >= self.compact_interval:
+                    self.compact()
+            except Exception as e:
+                logger.error(f"❌ Ошибка журнала записей: {e}")
+                time.sleep(self.fsync_interval)
+
+    # ===== Чтение =====
+
+    def segments(self) -> List[Path]:
+        return sorted(self.dir.glob("journal-*.jsonl*"))
+
+    def read(self, segments: List[Path] = None, since: float = 0.0) -> Iterator[Dict]:
+        """Записи журнала по порядку (обрезанная последняя строка пропускается)"""
+        for path in segments if segments is not None else self.segments():
+            opener = gzip.open if path.suffix == ".gz" else open
+            try:
+                with opener(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if record.get("ts", 0) >= since:
+                            yield record
+            except (OSError, EOFError) as e:
+                logger.warning(f"⚠️ Сегмент журнала {path.name} прочитан не полностью: {e}")
+
+    # ===== Уплотнение =====
+
+    def _load_state(self) -> Dict:
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"compacted": []}
+
+    def _save_state(self, state: Dict):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _is_writable_elsewhere(self, path: Path) -> bool:
+        """
+        Сегмент, в который еще может дописывать другой процесс: его pid жив
+        (бот меняет сегмент только при своем уплотнении). Свой текущий
+        сегмент исключается отдельно.
+        """
+        match = SEGMENT_PID_RE.match(path.name)
+        if not match:
+            return False
+        pid = int(match.group(1))
+        return pid != os.getpid() and _pid_alive(pid)
+
+    def _lock_compaction(self):
+        """Файловая блокировка уплотнения (бот и запуск из командной строки)"""
+        lock_file = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return lock_file
+
+    def compact(self) -> int:
+        """
+        Закрывает текущий сегмент и накладывает все еще не уплотненные
+        сегменты на снимок (EXCEL_PATH и CSV рядом). Сегменты, открытые
+        другими работающими процессами, пропускаются до их уплотнения.
+        Сегменты старше JOURNAL_RETENTION_DAYS удаляются. Возвращает
+        число примененных записей.
+        """
+        with self._write_lock:
+            self.flush()
+            self._segment = self._new_segment_path()
+        self._last_compact = time.monotonic()
+
+        with self._lock_compaction():
+            return self._compact_locked()
+
+    def _compact_locked(self) -> int:
+        state = self._load_state()
+        compacted = set(state["compacted"])
+        # Сегменты накладываются по порядку: на первом еще открытом останавливаемся,
+        # иначе его старые записи позже перекрыли бы более новые
+        pending = []
+        for path in self.segments():
+            if path.name in compacted:
+                continue
+            if path == self._segment or self._is_writable_elsewhere(path):
+                break
+            pending.append(path)
+        if not pending:
+            return 0
+
+        with metrics.span("journal_compact"):
+            if self.snapshot_path.exists():
+                df = pd.read_excel(self.snapshot_path, dtype=object)
+                rows = {row['Ссылка']: row for row in df.to_dict("records")}
+            else:
+                rows = {}
+
+            applied = 0
+            for record in self.read(pending):
+                if record.get("op") != "upsert":
+                    continue
+                row = rows.setdefault(record["url"], {column: None for column in SNAPSHOT_COLUMNS} | {'Ссылка': record["url"]})
+                apply_to_row(row, record["data"])
+                applied += 1
+
+            snapshot = pd.DataFrame(list(rows.values()), columns=SNAPSHOT_COLUMNS)
+            write_excel_atomic(snapshot, self.snapshot_path)
+            csv_path = self.snapshot_path.with_suffix(".csv")
+            tmp_csv = csv_path.with_name(f".{csv_path.name}.tmp")
+            snapshot.to_csv(tmp_csv, index=False, encoding="utf-8-sig")
+            os.replace(tmp_csv, csv_path)
+
+        state["compacted"] = sorted(compacted | {path.name for path in pending})
+        self._save_state(state)
+        self._drop_expired(state)
+        self._compactions += 1
+        logger.info(f"📊 Снимок обновлен из журнала: {applied} изменений, {len(snapshot)} записей")
+        return applied
+
+    def _drop_expired(self, state: Dict):
+        cutoff = time.time() - JOURNAL_RETENTION_DAYS * 24 * 60 * 60
+        compacted = set(state["compacted"])
+        for path in self.segments():
+            if path.name in compacted and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                compacted.discard(path.name)
+        state["compacted"] = sorted(compacted)
+        self._save_state(state)
+
+    # ===== Повтор в PostgreSQL =====
+
+    def replay(self, db_manager, since: float = 0.0, batch_size: int = 200) -> Dict:
+        """Проигрывает записи журнала начиная с since в PostgreSQL (идемпотентно)"""
+        self.flush()
+        places: Dict[str, Dict] = {}
+        instagram: Dict[str, str] = {}
+        for record in self.read(since=since):
+            if record.get("op") == "upsert":
+                places[record["url"]] = record["data"]
+            elif record.get("op") == "instagram":
+                instagram[record["name"]] = record["instagram"]
+
+        items = list(places.items())
+        inserted = updated = 0
+        for start in range(0, len(items), batch_size):
+            batch_inserted, batch_updated = db_manager.upsert_many(items[start:start + batch_size], journal=False)
+            inserted += batch_inserted
+            updated += batch_updated
+        instagram_updated = sum(
+            1 for name, url in instagram.items() if db_manager.update_instagram_for_place(name, url, journal=False)
+        )
+        stats = {'places': len(items), 'inserted': inserted, 'updated': updated, 'instagram': instagram_updated}
+        logger.info(f"♻️ Журнал проигран в PostgreSQL: {stats}")
+        return stats
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику журнала"""
+        segments = self.segments()
+        return {
+            'appended': self._appended,
+            'buffered': len(self._buffer),
+            'fsyncs': self._fsyncs,
+            'compactions': self._compactions,
+            'segments': len(segments),
+            'size_mb': round(sum(path.stat().st_size for path in segments) / 1024 / 1024, 2),
+        }
+
+
+# Общий журнал записей
+write_journal = WriteJournal()
+atexit.register(write_journal.flush)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал записей places")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="проиграть журнал в PostgreSQL")
+    replay_parser.add_argument("--since", help="с какого момента, YYYY-MM-DD[ HH:MM] (по умолчанию - весь журнал)")
+    subparsers.add_parser("compact", help="обновить снимок Excel/CSV из журнала")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"✅ Применено изменений: {write_journal.compact()}")
+        return
+
+    from database_manager import DatabaseManager
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else 0.0
+    stats = write_journal.replay(DatabaseManager(), since=since)
+    print(f"✅ Проиграно мест: {stats['places']} (добавлено {stats['inserted']}, обновлено {stats['updated']}), "
+          f"Instagram: {stats['instagram']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# yandex_extractor.py
+import re
+from typing import Optional
+from lxml import etree, html as lxml_html
+from opening_hours import parse_opening_hours_spec
+
+day_map = {
+    "Mo": "Пн",
+    "Tu": "Вт",
+    "We": "Ср",
+    "Th": "Чт",
+    "Fr": "Пт",
+    "Sa": "Сб",
+    "Su": "Вс"
+}
+
+# Признаки страницы с капчей в заголовке h1 (в неверной и в правильной кодировке)
+CAPTCHA_MARKERS = ("ð¾ð´ñð²ð", "ñð¾ð±ð¾ñ", "Подтвердите, что запросы", "не робот")
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Один XPath-запрос собирает все нужные элементы за один обход дерева
+# (результат в порядке документа, как у select_one)
+_FIELDS_XPATH = etree.XPath(
+    "//h1"
+    f" | //span[{_has_class('business-rating-badge-view__rating-text')}]"
+    " | //meta[@itemprop='reviewCount' or @itemprop='openingHours']"
+    " | //*[@data-coordinates]"
+    f" | //a[{_has_class('orgpage-categories-info-view__link')}]//span[{_has_class('button__text')}]"
+)
+
+# ll=<lon>,<lat>; запятая в ссылках обычно закодирована как %2C
+_LL_RE = re.compile(r'[?&]ll=([\-0-9\.]+)(?:,|%2C)([\-0-9\.]+)', re.IGNORECASE)
+
+
+def get_review_form(count):
+    """Возвращает правильную форму слова 'отзыв' в зависимости от числа"""
+    count = int(count)
+    if count % 10 == 1 and count % 100 != 11:
+        return f"{count} отзыв"
+    elif 2 <= count % 10 <= 4 and (count % 100 < 10 or count % 100 >= 20):
+        return f"{count} отзыва"
+    else:
+        return f"{count} отзывов"
+
+
+def is_captcha_title(title: Optional[str]) -> bool:
+    """Проверяет заголовок страницы на капчу"""
+    if not title:
+        return False
+    return any(marker in title for marker in CAPTCHA_MARKERS) or len(title) > 50
+
+
+def _text(el) -> str:
+    return " ".join(el.text_content().split())
+
+
+def _parse_tree(page_html):
+    try:
+        return lxml_html.document_fromstring(page_html)
+    except ValueError:
+        # Строка с объявлением кодировки - lxml принимает ее только в байтах
+        return lxml_html.document_fromstring(page_html.encode("utf-8"))
+
+
+def extract_place(page_html: str, page_url: str = None, title: str = None) -> dict:
+    """
+    Извлекает данные организации из HTML страницы Яндекс.Карт.
+    Используется и быстрым методом (requests), и Selenium.
+    title - уже известное название (например, видимый текст h1 из браузера).
+    """
+    tree = _parse_tree(page_html)
+
+    h1_text = None
+    rating = None
+    reviews = None
+    latitude = longitude = None
+    hours = {}
+    categories_parts = []
+
+    for el in _FIELDS_XPATH(tree):
+        tag = el.tag
+        if tag == "h1":
+            if h1_text is None:
+                h1_text = _text(el)
+        elif tag == "meta":
+            content = el.get("content")
+            if el.get("itemprop") == "reviewCount":
+                # ===== Отзывы =====
+                if reviews is None and content:
+                    try:
+                        reviews = get_review_form(content)
+                    except ValueError:
+                        pass
+            elif content:
+                # ===== Часы работы ("Mo 10:00-23:00", "Mo-Th 18:00-02:00", "Fr,Sa ...") =====
+                hours.update(parse_opening_hours_spec(content))
+        elif tag == "span":
+            classes = (el.get("class") or "").split()
+            if "business-rating-badge-view__rating-text" in classes:
+                # ===== Рейтинг =====
+                if rating is None:
+                    rating = _text(el) or None
+            elif "button__text" in classes:
+                # ===== Категории =====
+                part = _text(el)
+                if part:
+                    categories_parts.append(part)
+
+        # ===== Координаты (lon,lat → lat,lon float) =====
+        if latitude is None and el.get("data-coordinates"):
+            try:
+                lon_str, lat_str = el.get("data-coordinates").split(',', 1)
+                longitude = float(lon_str.strip())
+                latitude = float(lat_str.strip())
+            except Exception:
+                latitude = longitude = None
+
+    # fallback через URL
+    if (latitude is None or longitude is None) and page_url:
+        m = _LL_RE.search(page_url)
+        if m:
+            try:
+                longitude = float(m.group(1))
+                latitude = float(m.group(2))
+            except Exception:
+                pass
+
+    title = title or h1_text
+    categories = ", ".join(categories_parts) if categories_parts else None
+
+    return {
+        "title": title or "Название не найдено",
+        "rating": rating or "Рейтинг не найден",
+        "reviews": reviews or "Отзывы не найдены",
+        "coordinates": (latitude, longitude) if latitude is not None and longitude is not None else None,
+        "hours": hours,
+        "categories": categories
+    }
@@ -1,152 +1,153 @@
-import re
+import contextvars
+import threading
 import time
 import random
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from config import (
+    SELENIUM_WAIT_MODE, SELENIUM_READY_TIMEOUT, PARSE_WORKERS,
+    FAST_PATH_HEDGE, FAST_PATH_HEDGE_DEFAULT_DELAY, FAST_PATH_HEDGE_MIN_DELAY
+)
+from circuit_breaker import CircuitBreaker, OK, CAPTCHA, ERROR
+from webdriver_pool import driver_pool, CheckoutCancelled
+from http_fetcher import fetcher
+from place_cache import get_org_id, result_cache
+from page_archive import page_archive
+from metrics import metrics
+from singleflight import SingleFlight
+from yandex_extractor import extract_place, is_captcha_title
+from yandex_extractor import get_review_form, day_map  # совместимость со старыми импортами
 
-day_map = {
-    "Mo": "Пн",
-    "Tu": "Вт",
-    "We": "Ср",
-    "Th": "Чт",
-    "Fr": "Пт",
-    "Sa": "Сб",
-    "Su": "Вс"
-}
-
-def get_review_form(count):
-    """Возвращает правильную форму слова 'отзыв' в зависимости от числа"""
-    count = int(count)
-    if count % 10 == 1 and count % 100 != 11:
-        return f"{count} отзыв"
-    elif 2 <= count % 10 <= 4 and (count % 100 < 10 or count % 100 >= 20):
-        return f"{count} отзыва"
-    else:
-        return f"{count} отзывов"
+# Объединение параллельных парсингов одной организации
+inflight_parses = SingleFlight()
+
+# Предохранитель быстрого метода: при волне капч ссылки идут сразу в Selenium
+fast_path_breaker = CircuitBreaker()
+
+# Потоки для хеджированного режима (быстрый метод и Selenium параллельно)
+_hedge_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS * 2, thread_name_prefix="hedge")
+hedge_stats = {'started': 0, 'fast_won': 0, 'selenium_won': 0, 'selenium_cancelled': 0}
+_hedge_stats_lock = threading.Lock()
+
+
+def _count_hedge(key: str):
+    """Счетчики хеджирования меняются из потоков парсинга и хеджа - только под блокировкой"""
+    with _hedge_stats_lock:
+        hedge_stats[key] += 1
+
+
+def get_hedge_stats() -> dict:
+    """Согласованный снимок счетчиков хеджирования"""
+    with _hedge_stats_lock:
+        return dict(hedge_stats)
+
+# Один вызов JS за опрос вместо трех find_elements
+READY_STATE_SCRIPT = """
+return [
+    !!document.querySelector('h1'),
+    !!document.querySelector('span.business-rating-badge-view__rating-text'),
+    !!document.querySelector('[data-coordinates]'),
+    document.readyState
+];
+"""
+
+def parse_yandex_html(page_html: str, page_url: str = None) -> dict:
+    """Извлекает данные из HTML быстрого метода; None - если это капча"""
+    with metrics.span("extract"):
+        result = extract_place(page_html, page_url)
+    
+    # Проверяем на капчу (более точная детекция)
+    if is_captcha_title(result["title"]):
+        return None  # Капча обнаружена
+    return result
 
 def parse_yandex_requests(url: str) -> dict:
     """Парсинг через requests (быстро, но может не сработать)"""
+    started = time.monotonic()
     try:
-        import requests
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2.1 Safari/605.1.15',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Проверка на капчу
-        title_tag = soup.find('h1')
-        title = title_tag.text.strip() if title_tag else ""
-        
-        # Проверяем на капчу (более точная детекция)
-        if "ð¾ð´ñð²ð" in title or "ñð¾ð±ð¾ñ" in title or len(title) > 50:
-            return None  # Капча обнаружена
-        
-        # Если всё ок - парсим ВСЕ данные как в Selenium версии
-        
-        # ===== Рейтинг =====
-        rating = None
-        rating_tag = soup.select_one("span.business-rating-badge-view__rating-text")
-        if rating_tag:
-            rating = rating_tag.get_text(strip=True)
-        
-        # ===== Отзывы =====
-        reviews = None
-        reviews_tag = soup.select_one("meta[itemprop='reviewCount']")
-        if reviews_tag:
-            reviews = reviews_tag.get("content")
-            if reviews:
-                reviews = get_review_form(reviews)
-        
-        # ===== Координаты =====
-        latitude = longitude = None
-        el = soup.select_one('[data-coordinates]')
-        if el and el.get('data-coordinates'):
-            try:
-                lon_str, lat_str = el['data-coordinates'].split(',', 1)
-                longitude = float(lon_str.strip())
-                latitude = float(lat_str.strip())
-            except Exception:
-                pass
-        
-        # fallback через regex на странице
-        if latitude is None or longitude is None:
-            m = re.search(r'data-coordinates="([\-0-9\.]+),([\-0-9\.]+)"', response.text)
-            if m:
-                try:
-                    longitude = float(m.group(1))
-                    latitude = float(m.group(2))
-                except Exception:
-                    pass
-        
-        # ===== Часы работы =====
-        hours = {}
-        hours_tags = soup.select("meta[itemprop='openingHours']")
-        for tag in hours_tags:
-            content = tag.get("content")
-            if not content:
-                continue
-            match = re.match(r"([A-Za-z]{2}) (.+)", content)
-            if match:
-                eng_day, time_range = match.groups()
-                ru_day = day_map.get(eng_day, eng_day)
-                hours[ru_day] = time_range
-        
-        # ===== Категории =====
-        categories = None
-        categories_tags = soup.select("a.orgpage-categories-info-view__link span.button__text")
-        if categories_tags:
-            parts = [tag.get_text(strip=True) for tag in categories_tags if tag.get_text(strip=True)]
-            if parts:
-                categories = ", ".join(parts)
-        
-        result = {
-            "title": title or "Название не найдено",
-            "rating": rating or "Рейтинг не найден",
-            "reviews": reviews or "Отзывы не найдены",
-            "coordinates": (latitude, longitude) if latitude is not None and longitude is not None else None,
-            "hours": hours,
-            "categories": categories
-        }
-        return result
-        
+        with metrics.span("fetch"):
+            response = fetcher.get(url)
+        result = parse_yandex_html(response.text, response.url)
     except Exception:
+        fast_path_breaker.record(ERROR)
         return None
-
-def parse_yandex_selenium(url: str) -> dict:
-    # --- Настройка Selenium ---
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
     
-    # Маскировка под обычный браузер
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-    options.add_argument(f"--remote-debugging-port={random.randint(9000, 9999)}")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-plugins")
+    # Капчи не архивируем
+    if result is not None and page_archive:
+        page_archive.store(url, response.text, response.url, method="requests")
     
-    # Отключаем webdriver режим
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    options.add_experimental_option('useAutomationExtension', False)
+    fast_path_breaker.record(OK if result is not None else CAPTCHA, time.monotonic() - started)
+    return result
 
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+def parse_yandex_selenium(url: str, cancel: threading.Event = None) -> dict:
+    """
+    Парсинг через браузер из пула прогретых драйверов.
+    cancel - отмена (хеджирование: быстрый метод уже ответил); тогда
+    ожидание и извлечение прерываются, браузер возвращается в пул, результат - None.
+    """
+    started = time.monotonic()
+    try:
+        with driver_pool.driver(cancel) as driver:
+            checkout_time = time.monotonic() - started
+            result = _parse_with_driver(driver, url, cancel)
+    except CheckoutCancelled:
+        result = None
+    if result is None:
+        _count_hedge('selenium_cancelled')
+        print("⏹ Selenium отменен: результат уже получен быстрым методом")
+        return None
+    result["_timings"]["checkout"] = round(checkout_time, 3)
+    print(f"⏱ Selenium: {_format_timings(result['_timings'])}")
+    for phase, seconds in result["_timings"].items():
+        metrics.observe(f"selenium_{phase}", seconds)
+    return result
+
+def _format_timings(timings: dict) -> str:
+    return ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in timings.items())
+
+def _wait_until_ready(driver, cancel: threading.Event = None) -> bool:
+    """
+    Ждет отрисовки карточки: h1, [data-coordinates] и бейджа рейтинга
+    либо h1 и полной загрузки документа (у мест без координат или рейтинга).
+    Не дольше SELENIUM_READY_TIMEOUT.
+    """
+    def card_ready(d):
+        if cancel is not None and cancel.is_set():
+            return True
+        h1, rating, coordinates, state = d.execute_script(READY_STATE_SCRIPT)
+        return h1 and ((coordinates and rating) or state == "complete")
+    
+    try:
+        WebDriverWait(driver, SELENIUM_READY_TIMEOUT, poll_frequency=0.2).until(card_ready)
+        return True
+    except TimeoutException:
+        print(f"⚠️ Карточка не отрисовалась за {SELENIUM_READY_TIMEOUT} с, извлекаю что есть")
+        return False
+
+def _parse_with_driver(driver, url: str, cancel: threading.Event = None) -> dict:
+    """Загружает страницу и извлекает данные; None - отменено через cancel"""
+    cancel = cancel or threading.Event()
+    timings = {}
     
-    # Имитируем человеческое поведение
+    started = time.monotonic()
     driver.get(url)
-    time.sleep(random.uniform(3, 6))  # случайная задержка 3-6 сек
+    timings["navigate"] = time.monotonic() - started
+    if cancel.is_set():
+        return None
+    
+    started = time.monotonic()
+    if SELENIUM_WAIT_MODE == "ready":
+        _wait_until_ready(driver, cancel)
+    else:
+        # Имитируем человеческое поведение (случайная задержка 3-6 сек, прерывается отменой)
+        cancel.wait(random.uniform(3, 6))
+    timings["wait"] = time.monotonic() - started
+    if cancel.is_set():
+        return None
 
+    started = time.monotonic()
     # ===== Название =====
     title = None
     try:
@@ -154,100 +155,103 @@ def parse_yandex_selenium(url: str) -> dict:
     except:
         pass
 
-    # Получаем страницу для BeautifulSoup
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-
-    # ===== Рейтинг =====
-    rating = None
-    rating_tag = soup.select_one("span.business-rating-badge-view__rating-text")
-    if rating_tag:
-        rating = rating_tag.get_text(strip=True)
-
-    # ===== Отзывы =====
-    reviews = None
-    reviews_tag = soup.select_one("meta[itemprop='reviewCount']")
-    if reviews_tag:
-        reviews = reviews_tag.get("content")
-        if reviews:
-            reviews = get_review_form(reviews)
-
-    # ===== Координаты (lon,lat → lat,lon float) =====
-    latitude = longitude = None
-    el = soup.select_one('[data-coordinates]')
-    if el and el.get('data-coordinates'):
-        try:
-            lon_str, lat_str = el['data-coordinates'].split(',', 1)
-            longitude = float(lon_str.strip())
-            latitude = float(lat_str.strip())
-        except Exception:
-            pass
-
-    # fallback через regex на странице
-    if latitude is None or longitude is None:
-        m = re.search(r'data-coordinates="([\-0-9\.]+),([\-0-9\.]+)"', driver.page_source)
-        if m:
-            try:
-                longitude = float(m.group(1))
-                latitude = float(m.group(2))
-            except Exception:
-                pass
-
-    # fallback через URL
-    if latitude is None or longitude is None:
-        m = re.search(r'[?&]ll=([\-0-9\.]+),([\-0-9\.]+)', driver.current_url)
-        if m:
-            try:
-                longitude = float(m.group(1))
-                latitude = float(m.group(2))
-            except Exception:
-                pass
-
-    # ===== Часы работы =====
-    hours = {}
-    hours_tags = soup.select("meta[itemprop='openingHours']")
-    for tag in hours_tags:
-        content = tag.get("content")
-        if not content:
-            continue
-        match = re.match(r"([A-Za-z]{2}) (.+)", content)
-        if match:
-            eng_day, time_range = match.groups()
-            ru_day = day_map.get(eng_day, eng_day)
-            hours[ru_day] = time_range
-
-    # ===== Категории =====
-    categories = None
-    categories_tags = soup.select("a.orgpage-categories-info-view__link span.button__text")
-    if categories_tags:
-        parts = [tag.get_text(strip=True) for tag in categories_tags if tag.get_text(strip=True)]
-        if parts:
-            categories = ", ".join(parts)
-
-    driver.quit()
-    
-    result = {
-        "title": title or "Название не найдено",
-        "rating": rating or "Рейтинг не найден",
-        "reviews": reviews or "Отзывы не найдены",
-        "coordinates": (latitude, longitude) if latitude is not None and longitude is not None else None,
-        "hours": hours,
-        "categories": categories
-    }
+    page_html = driver.page_source
+    result = extract_place(page_html, driver.current_url, title=title)
+    if page_archive and not is_captcha_title(result["title"]):
+        page_archive.store(url, page_html, driver.current_url, method="selenium")
+    timings["extract"] = time.monotonic() - started
     
+    result["_timings"] = {phase: round(seconds, 3) for phase, seconds in timings.items()}
     return result
 
-def parse_yandex(url: str) -> dict:
+def parse_yandex(url: str, force_refresh: bool = False) -> dict:
     """
     Умный парсер с fallback методами
+    0. Отдает свежий результат из кэша по ID организации (если не force_refresh)
     1. Сначала пробует быстрый requests
     2. Если не работает - использует Selenium
     """
-    print("🔄 Пробую быстрый метод (requests)...")
-    result = parse_yandex_requests(url)
+    with metrics.span("parse"):
+        return _parse_yandex(url, force_refresh)
+
+def _parse_yandex(url: str, force_refresh: bool) -> dict:
+    org_id = get_org_id(url)
+    if org_id and not force_refresh:
+        cached = result_cache.get(org_id)
+        if cached is not None:
+            print(f"⚡ Результат из кэша для организации {org_id}")
+            cached["_cached"] = True
+            return cached
     
-    if result is not None:
-        print("✅ Requests сработал!")
+    if org_id:
+        # Одновременные запросы одной организации ждут общий результат
+        result, shared = inflight_parses.do(org_id, _fetch_and_cache, url, org_id)
+        if shared:
+            print(f"🔗 Результат получен из параллельного запроса организации {org_id}")
+            result["_shared"] = True
         return result
+    return _fetch_and_cache(url, None)
+
+def _fetch_and_cache(url: str, org_id: str = None) -> dict:
+    if not fast_path_breaker.allow():
+        print("🚧 Быстрый метод временно отключен, сразу Selenium...")
+        result = parse_yandex_selenium(url)
+    elif FAST_PATH_HEDGE:
+        result = _fetch_hedged(url)
+    else:
+        print("🔄 Пробую быстрый метод (requests)...")
+        result = parse_yandex_requests(url)
+        
+        if result is not None:
+            print("✅ Requests сработал!")
+        else:
+            print("🔄 Requests не сработал, пробую Selenium...")
+            result = parse_yandex_selenium(url)
+    
+    # Кэшируем только результаты с найденным названием
+    if org_id and result.get("title") != "Название не найдено":
+        result_cache.set(org_id, result, url=url)
+    return result
+
+def _fetch_hedged(url: str) -> dict:
+    """
+    Быстрый метод с подстраховкой: если он не ответил за свой p95,
+    параллельно запускается Selenium, и берется первый годный результат.
+    """
+    p95 = fast_path_breaker.latency_percentile(95)
+    delay = max(FAST_PATH_HEDGE_MIN_DELAY, p95 if p95 is not None else FAST_PATH_HEDGE_DEFAULT_DELAY)
+    
+    print("🔄 Пробую быстрый метод (requests)...")
+    fast = _hedge_executor.submit(contextvars.copy_context().run, parse_yandex_requests, url)
+    wait([fast], timeout=delay)
+    if fast.done():
+        result = fast.result()
+        if result is not None:
+            print("✅ Requests сработал!")
+            return result
+        print("🔄 Requests не сработал, пробую Selenium...")
+        return parse_yandex_selenium(url)
+    
+    print(f"⏩ Requests дольше {delay:.1f} с, параллельно запускаю Selenium...")
+    _count_hedge('started')
+    cancel = threading.Event()
+    slow = _hedge_executor.submit(contextvars.copy_context().run, parse_yandex_selenium, url, cancel)
+    done, _ = wait([fast, slow], return_when=FIRST_COMPLETED)
+    if fast in done and fast.result() is not None:
+        _count_hedge('fast_won')
+        print("✅ Requests успел первым")
+        # Браузер больше не нужен: прерываем ожидание карточки и возвращаем его в пул
+        cancel.set()
+        return fast.result()
     
-    print("🔄 Requests не сработал, пробую Selenium...")
-    return parse_yandex_selenium(url)
+    # Быстрый метод не дал результата или еще не ответил - ждем браузер
+    try:
+        result = slow.result()
+    except Exception:
+        # Браузер упал: остается надежда на быстрый метод
+        if fast.result() is not None:
+            _count_hedge('fast_won')
+            return fast.result()
+        raise
+    _count_hedge('selenium_won')
+    return result